@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+import sqlite3
+import threading
+
+# Caches values computed from image files (hashes, metadata etc) in the monitored folder
+# Each value is stored under a kind and the image's fromRootDir, and is only valid while the
+# file's size and mtime match the ones it was computed from
+class AttributeCache:
+  def __init__(self, rootDir):
+    self._rootDir = rootDir
+    self._lock = threading.Lock()
+
+    # values are computed on worker threads
+    self._db = sqlite3.connect(str(self.databaseFile()), check_same_thread=False)
+    self._db.execute('PRAGMA journal_mode=WAL')
+    self._db.execute('PRAGMA synchronous=NORMAL')
+    self._db.execute('''
+      CREATE TABLE IF NOT EXISTS attributes (
+        kind TEXT NOT NULL,
+        path TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        mtime INTEGER NOT NULL,
+        value,
+        PRIMARY KEY (kind, path)
+      ) WITHOUT ROWID''')
+    self._db.commit()
+
+  # Get the valid cached values of a kind for many files at once
+  # stamps is fromRootDir -> (size, mtime), returns fromRootDir -> value for the ones that are cached
+  def getMany(self, kind, stamps):
+    values = {}
+    with self._lock:
+      rows = self._db.execute('SELECT path, size, mtime, value FROM attributes WHERE kind = ?', (kind,))
+      for path, size, mtime, value in rows:
+        stamp = stamps.get(path)
+        if stamp != None and stamp[0] == size and stamp[1] == mtime:
+          values[path] = value
+    return values
+
+  # Get every cached value of a kind regardless of whether it's still valid, as fromRootDir -> value
+  def getAll(self, kind):
+    with self._lock:
+      return dict(self._db.execute('SELECT path, value FROM attributes WHERE kind = ?', (kind,)))
+
+  # Get every cached value of a kind regardless of whether it's still valid, as fromRootDir -> (size, mtime, value)
+  def getAllRows(self, kind):
+    with self._lock:
+      return { path: (size, mtime, value) for path, size, mtime, value in
+               self._db.execute('SELECT path, size, mtime, value FROM attributes WHERE kind = ?', (kind,)) }
+
+  # Get the cached values of a kind for some files whether they're still valid or not,
+  # as fromRootDir -> (size, mtime, value)
+  def getRows(self, kind, paths):
+    rows = {}
+    paths = list(paths)
+    with self._lock:
+      # sqlite limits the number of parameters
+      for i in range(0, len(paths), 500):
+        chunk = paths[i:i+500]
+        query = f'SELECT path, size, mtime, value FROM attributes WHERE kind = ? AND path IN ({",".join("?" * len(chunk))})'
+        for path, size, mtime, value in self._db.execute(query, [ kind ] + chunk):
+          rows[path] = (size, mtime, value)
+    return rows
+
+  # Store values of a kind, rows are (fromRootDir, size, mtime, value)
+  def putMany(self, kind, rows):
+    with self._lock:
+      with self._db:
+        self._db.executemany('INSERT OR REPLACE INTO attributes (kind, path, size, mtime, value) VALUES (?, ?, ?, ?, ?)',
+                             [ (kind, path, size, mtime, value) for path, size, mtime, value in rows ])
+
+  # Forget the values for some files, of one kind or every kind
+  def remove(self, paths, kind=None):
+    with self._lock:
+      with self._db:
+        # a kind is needed to use the primary key, so go through them one at a time
+        paths = list(paths)
+        for kind in ([ kind ] if kind != None else self._kinds()):
+          self._db.executemany('DELETE FROM attributes WHERE kind = ? AND path = ?', [ (kind, path) for path in paths ])
+
+  # Move every value for files that have been moved or renamed, pairs are (old fromRootDir, new fromRootDir)
+  # Values already stored for the new paths are replaced
+  def rename(self, pairs):
+    with self._lock:
+      with self._db:
+        for kind in self._kinds():
+          self._db.executemany('UPDATE OR REPLACE attributes SET path = ? WHERE kind = ? AND path = ?',
+                               [ (new, kind, old) for old, new in pairs ])
+
+  # Close the cache
+  def close(self):
+    with self._lock:
+      self._db.close()
+
+  # The kinds of value stored, call with the lock held
+  def _kinds(self):
+    return [ kind for kind, in self._db.execute('SELECT DISTINCT kind FROM attributes') ]
+
+  # The database path
+  def databaseFile(self):
+    return self._rootDir / 'config.attributes.db'
\ No newline at end of file
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Computes values from image files in bulk (hashes, feature vectors, metadata etc), keeping them in the
+# attribute cache of each image's root so a file is only read again once its size or mtime change
+
+# Get a kind of value for every image, from its root's attribute cache where it's still valid and
+# computed otherwise
+# getCache(image) returns the AttributeCache for an image's root
+# compute(paths) returns the value to store for each path, or None if it couldn't be read, and is given
+# chunkSize files at a time. It runs in worker processes, so it has to be a module level function, or
+# on threads with processes=False for work that's io bound
+# isValid(value) can reject cached values, e.g. from an older version of compute
+# Returns (image -> stored value for the images that have one, number of files computed)
+def getValues(images, getCache, kind, compute, processes=True, chunkSize=256, workers=16, isValid=None):
+  images = list(images)
+
+  # stat everything first, it's io bound so threads are fine
+  with ThreadPoolExecutor(max_workers=workers) as pool:
+    stamps = list(pool.map(statFile, [ _path(image) for image in images ]))
+
+  # look up cached values per root
+  byCache = {}
+  for image, stamp in zip(images, stamps):
+    if stamp != None:
+      byCache.setdefault(getCache(image), []).append((image, stamp))
+
+  values = {}
+  misses = []
+  for cache, entries in byCache.items():
+    cached = cache.getMany(kind, { image.fromRootDir: stamp for image, stamp in entries })
+    for image, stamp in entries:
+      value = cached.get(image.fromRootDir)
+      if value != None and (isValid == None or isValid(value)):
+        values[image] = value
+      else:
+        misses.append((cache, image, stamp))
+  print(f'{len(values)} cached {kind} values, computing {len(misses)}')
+  if len(misses) == 0:
+    return values, 0
+
+  # compute the rest, in processes that are spawned rather than forked as forking a process with Qt and
+  # icon threads running can copy locks they hold mid-decode into the children
+  chunks = [ misses[i:i+chunkSize] for i in range(0, len(misses), chunkSize) ]
+  if processes:
+    # imported here as it's slow to import and the command line only needs statFile
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    pool = ProcessPoolExecutor(mp_context=multiprocessing.get_context('spawn'))
+  else:
+    pool = ThreadPoolExecutor(max_workers=workers)
+  with pool:
+    results = pool.map(compute, [ [ _path(image) for _, image, _ in chunk ] for chunk in chunks ])
+    for chunk, chunkValues in zip(chunks, results):
+      rows = {}
+      for (cache, image, stamp), value in zip(chunk, chunkValues):
+        if value != None:
+          values[image] = value
+          rows.setdefault(cache, []).append((image.fromRootDir, stamp[0], stamp[1], value))
+      for cache, cacheRows in rows.items():
+        cache.putMany(kind, cacheRows)
+  return values, len(misses)
+
+# An image's path, joined rather than using absolutePath as that resolves the path and keeps it on the
+# image, which for every image in the library costs a realpath each and a lot of memory
+def _path(image):
+  return os.path.join(str(image.rootDir), image.fromRootDir)
+
+# Stat a file, returns (size, mtime) or None if it can't be
+def statFile(path):
+  try:
+    st = os.stat(str(path))
+  except OSError:
+    return None
+  return (st.st_size, st.st_mtime_ns)
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+# The bit positions set in each byte value, for turning bitsets back into keys
+_bytePositions = [ tuple(bit for bit in range(8) if byte & (1 << bit)) for byte in range(256) ]
+
+# Posting lists of image keys for each category
+# Each category has a set of keys for iterating and counting, and a dense bitset indexed by
+# image ordinal for combining categories in queries. 'Uncategorised' is kept like any other
+# category, 'All' is every key that's been added.
+class CategoryIndex:
+  def __init__(self):
+    # category -> set of keys, and category -> bitset
+    self._keys = {}
+    self._bits = {}
+
+    # image key <-> ordinal, ordinals of removed keys are reused
+    self._ordinals = {}
+    self._ordinalKeys = []
+    self._freeOrdinals = []
+    self._allBits = bytearray()
+
+  # Add an image key, giving it an ordinal
+  def addKey(self, key):
+    if key in self._ordinals:
+      return
+    if len(self._freeOrdinals) > 0:
+      ordinal = self._freeOrdinals.pop()
+      self._ordinalKeys[ordinal] = key
+    else:
+      ordinal = len(self._ordinalKeys)
+      self._ordinalKeys.append(key)
+    self._ordinals[key] = ordinal
+    self._setBit(self._allBits, ordinal)
+
+  # Remove an image key, it should already have been removed from its categories
+  def removeKey(self, key):
+    ordinal = self._ordinals.pop(key, None)
+    if ordinal != None:
+      self._clearBit(self._allBits, ordinal)
+      self._ordinalKeys[ordinal] = None
+      self._freeOrdinals.append(ordinal)
+
+  # Add a key to a category
+  def add(self, category, key):
+    self._keys.setdefault(category, set()).add(key)
+    self._setBit(self._bits.setdefault(category, bytearray()), self._ordinals[key])
+
+  # Remove a key from a category
+  def discard(self, category, key):
+    keys = self._keys.get(category)
+    if keys != None and key in keys:
+      keys.discard(key)
+      self._clearBit(self._bits[category], self._ordinals[key])
+
+  # Get the set of keys in a category, don't modify it
+  def keys(self, category):
+    return self._keys.get(category, set())
+
+  # Remove a category, returns the keys that were in it
+  def pop(self, category):
+    self._bits.pop(category, None)
+    return self._keys.pop(category, set())
+
+  # Rename a category, returns the keys in it
+  def rename(self, category, newName):
+    keys = self._keys.pop(category, set())
+    self._keys[newName] = keys
+    self._bits[newName] = self._bits.pop(category, bytearray())
+    return keys
+
+  # Get a category's bitset as an int, 'All' is every key
+  def bits(self, category):
+    if category == 'All':
+      return int.from_bytes(self._allBits, 'little')
+    return int.from_bytes(self._bits.get(category, b''), 'little')
+
+  # Get the keys for the bits set in a bitset
+  def keysFromBits(self, bits):
+    keys = []
+    ordinalKeys = self._ordinalKeys
+    for byteIndex, byte in enumerate(bits.to_bytes((bits.bit_length() + 7) // 8, 'little')):
+      if byte:
+        base = byteIndex * 8
+        for bit in _bytePositions[byte]:
+          keys.append(ordinalKeys[base + bit])
+    return keys
+
+  # Set a bit, growing the bitset if needed
+  def _setBit(self, bits, ordinal):
+    byteIndex = ordinal >> 3
+    if byteIndex >= len(bits):
+      bits.extend(bytes(max(byteIndex + 1 - len(bits), len(bits) // 2)))
+    bits[byteIndex] |= 1 << (ordinal & 7)
+
+  # Clear a bit
+  def _clearBit(self, bits, ordinal):
+    byteIndex = ordinal >> 3
+    if byteIndex < len(bits):
+      bits[byteIndex] &= ~(1 << (ordinal & 7)) & 0xff
\ No newline at end of file
@@ -24,14 +24,22 @@ class CategoryList(QListWidget):
     self._currentCategory = None
     self._categories = {}
     
+    # Categories that are computed rather than stored (e.g. Duplicates), they can't be renamed
+    self._virtualCategories = set()
+    
     self.setMaximumWidth(200)
     self.currentItemChanged.connect(self._categoryChanged)
     self.installEventFilter(self)
   
   # Add a category to the ui
-  def addCategory(self, name):
+  def addCategory(self, name, virtual=False):
     if name not in self._categories:
       item = QListWidgetItem(name)
+      if virtual:
+        font = item.font()
+        font.setItalic(True)
+        item.setFont(font)
+        self._virtualCategories.add(name)
       self._categories[name] = item
       self.insertItem(self.count(), item)
 
@@ -39,11 +47,23 @@ class CategoryList(QListWidget):
   def removeCategory(self, name):
     if name in self._categories:
       item = self._categories.pop(name)
-      self.removeItemWidget(item)
+      self._virtualCategories.discard(name)
+      self.takeItem(self.row(item))
+
+  # Remove any categories from the ui that aren't in names
+  def retainCategories(self, names):
+    names = set(names)
+    for name in [ name for name in self._categories if name not in names ]:
+      self.removeCategory(name)
+
+  # Whether a category is virtual
+  def isVirtualCategory(self, name):
+    return name in self._virtualCategories
 
   # Remove all categories from the ui
   def clearCategories(self):
     self._categories = {}
+    self._virtualCategories = set()
     self.clear()
 
   # Event filter for QListWidget context menus
@@ -58,6 +78,9 @@ class CategoryList(QListWidget):
   
   # Called when a different category is selected in the list
   def _categoryChanged(self, curr, prev):
+    # the current item can be removed leaving nothing selected
+    if curr == None:
+      return
     self._currentCategory = curr.text()
     self.onCategoryChanged.emit(self._currentCategory)
 
@@ -78,6 +101,8 @@ class CategoryList(QListWidget):
     if category == 'All' or category == 'Uncategorised':
       deleteCategoryAction.setDisabled(True)
       renameCategoryAction.setDisabled(True)
+    elif category in self._virtualCategories:
+      renameCategoryAction.setDisabled(True)
     
     menu.show()
     menu.exec_(pos)
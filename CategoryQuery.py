@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+import re
+
+# Boolean queries over categories, e.g. 'cats and (dogs or "big birds") and not blurry'
+# Operators are and/&, or/| and not/!/-, with not binding tightest then and then or.
+# Names with spaces or that clash with an operator need quoting, otherwise bare words
+# next to each other are joined with spaces into one name.
+# Queries are parsed to trees of ('category', name), ('not', a), ('and', a, b) and ('or', a, b)
+
+_tokenPattern = re.compile(r'\s*(?:(\()|(\))|(&|\||!|-)|"([^"]*)"|([^\s()&|!"]+))')
+
+_operators = { 'and': 'and', '&': 'and', 'or': 'or', '|': 'or', 'not': 'not', '!': 'not', '-': 'not' }
+
+# Parse a query, raises ValueError if it's malformed
+def parse(text):
+  tokens = _tokenize(text)
+  if len(tokens) == 0:
+    raise ValueError('empty query')
+  query, pos = _parseOr(tokens, 0)
+  if pos != len(tokens):
+    raise ValueError(f'unexpected {tokens[pos][1]!r} in query')
+  return query
+
+# Evaluate a parsed query to a bitset, getBits(category) returns a category's bitset as an int
+# and must accept 'All' for every image
+def evaluate(query, getBits):
+  op = query[0]
+  if op == 'category':
+    return getBits(query[1])
+  elif op == 'not':
+    return getBits('All') & ~evaluate(query[1], getBits)
+  elif op == 'and':
+    return evaluate(query[1], getBits) & evaluate(query[2], getBits)
+  elif op == 'or':
+    return evaluate(query[1], getBits) | evaluate(query[2], getBits)
+  raise ValueError(f'unknown query operator {op}')
+
+# Split a query into ('(' | ')' | 'op' | 'name', value) tokens
+def _tokenize(text):
+  tokens = []
+  joinable = False # whether the last token is a bare word the next bare word joins onto
+  pos = 0
+  text = text.strip()
+  while pos < len(text):
+    match = _tokenPattern.match(text, pos)
+    if match == None:
+      raise ValueError(f'unexpected {text[pos]!r} in query')
+    pos = match.end()
+    open, close, symbol, quoted, word = match.groups()
+    if word != None and word.lower() in _operators:
+      symbol, word = word.lower(), None
+    if open != None:
+      tokens.append(('(', open))
+    elif close != None:
+      tokens.append((')', close))
+    elif symbol != None:
+      tokens.append(('op', _operators[symbol]))
+    elif quoted != None:
+      tokens.append(('name', quoted))
+    elif joinable:
+      tokens[-1] = ('name', tokens[-1][1] + ' ' + word)
+    else:
+      tokens.append(('name', word))
+    joinable = word != None
+  return tokens
+
+def _parseOr(tokens, pos):
+  left, pos = _parseAnd(tokens, pos)
+  while pos < len(tokens) and tokens[pos] == ('op', 'or'):
+    right, pos = _parseAnd(tokens, pos + 1)
+    left = ('or', left, right)
+  return left, pos
+
+def _parseAnd(tokens, pos):
+  left, pos = _parseNot(tokens, pos)
+  while pos < len(tokens) and tokens[pos] == ('op', 'and'):
+    right, pos = _parseNot(tokens, pos + 1)
+    left = ('and', left, right)
+  return left, pos
+
+def _parseNot(tokens, pos):
+  if pos < len(tokens) and tokens[pos] == ('op', 'not'):
+    operand, pos = _parseNot(tokens, pos + 1)
+    return ('not', operand), pos
+  return _parseAtom(tokens, pos)
+
+def _parseAtom(tokens, pos):
+  if pos >= len(tokens):
+    raise ValueError('query ends unexpectedly')
+  token = tokens[pos]
+  if token[0] == '(':
+    query, pos = _parseOr(tokens, pos + 1)
+    if pos >= len(tokens) or tokens[pos][0] != ')':
+      raise ValueError('missing ) in query')
+    return query, pos + 1
+  elif token[0] == 'name':
+    return ('category', token[1]), pos + 1
+  raise ValueError(f'unexpected {token[1]!r} in query')
\ No newline at end of file
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import argparse
+import contextlib
+
+from MonitorGroup import MonitorGroup
+
+# Headless command line interface for scripting, never imports PyQt5
+# Results go to stdout and the index's own logging goes to stderr so output can be piped
+#
+#   main.py scan -r DIR [--full]
+#   main.py categories -r DIR
+#   main.py list -r DIR CATEGORY [--query] [--absolute]
+#   find DIR -name '*.jpg' | main.py tag -r DIR CATEGORY
+#   main.py untag -r DIR CATEGORY < paths.txt
+#   main.py export -r DIR [--format json|csv]
+
+# Run a command, returns the exit code
+def main(argv):
+  args = _parser().parse_args(argv)
+  out = sys.stdout
+  # opening an sqlite store creates it and migrates config.json into it, queries only read what's there
+  storage = args.storage
+  if not args.writes and storage == 'sqlite':
+    storage = None
+  with contextlib.redirect_stdout(sys.stderr):
+    group = MonitorGroup(args.root, storage, include=args.include, exclude=args.exclude, matchContents=args.match_contents)
+    try:
+      return args.command(group, args, out)
+    finally:
+      # queries never write to the folders
+      if args.writes:
+        group.save()
+      group.close()
+
+# Scan the roots for new and removed images
+def _scan(group, args, out):
+  added, removed = group.refresh(args.full)
+  print(f'{len(added)} added, {len(removed)} removed', file=out)
+  return 0
+
+# List categories with their image counts
+def _categories(group, args, out):
+  for category in group.getCategories():
+    print(f'{group.getCategoryCount(category)}\t{category}', file=out)
+  return 0
+
+# List the images in a category or matching a query
+def _list(group, args, out):
+  if args.query:
+    try:
+      images = group.query(args.category)
+    except ValueError:
+      type, value, traceback = sys.exc_info()
+      print(f'invalid query: {value}', file=sys.stderr)
+      return 2
+  else:
+    images = group.getCategory(args.category)
+  for image in images:
+    print(str(image.absolutePath) if args.absolute else image.fromRootDir, file=out)
+  return 0
+
+# Add the images listed on stdin to a category
+def _tag(group, args, out):
+  return _changeCategory(group, args, out, group.addImagesCategory)
+
+# Remove the images listed on stdin from a category
+def _untag(group, args, out):
+  return _changeCategory(group, args, out, group.removeImagesCategory)
+
+# Export the index
+def _export(group, args, out):
+  images = group.getCategory('All')
+  if args.format == 'csv':
+    import csv
+    writer = csv.writer(out)
+    writer.writerow([ 'root', 'path', 'categories' ])
+    for image in images:
+      writer.writerow([ str(image.rootDir), image.fromRootDir, ';'.join(image.categories) ])
+  else:
+    roots = {}
+    for image in images:
+      roots.setdefault(str(image.rootDir), {})[image.fromRootDir] = image.categories
+    json.dump(roots, out, indent=1)
+    out.write('\n')
+  return 0
+
+# Apply a category change to the images listed on stdin, scanning first if any aren't indexed yet
+def _changeCategory(group, args, out, change):
+  paths = [ line.strip() for line in sys.stdin if line.strip() != '' ]
+  images, missing = _findImages(group, paths)
+  if len(missing) > 0:
+    group.refresh()
+    found, missing = _findImages(group, missing)
+    images.extend(found)
+
+  change(images, args.category)
+  for path in missing:
+    print(f'not an indexed image: {path}', file=sys.stderr)
+  print(f'{len(images)} images changed', file=out)
+  return 1 if len(missing) > 0 else 0
+
+# Look up images by path (absolute, or relative to the working directory)
+# Returns (images, paths that aren't indexed)
+def _findImages(group, paths):
+  roots = [ (os.path.abspath(str(monitor.getRootDir())), monitor) for monitor in group.getMonitors() ]
+  images = []
+  missing = []
+  for path in paths:
+    absolutePath = os.path.abspath(path)
+    image = None
+    for rootPath, monitor in roots:
+      if absolutePath.startswith(rootPath + os.sep):
+        image = monitor.getImage(absolutePath[len(rootPath)+1:])
+        if image != None:
+          break
+    if image != None:
+      images.append(image)
+    else:
+      missing.append(path)
+  return images, missing
+
+# Build the argument parser
+def _parser():
+  parser = argparse.ArgumentParser(prog='main.py', description='Categorise images without the gui')
+  common = argparse.ArgumentParser(add_help=False)
+  common.add_argument('-r', '--root', action='append', required=True, help='folder to use, can be given more than once')
+  common.add_argument('--storage', choices=[ 'json', 'sqlite' ], help='index storage, defaults to sqlite only if it\'s already in use')
+  common.add_argument('--include', action='append', default=[], help='glob pattern for files to index, can be given more than once')
+  common.add_argument('--exclude', action='append', default=[], help='glob pattern for files to skip, can be given more than once')
+  common.add_argument('--match-contents', action='store_true', help='also detect moved files by hashing their contents')
+  commands = parser.add_subparsers(title='commands', required=True)
+
+  scan = commands.add_parser('scan', parents=[ common ], help='scan for new and removed images')
+  scan.add_argument('--full', action='store_true', help='list every folder even if it looks unchanged')
+  scan.set_defaults(command=_scan, writes=True)
+
+  categories = commands.add_parser('categories', parents=[ common ], help='list categories and their image counts')
+  categories.set_defaults(command=_categories, writes=False)
+
+  listImages = commands.add_parser('list', parents=[ common ], help='list the images in a category')
+  listImages.add_argument('category', help='category name, or a query with --query')
+  listImages.add_argument('--query', action='store_true', help='treat the category as a query, e.g. "a and not b"')
+  listImages.add_argument('--absolute', action='store_true', help='print absolute paths')
+  listImages.set_defaults(command=_list, writes=False)
+
+  tag = commands.add_parser('tag', parents=[ common ], help='add the images listed on stdin to a category')
+  tag.add_argument('category')
+  tag.set_defaults(command=_tag, writes=True)
+
+  untag = commands.add_parser('untag', parents=[ common ], help='remove the images listed on stdin from a category')
+  untag.add_argument('category')
+  untag.set_defaults(command=_untag, writes=True)
+
+  export = commands.add_parser('export', parents=[ common ], help='export the index')
+  export.add_argument('--format', choices=[ 'json', 'csv' ], default='json')
+  export.set_defaults(command=_export, writes=False)
+
+  return parser
\ No newline at end of file
@@ -1,177 +1,928 @@
 # -*- coding: utf-8 -*-
 
 import os
+import sys
+import time
+import hashlib
 import threading
-import json
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from AttributeCache import AttributeCache
+import CachedValues
+from CategoryIndex import CategoryIndex
+from NameIndex import NameIndex
+import FileTypes
+import CategoryQuery
+from JsonStore import JsonStore
+from SqliteStore import SqliteStore
+import Stats
+
+# Category names are interned, images only store the ids of their categories
+# The table is shared by every root and roots load and scan on their own threads, so new names are
+# added under _categoryLock (the name is added before its id so a reader never sees an id without one)
+_categoryIds = {}
+_categoryNames = []
+_categoryLock = threading.Lock()
+
+# Get the id for a category name, adding it if it's new
+def _categoryId(name):
+  id = _categoryIds.get(name)
+  if id == None:
+    with _categoryLock:
+      id = _categoryIds.get(name)
+      if id == None:
+        id = len(_categoryNames)
+        _categoryNames.append(name)
+        _categoryIds[name] = id
+  return id
+
+# Work out a file's identity for move detection, returns (size, mtime, 'device:inode', content hash or None)
+# or None if the file can't be read
+def _identifyFile(path, hashContents):
+  try:
+    st = os.stat(path)
+    content = None
+    if hashContents:
+      digest = hashlib.blake2b(digest_size=16)
+      with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024*1024), b''):
+          digest.update(chunk)
+      content = digest.hexdigest()
+  except OSError:
+    return None
+  return (st.st_size, st.st_mtime_ns, f'{st.st_dev}:{st.st_ino}', content)
 
 # An image
+# There can be a lot of these so they're kept small: there's no __dict__, the path from the root
+# is a plain string, categories are a tuple of interned ids and the absolute path is only
+# resolved the first time it's needed
 class Image:
-  def __init__(self, name, fromRootDir, rootDir):
-    self.name = name
+  __slots__ = ( 'fromRootDir', 'rootDir', '_absolutePath', '_categoryIds' )
+
+  def __init__(self, fromRootDir, rootDir):
     self.fromRootDir = fromRootDir
     self.rootDir = rootDir
-    self.absolutePath = (Path(rootDir) / self.fromRootDir).resolve()
-    self.categories = []
+    self._absolutePath = None
+    self._categoryIds = ()
+
+  # The file name
+  @property
+  def name(self):
+    return os.path.basename(self.fromRootDir)
+
+  # The resolved absolute path
+  @property
+  def absolutePath(self):
+    if self._absolutePath == None:
+      self._absolutePath = (Path(self.rootDir) / self.fromRootDir).resolve()
+    return self._absolutePath
+
+  # The names of the image's categories, as a new list
+  @property
+  def categories(self):
+    return [ _categoryNames[id] for id in self._categoryIds ]
+
+  @categories.setter
+  def categories(self, names):
+    self._categoryIds = tuple(_categoryId(name) for name in dict.fromkeys(names))
+
+  # Whether the image is in a category
+  def hasCategory(self, name):
+    id = _categoryIds.get(name)
+    return id != None and id in self._categoryIds
+
+  # Whether the image is in any category
+  def isCategorised(self):
+    return len(self._categoryIds) > 0
+
+  # Add the image to a category
+  def addCategory(self, name):
+    id = _categoryId(name)
+    if id not in self._categoryIds:
+      self._categoryIds += (id,)
+
+  # Remove the image from a category
+  def removeCategory(self, name):
+    id = _categoryIds.get(name)
+    self._categoryIds = tuple(i for i in self._categoryIds if i != id)
+
+  # Rename one of the image's categories
+  def renameCategory(self, name, newName):
+    id = _categoryIds.get(name)
+    newId = _categoryId(newName)
+    self._categoryIds = tuple(newId if i == id else i for i in self._categoryIds)
 
 # The directory watcher
 class DirectoryMonitor:
   # Initialise the monitor
-  def __init__(self, dir):
+  # storage is 'json', 'sqlite' or None to use sqlite if there's already a database and json otherwise
+  # Pass load=False to load the index later with load(), e.g. on another thread
+  # include and exclude are lists of glob patterns for files to index or skip, see FileTypes.matchesRules
+  # matchContents also matches moved files by a hash of their contents, which means reading every file once
+  def __init__(self, dir, storage=None, load=True, include=None, exclude=None, matchContents=False):
     self._rootDir = Path(dir)
     self._categoryList = [ "Uncategorised", "All" ]
+    
+    # Images, fromRootDir string -> image
     self._files = {}
     
+    # Category index, category name -> fromRootDir keys as sets and bitsets for queries
+    # 'All' is the keys of _files and 'Uncategorised' is maintained alongside the named categories
+    self._categoryIndex = CategoryIndex()
+    
+    # Substring search over image paths, built the first time it's needed and kept up to date after that
+    # _nameIndexChanges queues the keys added (True) and removed (False) while it's being built
+    self._nameIndex = None
+    self._nameIndexChanges = None
+    self._nameIndexLock = threading.Lock()
+    
+    # Directory listing cache for incremental refreshes
+    # fromRootDir directory -> (mtime, file names, subdirectory names)
+    self._dirCache = {}
+    
+    # Only files that pass the rules and whose headers show they're images are indexed
+    # Sniffed types are kept in the attribute cache, indexed files as 'type' and skipped ones as 'rejected',
+    # and the rejected files are kept in memory for scans as fromRootDir -> (size, mtime) when sniffed
+    # A rejected file is sniffed again once its size or mtime changes, e.g. it was still being written
+    # Files that have been categorised are never skipped because of their type, they were tagged by hand
+    # _untyped is indexed files that haven't been sniffed, e.g. from before files were sniffed
+    # _sniffed is the sniffed (fromRootDir, size, mtime, type)s waiting to be stored
+    self._include = include or []
+    self._exclude = exclude or []
+    self._rejected = None
+    self._untyped = set()
+    self._typesChecked = False
+    self._sniffed = []
+    
+    # Moves and renames are detected by matching the images a scan removes with the ones it adds
+    # by device, inode, size and mtime, or by size and content hash with matchContents
+    # These are kept in the attribute cache as 'identity' and 'content'
+    # _identified is the identities of files sniffed or changed, fromRootDir -> (size, mtime, identity, content)
+    # _recentlyRemoved is images removed by recent scans with their identities, a move between directories
+    # can be seen by two scans, fromRootDir -> (time removed, image, identity row, content row)
+    # _moveListeners are called with the (old image, new image)s found by each scan
+    self._matchContents = matchContents
+    self._identified = {}
+    self._identitiesChecked = False
+    self._recentlyRemoved = {}
+    self._moveTime = 10
+    self._moveListeners = []
+    
+    # Time between batches of images reported while loading and scanning
+    self._batchTime = 0.25
+    
     # Saving
     self._saveTimer = None
     self._saveTime = 5 # The time after any changes to save
+    self._saveLock = threading.Lock() # One save at a time, so an older snapshot can't replace a newer one
+    
+    # Storage, and the changes made since the last save for stores that only write what's changed
+    if storage == None:
+      storage = 'sqlite' if (self._rootDir / 'config.db').is_file() else 'json'
+    self._store = SqliteStore(self._rootDir) if storage == 'sqlite' else JsonStore(self._rootDir)
+    self._changesLock = threading.Lock()
+    self._changes = []
+    
+    # Values computed from image files, only opened once something needs it
+    self._attributes = None
+    self._attributesLock = threading.Lock()
+    
+    # Scans can run on other threads, _lock guards the index and is only held while applying
+    # what's been found, _scanLock stops more than one scan running at once
+    self._lock = threading.RLock()
+    self._scanLock = threading.Lock()
+    
+    # Loading state, the index isn't saved until it's been loaded completely
+    self._loadLock = threading.Lock()
+    self._loaded = False
     
     # Load initial state
-    self._load()
+    if load:
+      self.load()
+  
+  # Load the index from disk if it hasn't been already
+  # Images are indexed in batches so the index can be used while it loads, onLoaded(images) is called
+  # after each batch
+  def load(self, onLoaded=None):
+    with self._loadLock:
+      if self._loaded:
+        return
+      with Stats.timed('load'):
+        self._load(onLoaded)
+      self._loaded = True
 
   # Save out to disk
   def save(self):
     self._clearSaveTimer()
-    configPath = self._configFile().resolve()
-    
-    # save backup as -2 first
-    if os.path.isfile(str(configPath)):
-      backupPath = self._configFile('-2').resolve()
-      print(f'saving old config file as {str(backupPath)}')
-      os.replace(str(configPath), str(backupPath))
-    
-    print(f'saving config file to {str(configPath)}')
-    cfg = { 'images': {} }
-    for _, image in self._files.items():
-      cfg['images'][str(image.fromRootDir)] = image.categories
-    with open(str(configPath), 'w') as f:
-      json.dump(cfg, f)
-  
-  # Refresh the folder, adding any new images
-  def refresh(self):
-    for subdir, dirs, files in os.walk(str(self._rootDir.resolve())):
-        for file in files:
-          # construct path
-          path = Path(subdir) / Path(file)
-          
-          # trim rootDir
-          fromRootDir = path.relative_to(self._rootDir)
-          
-          # get name
-          name = path.parts[-1]
-          
-          # skip config files
-          if path.suffix == '.json':
-            continue
-          
-          # create image object
-          image = Image(name, fromRootDir, self._rootDir)
-          
-          # add image
-          if fromRootDir not in self._files:
-            self._files[fromRootDir] = image
     
+    # saving a partly loaded index would lose the rest of it, wait for any load to finish
+    with self._loadLock:
+      if not self._loaded:
+        print(f'index for {str(self._rootDir)} not loaded, not saving')
+        return
+    
+    with self._saveLock:
+      # changes are journaled with the index locked, so a store that wants a new snapshot gets the images
+      # at the same point it starts its new journal and nothing falls between the two
+      with self._lock:
+        with self._changesLock:
+          changes = self._changes
+          self._changes = []
+        images = list(self._files.values()) if self._store.beginSave() else None
+      
+      try:
+        with Stats.timed('save'):
+          self._store.save(images, changes)
+      except Exception:
+        # keep the changes so the next save tries again
+        with self._changesLock:
+          self._changes = changes + self._changes
+        type, value, traceback = sys.exc_info()
+        print(f'got exception saving: {value}')
+  
+  # Close the store, call save first to keep any unsaved changes
+  def close(self):
+    self._clearSaveTimer()
+    self._store.close()
+    with self._attributesLock:
+      if self._attributes != None:
+        self._attributes.close()
+        self._attributes = None
+  
+  # Refresh the folder, adding any new images and removing any that no longer exist on disk
+  # Directories whose mtime hasn't changed since the last refresh aren't listed again,
+  # pass full=True to forget the cached listings and list everything
+  # Returns the delta as (added, removed) lists of images
+  # onBatch(added, removed, dirsScanned) is called with the delta found so far every so often while scanning
+  # Safe to call from a thread other than the one using the index
+  def refresh(self, full=False, onBatch=None):
+    added = []
+    removed = []
+    
+    # don't prune the whole index just because the folder isn't mounted right now
+    if not self._rootDir.is_dir():
+      print(f'root directory {str(self._rootDir)} not found, skipping refresh')
+      return added, removed
+    
+    # everything would look new otherwise
+    self.load()
+    
+    with self._scanLock, Stats.timed('refresh'):
+      # with no cached listings we see every file, so anything else in the index is gone
+      fullScan = full or len(self._dirCache) == 0
+      if fullScan:
+        with self._lock:
+          self._dirCache = {}
+      self._loadFileTypes(full)
+      if not fullScan:
+        self._recheckRejected()
+      found = set() if fullScan else None
+      
+      visited = set()
+      stack = [ Path() ]
+      reported = (0, 0)
+      reportTime = time.monotonic()
+      while len(stack) > 0:
+        relDir = stack.pop()
+        visited.add(relDir)
+        subdirs = self._scanDir(relDir, added, removed, found)
+        stack.extend(relDir / subdir for subdir in subdirs)
+        
+        if onBatch != None and time.monotonic() - reportTime >= self._batchTime:
+          onBatch(added[reported[0]:], removed[reported[1]:], len(visited))
+          reported = (len(added), len(removed))
+          reportTime = time.monotonic()
+      
+      with self._lock:
+        # directories that have disappeared since the last refresh
+        for relDir in [ d for d in self._dirCache if d not in visited ]:
+          if relDir in self._dirCache:
+            self._forgetDir(relDir, removed)
+        
+        # images in the index that weren't found anywhere
+        if fullScan:
+          for key in [ k for k in self._files if k not in found ]:
+            self._removeScanned(key, removed)
+      
+      self._saveFileTypes(fullScan)
+      moves = self._detectMoves(added, removed)
+      self._saveIdentities()
+      self._checkIdentities()
+    
+    self._notifyMoves(moves)
+    Stats.count('imagesAdded', len(added))
+    Stats.count('imagesRemoved', len(removed))
+    if len(added) > 0 or len(removed) > 0:
+      print(f'refresh found {len(added)} new and {len(removed)} removed images')
+    return added, removed
+  
+  # Rescan only the given directories (fromRootDir paths), e.g. ones a watcher has reported as changed
+  # They are always listed again and their files stat'd, new subdirectories are scanned in full
+  # Returns the delta as (added, removed, changed) lists of images
+  def refreshDirs(self, relDirs):
+    added = []
+    removed = []
+    changed = []
+    
+    with self._scanLock, Stats.timed('refreshDirs'):
+      self._loadFileTypes(False)
+      stack = list(relDirs)
+      while len(stack) > 0:
+        relDir = stack.pop()
+        if not (self._rootDir / relDir).is_dir():
+          with self._lock:
+            self._forgetDir(relDir, removed)
+          continue
+        subdirs = self._scanDir(relDir, added, removed, None, True, changed)
+        stack.extend(relDir / subdir for subdir in subdirs if relDir / subdir not in self._dirCache)
+      self._saveFileTypes(False)
+      moves = self._detectMoves(added, removed)
+      for image in changed:
+        self._identify(image.fromRootDir)
+      self._saveIdentities()
+    
+    self._notifyMoves(moves)
+    Stats.count('imagesAdded', len(added))
+    Stats.count('imagesRemoved', len(removed))
+    return added, removed, changed
+  
+  # Call listener(moves) on the scanning thread with the (old image, new image)s each scan finds have been
+  # moved or renamed, after their categories have been moved to the new images
+  def addMoveListener(self, listener):
+    self._moveListeners.append(listener)
+  
+  # Get the directories (fromRootDir paths) seen by the last refresh
+  def getDirectories(self):
+    with self._lock:
+      return list(self._dirCache.keys())
+    
+  # Get the root directory being monitored
+  def getRootDir(self):
+    return self._rootDir
+
+  # Get the cache of values computed from this root's image files
+  def getAttributeCache(self):
+    with self._attributesLock:
+      if self._attributes == None:
+        self._attributes = AttributeCache(self._rootDir)
+      return self._attributes
+
+  # Get an image by its fromRootDir path, or None if it isn't in the index
+  def getImage(self, fromRootDir):
+    with self._lock:
+      return self._files.get(os.path.normpath(fromRootDir))
+
+  # Whether an image is still in the index
+  def hasImage(self, image):
+    with self._lock:
+      return self._files.get(image.fromRootDir) is image
+
   # Get a list of categories
   def getCategories(self):
-    return self._categoryList
+    with self._lock:
+      return list(self._categoryList)
 
   # Get all the images in a category
   def getCategory(self, category):
-    images = set()
-    
-    for file, image in self._files.items():
-      if category == "All":
-        images.add(image)
-      elif category == "Uncategorised":
-        if len(image.categories) == 0:
-          images.add(image)
-      else:
-        if category in image.categories:
-          images.add(image)
-    
-    return images
+    with self._lock:
+      if category == 'All':
+        return list(self._files.values())
+      return [ self._files[key] for key in self._categoryIndex.keys(category) ]
+
+  # Get the number of images in a category
+  def getCategoryCount(self, category):
+    with self._lock:
+      if category == 'All':
+        return len(self._files)
+      return len(self._categoryIndex.keys(category))
+
+  # Get the images matching a query parsed by CategoryQuery.parse
+  def query(self, query):
+    with self._lock:
+      bits = CategoryQuery.evaluate(query, self._categoryIndex.bits)
+      return [ self._files[key] for key in self._categoryIndex.keysFromBits(bits) ]
+  
+  # Get the images whose path from the root contains text, ignoring case
+  # Builds the search index first if it hasn't been
+  def search(self, text):
+    self.buildNameIndex()
+    with self._lock, Stats.timed('search'):
+      return [ self._files[key] for key in self._nameIndex.search(text) ]
+  
+  # Build the search index if it hasn't been, e.g. on a background thread before it's needed
+  # The index can still be used and changed while it's built
+  def buildNameIndex(self):
+    with self._nameIndexLock:
+      with self._lock:
+        if self._nameIndex != None:
+          return
+        self._nameIndexChanges = []
+        keys = list(self._files)
+      
+      nameIndex = NameIndex()
+      with Stats.timed('buildNameIndex'):
+        for key in keys:
+          nameIndex.add(key)
+      
+      with self._lock:
+        for added, key in self._nameIndexChanges:
+          if added:
+            nameIndex.add(key)
+          else:
+            nameIndex.remove(key)
+        self._nameIndexChanges = None
+        self._nameIndex = nameIndex
   
   # Remove an image from the index
   def removeImage(self, image):
-    if image.fromRootDir in self._files:
-      del self._files[image.fromRootDir]
+    self.removeImages([ image ])
+
+  # Remove images from the index
+  def removeImages(self, images):
+    with self._lock:
+      keys = []
+      for image in images:
+        if image.fromRootDir in self._files:
+          self._unindexImage(self._files.pop(image.fromRootDir))
+          keys.append(image.fromRootDir)
+    
+      if len(keys) > 0:
+        self._recordChanges([ ('removeImage', key) for key in keys ], keys)
+        self._setSaveTimer(self._saveTime)
 
   # Add an image to a category, and add the category to the list if it doesn't exist
   def addImageCategory(self, image, category):
-    if category == 'All' or category == 'Uncategorised':
-      return
+    self.addImagesCategory([ image ], category)
 
-    print(f'adding image {image.name} to category {category}')
-  
-    if image.fromRootDir in self._files:  
-      if category not in self._categoryList:
-        self._categoryList.append(category)
-        self._sortCategoryList()
-        
-      if category not in self._files[image.fromRootDir].categories:
-        self._files[image.fromRootDir].categories.append(category)
+  # Add images to a category, and add the category to the list if it doesn't exist
+  def addImagesCategory(self, images, category):
+    with self._lock:
+      if category == 'All' or category == 'Uncategorised':
+        return
 
-    self._setSaveTimer(self._saveTime)
+      print(f'adding {len(images)} images to category {category}')
+    
+      keys = []
+      for image in images:
+        indexed = self._files.get(image.fromRootDir)
+        if indexed != None and not indexed.hasCategory(category):
+          if not indexed.isCategorised():
+            self._categoryIndex.discard('Uncategorised', indexed.fromRootDir)
+          indexed.addCategory(category)
+          self._categoryIndex.add(category, indexed.fromRootDir)
+          keys.append(indexed.fromRootDir)
+    
+      # only list the category once an image from this root is actually in it
+      if len(keys) > 0:
+        if category not in self._categoryList:
+          self._categoryList.append(category)
+          self._sortCategoryList()
+        self._recordChanges([ ('addImageCategory', key, category) for key in keys ], keys)
+        self._setSaveTimer(self._saveTime)
 
   # Remove an image from a category
   def removeImageCategory(self, image, category):
-    if category == 'All' or category == 'Uncategorised':
-      return
-      
-    if image.fromRootDir in self._files:
-      if category in self._files[image.fromRootDir].categories:
-        self._files[image.fromRootDir].categories.remove(category)
+    self.removeImagesCategory([ image ], category)
+
+  # Remove images from a category
+  def removeImagesCategory(self, images, category):
+    with self._lock:
+      if category == 'All' or category == 'Uncategorised':
+        return
+    
+      keys = []
+      for image in images:
+        indexed = self._files.get(image.fromRootDir)
+        if indexed != None and indexed.hasCategory(category):
+          indexed.removeCategory(category)
+          self._categoryIndex.discard(category, indexed.fromRootDir)
+          if not indexed.isCategorised():
+            self._categoryIndex.add('Uncategorised', indexed.fromRootDir)
+          keys.append(indexed.fromRootDir)
+    
+      if len(keys) > 0:
+        self._recordChanges([ ('removeImageCategory', key, category) for key in keys ], keys)
+        self._setSaveTimer(self._saveTime)
 
   # Remove a category and make sure all images no longer list it
   def removeCategory(self, category):
-    if category == 'All' or category == 'Uncategorised':
-      return
+    with self._lock:
+      if category == 'All' or category == 'Uncategorised':
+        return
       
-    if category in self._categoryList:
-      for pathFromBase, image in self._files.items():
-        if category in image.categories:
-          image.categories.remove(category)
-      self._categoryList.remove(category)
-      self._sortCategoryList()
+      if category in self._categoryList:
+        keys = self._categoryIndex.pop(category)
+        for key in keys:
+          image = self._files[key]
+          image.removeCategory(category)
+          if not image.isCategorised():
+            self._categoryIndex.add('Uncategorised', key)
+        self._categoryList.remove(category)
+        self._sortCategoryList()
+        self._recordChange(('removeCategory', category), keys)
+        self._setSaveTimer(self._saveTime)
 
   # Rename a category and make sure all images no longer list it
   def renameCategory(self, category, newName):
-    if category == 'All' or category == 'Uncategorised':
-      return
-    if newName == 'All' or newName == 'Uncategorised':
-      return
+    with self._lock:
+      if category == 'All' or category == 'Uncategorised':
+        return
+      if newName == 'All' or newName == 'Uncategorised':
+        return
     
-    if newName in self._categoryList:
-      return
+      if newName in self._categoryList:
+        return
       
-    if category in self._categoryList:
-      for pathFromBase, image in self._files.items():
-        if category in image.categories:
-          image.categories.remove(category)
-          image.categories.append(newName)
+      if category in self._categoryList:
+        keys = self._categoryIndex.rename(category, newName)
+        for key in keys:
+          image = self._files[key]
+          image.renameCategory(category, newName)
       
-      self._categoryList.remove(category)
-      self._categoryList.append(newName)
-      self._sortCategoryList()
+        self._categoryList.remove(category)
+        self._categoryList.append(newName)
+        self._sortCategoryList()
+        self._recordChange(('renameCategory', category, newName), keys)
+        self._setSaveTimer(self._saveTime)
     
   # Load in from disk
-  def _load(self):
-    configPath = self._configFile().resolve()
-    if os.path.isfile(str(configPath)):
-      with open(str(configPath), 'r') as f:
-        cfg = json.load(f)
-        for path, categories in cfg['images'].items():
-          fromRootDir = Path(path)
-          name = fromRootDir.parts[-1]
-          image = Image(name, fromRootDir, self._rootDir)
-          image.categories = categories
+  def _load(self, onLoaded):
+    batch = []
+    batchTime = time.monotonic()
+    for path, categories in self._store.load():
+      # normalise the same way scanned paths are
+      image = Image(os.path.normpath(path), self._rootDir)
+      image.categories = categories
+      batch.append(image)
+      if len(batch) >= 1000 and time.monotonic() - batchTime >= self._batchTime:
+        self._loadBatch(batch, onLoaded)
+        batch = []
+        batchTime = time.monotonic()
+    self._loadBatch(batch, onLoaded)
+  
+  # Add a batch of loaded images to the index
+  def _loadBatch(self, images, onLoaded):
+    with self._lock:
+      for image in images:
+        self._files[image.fromRootDir] = image
+        self._indexImage(image)
+        for category in image.categories:
+          if category not in self._categoryList:
+            self._categoryList.append(category)
+            self._sortCategoryList()
+    if onLoaded != None and len(images) > 0:
+      onLoaded(images)
+
+  # Scan a single directory for refresh, returns its subdirectories
+  # Only lists the directory if its mtime has changed (or force is set), and only creates images for new files
+  # If changed is a list, files are stat'd and any whose size or mtime differ from the last stat'd scan are added to it
+  def _scanDir(self, relDir, added, removed, found, force=False, changed=None):
+    absDir = self._rootDir / relDir
+    try:
+      mtime = os.stat(str(absDir)).st_mtime_ns
+    except OSError:
+      return []
+    
+    prefix = self._keyPrefix(relDir)
+    cached = self._dirCache.get(relDir)
+    if cached != None and cached[0] == mtime and not force:
+      _, files, subdirs = cached
+      if found != None:
+        found.update(prefix + name for name in files)
+      return subdirs
+    
+    # file name -> (size, mtime) if stat'd, otherwise None
+    files = {}
+    subdirs = []
+    try:
+      with os.scandir(str(absDir)) as it:
+        for entry in it:
+          try:
+            if entry.is_dir():
+              # don't follow directory symlinks, same as os.walk
+              if not entry.is_symlink():
+                subdirs.append(entry.name)
+            elif not self._isIndexFile(entry.name):
+              stamp = None
+              if changed != None:
+                st = entry.stat()
+                stamp = (st.st_size, st.st_mtime_ns)
+              files[entry.name] = stamp
+          except OSError:
+            continue
+    except OSError:
+      type, value, traceback = sys.exc_info()
+      print(f'got exception scanning directory {str(absDir)}: {value}')
+      return []
+    files = self._filterImages(prefix, absDir, files)
+    
+    # apply what we found to the index
+    with self._lock:
+      previous = cached[1] if cached != None else {}
+      newKeys = []
+      for name, stamp in files.items():
+        if name in previous:
+          if changed != None and previous[name] != None and previous[name] != stamp:
+            fromRootDir = prefix + name
+            if fromRootDir in self._files:
+              changed.append(self._files[fromRootDir])
+          continue
+        fromRootDir = prefix + name
+        if found != None:
+          found.add(fromRootDir)
+        if fromRootDir not in self._files:
+          image = Image(fromRootDir, self._rootDir)
           self._files[fromRootDir] = image
-          for category in image.categories:
-            if category not in self._categoryList:
-              self._categoryList.append(category)
-              self._sortCategoryList()
-    else:
-      print(f'no config file found at {str(configPath)}, starting from scratch')
+          self._indexImage(image)
+          newKeys.append(fromRootDir)
+          added.append(image)
+      if len(newKeys) > 0:
+        self._recordChanges([ ('addImage', key) for key in newKeys ], newKeys)
+      for name in previous:
+        if name not in files:
+          self._removeScanned(prefix + name, removed)
+        elif found != None:
+          found.add(prefix + name)
+      
+      # subdirectories that have gone since this directory was last listed
+      if cached != None:
+        for subdir in cached[2]:
+          if subdir not in subdirs:
+            self._forgetDir(relDir / subdir, removed)
+      
+      self._dirCache[relDir] = (mtime, files, subdirs)
+    return subdirs
+
+  # Keep only the files that pass the include and exclude rules and are images,
+  # sniffing files that haven't been seen before
+  def _filterImages(self, prefix, absDir, files):
+    images = {}
+    rules = len(self._include) > 0 or len(self._exclude) > 0
+    for name, stamp in files.items():
+      fromRootDir = prefix + name
+      if rules and not FileTypes.matchesRules(fromRootDir, self._include, self._exclude):
+        continue
+      # categorised by hand, so never dropped because of what its header looks like
+      indexed = self._files.get(fromRootDir)
+      if indexed != None and indexed.isCategorised():
+        if fromRootDir in self._untyped:
+          type, _ = self._sniff(absDir / name, fromRootDir)
+          if not FileTypes.isImageType(type):
+            print(f'keeping categorised {fromRootDir} although its header doesn\'t look like an image ({type or "unknown type"})')
+            self._identify(fromRootDir)
+        images[name] = stamp
+        continue
+      rejected = self._rejected.get(fromRootDir)
+      if rejected != None:
+        if (stamp if stamp != None else CachedValues.statFile(absDir / name)) == rejected:
+          continue
+        # changed since it was sniffed, it might be an image now
+        del self._rejected[fromRootDir]
+      if indexed == None or fromRootDir in self._untyped:
+        type, sniffed = self._sniff(absDir / name, fromRootDir)
+        if not FileTypes.isImageType(type):
+          if sniffed != None:
+            self._rejected[fromRootDir] = sniffed
+          continue
+      images[name] = stamp
+    return images
+
+  # Sniff a file's type, remembering it to store in the attribute cache
+  # Returns (type, (size, mtime)), the file is stat'd first so a file that's written to while it's
+  # sniffed doesn't look unchanged later, stamp is None if it couldn't be stat'd
+  def _sniff(self, path, fromRootDir):
+    Stats.count('filesSniffed')
+    stamp = CachedValues.statFile(path)
+    type = FileTypes.sniff(path)
+    if stamp != None:
+      self._sniffed.append((fromRootDir, stamp[0], stamp[1], type))
+    if FileTypes.isImageType(type):
+      self._identify(fromRootDir)
+    self._untyped.discard(fromRootDir)
+    return type, stamp
+  
+  # Work out a file's identity for move detection, remembering it to store in the attribute cache
+  def _identify(self, fromRootDir):
+    identity = _identifyFile(str(self._rootDir / fromRootDir), self._matchContents)
+    if identity != None:
+      self._identified[fromRootDir] = identity
+  
+  # Store the identities found by a scan
+  def _saveIdentities(self):
+    if len(self._identified) == 0:
+      return
+    cache = self.getAttributeCache()
+    identities = self._identified.items()
+    cache.putMany('identity', [ (key, size, mtime, identity) for key, (size, mtime, identity, _) in identities ])
+    if self._matchContents:
+      cache.putMany('content', [ (key, size, mtime, content) for key, (size, mtime, _, content) in identities if content != None ])
+    self._identified = {}
+  
+  # Identify the indexed files that haven't been, e.g. ones indexed before moves were detected
+  # Only does anything the first time it's called after an upgrade or turning on matchContents
+  def _checkIdentities(self):
+    if self._identitiesChecked:
+      return
+    cache = self.getAttributeCache()
+    level = 2 if self._matchContents else 1
+    checked = cache.getAll('identitiesChecked').get('', 0)
+    if checked < level:
+      with self._lock:
+        keys = list(self._files)
+      missing = set()
+      for kind in [ 'identity', 'content' ][:level]:
+        identified = cache.getAll(kind)
+        missing.update(key for key in keys if key not in identified)
+      print(f'identifying {len(missing)} files for move detection')
+      # io bound, so threads are fine
+      missing = list(missing)
+      with ThreadPoolExecutor(max_workers=16) as pool:
+        paths = [ str(self._rootDir / key) for key in missing ]
+        for key, identity in zip(missing, pool.map(_identifyFile, paths, [ self._matchContents ] * len(paths))):
+          if identity != None:
+            self._identified[key] = identity
+      self._saveIdentities()
+      cache.putMany('identitiesChecked', [ ('', 0, 0, level) ])
+    self._identitiesChecked = True
+  
+  # Match images a scan removed with images it added that are the same files moved or renamed, and move
+  # their categories and cached values to the new images
+  # Returns the moves as (old image, new image)s
+  def _detectMoves(self, added, removed):
+    now = time.monotonic()
+    cache = self.getAttributeCache()
+    
+    # keep the identities of removed images for a while, forgetting everything about them after that
+    # unless something else has turned up at the same path
+    if len(removed) > 0:
+      keys = [ image.fromRootDir for image in removed ]
+      identities = cache.getRows('identity', keys)
+      contents = cache.getRows('content', keys) if self._matchContents else {}
+      for image in removed:
+        self._recentlyRemoved[image.fromRootDir] = (now, image, identities.get(image.fromRootDir), contents.get(image.fromRootDir))
+    expired = [ key for key, entry in self._recentlyRemoved.items() if now - entry[0] > self._moveTime ]
+    for key in expired:
+      del self._recentlyRemoved[key]
+    with self._lock:
+      expired = [ key for key in expired if key not in self._files ]
+    if len(expired) > 0:
+      cache.remove(expired)
+    if len(added) == 0 or len(self._recentlyRemoved) == 0:
+      return []
+    
+    byIdentity = {}
+    byContent = {}
+    for key, (_, _, identity, content) in self._recentlyRemoved.items():
+      if identity != None:
+        byIdentity[identity] = key
+      if content != None:
+        byContent[(content[0], content[2])] = key
+    
+    moves = []
+    for image in added:
+      identity = self._identified.get(image.fromRootDir)
+      if identity == None:
+        continue
+      size, mtime, fileId, content = identity
+      key = byIdentity.get((size, mtime, fileId))
+      if key == None and content != None:
+        key = byContent.get((size, content))
+      if key != None and key in self._recentlyRemoved:
+        _, old, _, _ = self._recentlyRemoved.pop(key)
+        moves.append((old, image))
+    if len(moves) == 0:
+      return moves
+    
+    with self._lock:
+      keys = [ new.fromRootDir for old, new in moves if self._moveCategories(old, new) ]
+      if len(keys) > 0:
+        self._recordChanges([ ('addImageCategory', key, category) for key in keys for category in self._files[key].categories ], keys)
+        self._setSaveTimer(self._saveTime)
+    cache.rename([ (old.fromRootDir, new.fromRootDir) for old, new in moves ])
+    Stats.count('imagesMoved', len(moves))
+    print(f'found {len(moves)} moved images')
+    return moves
+  
+  # Give a newly indexed image the categories of the image it was moved from, call with the lock held
+  # Returns whether there were any
+  def _moveCategories(self, old, new):
+    categories = old.categories
+    if len(categories) == 0 or self._files.get(new.fromRootDir) is not new:
+      return False
+    for category in categories:
+      if category not in self._categoryList:
+        self._categoryList.append(category)
+        self._sortCategoryList()
+      new.addCategory(category)
+      self._categoryIndex.add(category, new.fromRootDir)
+    self._categoryIndex.discard('Uncategorised', new.fromRootDir)
+    return True
+  
+  # Tell the move listeners about moves found by a scan
+  def _notifyMoves(self, moves):
+    if len(moves) > 0:
+      for listener in self._moveListeners:
+        listener(moves)
+
+  # Get the files previous scans found aren't images, on full refreshes everything that isn't
+  # indexed is sniffed again instead
+  def _loadFileTypes(self, full):
+    if self._rejected != None and not full:
+      return
+    cache = self.getAttributeCache()
+    self._rejected = {} if full else { key: (size, mtime) for key, (size, mtime, _) in cache.getAllRows('rejected').items() }
+    # indexes from before files were sniffed can have anything in them, sniff it all once
+    self._typesChecked = len(cache.getAll('typesChecked')) > 0
+    if not self._typesChecked:
+      with self._lock:
+        self._untyped = set(self._files)
+
+  # Have the directories of rejected files that have changed since they were sniffed listed again, and
+  # forget the ones that have gone. A file that's written to doesn't change its directory's mtime, so
+  # an incremental refresh wouldn't see it otherwise
+  def _recheckRejected(self):
+    gone = []
+    for key, stamp in list(self._rejected.items()):
+      current = CachedValues.statFile(self._rootDir / key)
+      if current == None:
+        gone.append(key)
+      elif current != stamp:
+        relDir = Path(os.path.dirname(key))
+        with self._lock:
+          cached = self._dirCache.get(relDir)
+          if cached != None:
+            self._dirCache[relDir] = (None, cached[1], cached[2])
+    if len(gone) > 0:
+      for key in gone:
+        del self._rejected[key]
+      self.getAttributeCache().remove(gone, 'rejected')
+  
+  # Store the types sniffed by a scan
+  def _saveFileTypes(self, fullScan):
+    cache = self.getAttributeCache()
+    if len(self._sniffed) > 0:
+      # categorised files are kept whatever their type, so only the ones skipped are stored as rejected
+      images = [ row for row in self._sniffed if row[0] not in self._rejected ]
+      rejected = [ row for row in self._sniffed if row[0] in self._rejected ]
+      cache.remove([ row[0] for row in images ], 'rejected')
+      cache.putMany('type', images)
+      cache.putMany('rejected', rejected)
+      self._sniffed = []
+    # a full scan lists every file, so every indexed file has been sniffed now (or pruned if it wasn't categorised)
+    if fullScan and not self._typesChecked:
+      self._untyped = set()
+      self._typesChecked = True
+      cache.putMany('typesChecked', [ ('', 0, 0, 1) ])
+
+  # Drop a directory and everything below it from the listing cache, removing its images
+  def _forgetDir(self, relDir, removed):
+    for cachedDir in [ d for d in self._dirCache if d == relDir or relDir in d.parents ]:
+      _, files, _ = self._dirCache.pop(cachedDir)
+      prefix = self._keyPrefix(cachedDir)
+      for name in files:
+        self._removeScanned(prefix + name, removed)
+
+  # Remove an image that refresh found no longer exists
+  def _removeScanned(self, fromRootDir, removed):
+    if fromRootDir in self._files:
+      image = self._files.pop(fromRootDir)
+      self._unindexImage(image)
+      self._recordChange(('removeImage', fromRootDir), [ fromRootDir ])
+      removed.append(image)
+
+  # The prefix of image keys in a directory, images are keyed by their fromRootDir path as a string
+  def _keyPrefix(self, relDir):
+    if relDir == Path():
+      return ''
+    return str(relDir) + os.sep
+
+  # Add an image to the category and search indexes
+  def _indexImage(self, image):
+    self._categoryIndex.addKey(image.fromRootDir)
+    self._nameIndexChange(True, image.fromRootDir)
+    if not image.isCategorised():
+      self._categoryIndex.add('Uncategorised', image.fromRootDir)
+    for category in image.categories:
+      self._categoryIndex.add(category, image.fromRootDir)
+
+  # Remove an image from the category and search indexes
+  def _unindexImage(self, image):
+    self._categoryIndex.discard('Uncategorised', image.fromRootDir)
+    for category in image.categories:
+      self._categoryIndex.discard(category, image.fromRootDir)
+    self._categoryIndex.removeKey(image.fromRootDir)
+    self._nameIndexChange(False, image.fromRootDir)
+
+  # Add or remove a key from the search index, or queue it if the index is being built
+  def _nameIndexChange(self, added, key):
+    if self._nameIndex != None:
+      if added:
+        self._nameIndex.add(key)
+      else:
+        self._nameIndex.remove(key)
+    elif self._nameIndexChanges != None:
+      self._nameIndexChanges.append((added, key))
 
   # Set an n second time after which if this function isn't called again a save will be triggered
   def _setSaveTimer(self, n):
@@ -195,9 +946,20 @@ class DirectoryMonitor:
     self._saveTimer = None
     self.save()
 
-  # The config file path
-  def _configFile(self, suffix=''):
-    return self._rootDir / f"config{suffix}.json"
+  # Record a change for the store to save, and journal the new state of the images it affected
+  def _recordChange(self, change, keys):
+    self._recordChanges([ change ], keys)
+
+  # Record several changes at once
+  def _recordChanges(self, changes, keys):
+    with self._changesLock:
+      self._changes.extend(changes)
+    self._store.journal([ (key, self._files[key].categories if key in self._files else None) for key in keys ])
+
+  # Whether a file in the root is one of our index files rather than an image
+  def _isIndexFile(self, name):
+    return (name.endswith('.json') or name.startswith('config.db') or name.startswith('config.journal')
+            or name.startswith('config.attributes.db'))
   
   # Sort the category list
   def _sortCategoryList(self):
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+from PyQt5.QtCore import ( QObject, QFileSystemWatcher, QTimer, pyqtSignal )
+from pathlib import Path
+
+# Watches a DirectoryMonitor's folder for changes and reports them as batched deltas
+# Uses QFileSystemWatcher on every directory, and falls back to polling with incremental
+# refreshes if the directories can't be watched (too many for the os, network shares etc)
+# Rescans run on the MonitorGroup's scan pool and their deltas come back to this thread
+# as signals, only one runs at a time and changes seen meanwhile wait for the next
+class DirectoryWatcher(QObject):
+  # Signal triggered when new images are found (list of images)
+  onImagesAdded = pyqtSignal(list)
+
+  # Signal triggered when images are removed from disk (list of images)
+  onImagesRemoved = pyqtSignal(list)
+
+  # Signal triggered when images are changed on disk (list of images)
+  onImagesChanged = pyqtSignal(list)
+
+  # Signal triggered on the scan thread when a rescan finishes (added, removed, changed)
+  _onRescanned = pyqtSignal(list, list, list)
+
+  def __init__(self, group, monitor, poll=False):
+    super().__init__()
+
+    self._group = group
+    self._monitor = monitor
+
+    # configuration
+    self._coalesceTime = 250 # ms to collect events for before rescanning
+    self._pollTime = 1000 # ms between incremental refreshes when polling
+
+    # directories reported as changed since the last rescan
+    self._dirtyDirs = set()
+
+    # whether a rescan is running, and the directories there were before it started
+    self._rescanning = False
+    self._knownDirs = None
+    self._onRescanned.connect(self._rescanned)
+
+    # coalescing timer, started by the first event in a burst and not restarted by the rest
+    # so a constant stream of events still gets flushed every _coalesceTime
+    self._coalesceTimer = QTimer(self)
+    self._coalesceTimer.setSingleShot(True)
+    self._coalesceTimer.timeout.connect(self._flush)
+
+    # polling fallback
+    self._pollTimer = QTimer(self)
+    self._pollTimer.timeout.connect(self._poll)
+
+    self._watcher = None
+    if poll:
+      self._startPolling()
+    else:
+      self._watcher = QFileSystemWatcher(self)
+      self._watcher.directoryChanged.connect(self._directoryChanged)
+      self._watchDirs(self._monitor.getDirectories())
+
+  # Stop watching
+  def stop(self):
+    self._coalesceTimer.stop()
+    self._pollTimer.stop()
+    if self._watcher != None:
+      self._watcher.deleteLater()
+      self._watcher = None
+
+  # Add directories (fromRootDir paths) to the watcher, falling back to polling if any can't be watched
+  def _watchDirs(self, relDirs):
+    if self._watcher == None or len(relDirs) == 0:
+      return
+    paths = [ str(self._monitor.getRootDir() / relDir) for relDir in relDirs ]
+    failed = self._watcher.addPaths(paths)
+    if len(failed) > 0:
+      print(f'failed to watch {len(failed)} directories, falling back to polling')
+      self.stop()
+      self._startPolling()
+
+  # Remove directories that no longer exist from the watcher
+  def _unwatchDirs(self):
+    if self._watcher == None:
+      return
+    known = set(str(self._monitor.getRootDir() / relDir) for relDir in self._monitor.getDirectories())
+    gone = [ path for path in self._watcher.directories() if path not in known ]
+    if len(gone) > 0:
+      self._watcher.removePaths(gone)
+
+  # Start polling instead of watching
+  def _startPolling(self):
+    print(f'polling for changes every {self._pollTime}ms')
+    self._pollTimer.start(self._pollTime)
+
+  # Called by QFileSystemWatcher when something in a directory changes
+  def _directoryChanged(self, path):
+    try:
+      self._dirtyDirs.add(Path(path).relative_to(self._monitor.getRootDir()))
+    except ValueError:
+      return
+    if not self._coalesceTimer.isActive():
+      self._coalesceTimer.start(self._coalesceTime)
+
+  # Start rescanning the directories changed in the last burst, unless a rescan is already running
+  # in which case they're picked up when it finishes
+  def _flush(self):
+    if self._rescanning or len(self._dirtyDirs) == 0:
+      return
+    dirty = self._dirtyDirs
+    self._dirtyDirs = set()
+
+    self._rescanning = True
+    self._knownDirs = set(self._monitor.getDirectories())
+    self._group.refreshDirsAsync(self._monitor, dirty, self._onRescanned.emit)
+
+  # Start an incremental refresh for the polling fallback, unless the last one is still running
+  def _poll(self):
+    if self._rescanning:
+      return
+    self._rescanning = True
+    self._knownDirs = None
+    self._group.refreshDirsAsync(self._monitor, None, self._onRescanned.emit)
+
+  # Called when a rescan finishes, watch new directories, forget removed ones and emit the delta
+  def _rescanned(self, added, removed, changed):
+    self._rescanning = False
+    if self._knownDirs != None:
+      self._watchDirs([ relDir for relDir in self._monitor.getDirectories() if relDir not in self._knownDirs ])
+      self._unwatchDirs()
+      self._knownDirs = None
+    self._emitDelta(added, removed, changed)
+
+    # changes that came in while it was running
+    if len(self._dirtyDirs) > 0 and not self._coalesceTimer.isActive():
+      self._coalesceTimer.start(self._coalesceTime)
+
+  # Emit the non-empty parts of a delta
+  def _emitDelta(self, added, removed, changed):
+    if len(removed) > 0:
+      self.onImagesRemoved.emit(removed)
+    if len(added) > 0:
+      self.onImagesAdded.emit(added)
+    if len(changed) > 0:
+      self.onImagesChanged.emit(changed)
\ No newline at end of file
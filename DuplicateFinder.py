@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+import CachedValues
+
+# numpy is optional, duplicate finding is only available if it's installed
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+# The attribute cache kind hashes are stored under
+_hashKind = 'dhash'
+
+# Number of files hashed per task sent to a worker process
+_chunkSize = 256
+
+# Whether duplicate finding is available
+def available():
+  return np != None
+
+# Find groups of duplicate and near duplicate images
+# getCache(image) returns the AttributeCache for an image's root, hashes are cached there
+# Images whose dHashes differ by at most maxDistance bits are considered duplicates
+# Returns a list of groups (lists of images with at least two images each), biggest first
+def findDuplicates(images, getCache, maxDistance=4):
+  hashes = _getHashes(images, getCache)
+  hashed = [ image for image in images if hashes.get(image) != None ]
+  if len(hashed) < 2:
+    return []
+  values = np.array([ hashes[image] for image in hashed ], dtype=np.uint64)
+
+  # exact duplicates share a hash, so only compare unique hashes with each other
+  unique, inverse = np.unique(values, return_inverse=True)
+  parents = np.arange(len(unique))
+  for i, j in _nearPairs(unique, maxDistance):
+    _union(parents, i, j)
+
+  # group images by the root of their hash's set
+  groups = {}
+  for image, hashIndex in zip(hashed, inverse.tolist()):
+    groups.setdefault(_find(parents, hashIndex), []).append(image)
+  groups = [ group for group in groups.values() if len(group) > 1 ]
+  groups.sort(key=len, reverse=True)
+  print(f'found {len(groups)} groups of duplicates in {len(images)} images')
+  return groups
+
+# Get the dHash of every image, from the cache where it's valid and computed otherwise
+# Returns image -> hash for the images that could be read
+def _getHashes(images, getCache):
+  hashes, _ = CachedValues.getValues(images, getCache, _hashKind, _hashFiles, chunkSize=_chunkSize)
+  return { image: _unsigned(value) for image, value in hashes.items() }
+
+# Compute the dHashes of a list of files, runs in a worker process
+# Each file is decoded straight to 9x8 grayscale and the hashes are computed for the whole chunk at once
+# Returns them as they're stored, or None for files that couldn't be read
+def _hashFiles(paths):
+  from PyQt5.QtCore import QSize
+  from PyQt5.QtGui import ( QImage, QImageReader )
+
+  pixels = np.zeros((len(paths), 8, 9), dtype=np.uint8)
+  valid = np.zeros(len(paths), dtype=bool)
+  for i, path in enumerate(paths):
+    reader = QImageReader(path)
+    reader.setScaledSize(QSize(9, 8))
+    image = reader.read()
+    if image.isNull():
+      continue
+    image = image.convertToFormat(QImage.Format_Grayscale8)
+    if image.width() != 9 or image.height() != 8:
+      image = image.scaled(9, 8)
+    bits = image.constBits()
+    bits.setsize(image.bytesPerLine() * 8)
+    pixels[i] = np.frombuffer(bits, dtype=np.uint8).reshape(8, image.bytesPerLine())[:, :9]
+    valid[i] = True
+
+  # each bit is whether a pixel is brighter than the one to its right
+  gradients = pixels[:, :, :-1] > pixels[:, :, 1:]
+  hashes = np.packbits(gradients.reshape(len(paths), 64), axis=1).view('>u8').ravel()
+  return [ _signed(int(value)) if ok else None for value, ok in zip(hashes.tolist(), valid.tolist()) ]
+
+# Find pairs of hashes (as indices) within maxDistance bits of each other using multi-index hashing
+# The hashes are split into maxDistance+1 chunks, and any two hashes within maxDistance bits must
+# match exactly on at least one chunk, so only hashes that share a chunk value need comparing
+def _nearPairs(hashes, maxDistance):
+  pairs = set()
+  chunks = maxDistance + 1
+  chunkBits = -(-64 // chunks)
+  for chunk in range(chunks):
+    shift = chunk * chunkBits
+    width = min(chunkBits, 64 - shift)
+    keys = (hashes >> np.uint64(shift)) & np.uint64((1 << width) - 1)
+    order = np.argsort(keys, kind='stable')
+    sortedKeys = keys[order]
+    starts = np.concatenate(([ 0 ], np.flatnonzero(np.diff(sortedKeys)) + 1))
+    ends = np.concatenate((starts[1:], [ len(keys) ]))
+    for start, end in zip(starts.tolist(), ends.tolist()):
+      if end - start > 1:
+        _bucketPairs(hashes, order[start:end], maxDistance, pairs)
+  return pairs
+
+# Compare every pair of hashes in a bucket, a block of rows at a time to bound memory
+def _bucketPairs(hashes, members, maxDistance, pairs):
+  bucket = hashes[members]
+  for first in range(0, len(members), 1024):
+    block = bucket[first:first+1024]
+    distances = _popcount(block[:, None] ^ bucket[None, :])
+    rows, cols = np.nonzero(distances <= maxDistance)
+    for row, col in zip((rows + first).tolist(), cols.tolist()):
+      if row < col:
+        pairs.add((int(members[row]), int(members[col])))
+
+# Count the set bits of every element of a uint64 array
+_byteBits = None
+def _popcount(values):
+  global _byteBits
+  if hasattr(np, 'bitwise_count'):
+    return np.bitwise_count(values)
+  if _byteBits is None:
+    _byteBits = np.array([ bin(i).count('1') for i in range(256) ], dtype=np.uint8)
+  return _byteBits[values.view(np.uint8)].reshape(values.shape + (8,)).sum(axis=-1)
+
+# Union find helpers
+def _find(parents, i):
+  while parents[i] != i:
+    parents[i] = parents[parents[i]]
+    i = parents[i]
+  return i
+
+def _union(parents, i, j):
+  i = _find(parents, i)
+  j = _find(parents, j)
+  if i != j:
+    parents[max(i, j)] = min(i, j)
+
+# sqlite integers are signed 64 bit
+def _signed(value):
+  return value - (1 << 64) if value >= (1 << 63) else value
+
+def _unsigned(value):
+  return value & ((1 << 64) - 1)
\ No newline at end of file
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import shutil
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import Stats
+
+# send2trash is optional, without it trashing uses the freedesktop trash on linux and ~/.Trash on macOS
+try:
+  import send2trash
+except ImportError:
+  send2trash = None
+
+# The kinds of operation, move and copy need a destination folder
+kinds = [ 'delete', 'trash', 'move', 'copy' ]
+
+# Whether moving to the trash is available
+def trashAvailable():
+  return send2trash != None or sys.platform.startswith('linux') or sys.platform == 'darwin'
+
+# A bulk file operation on images, run on a bounded pool of threads
+# Files are done in parallel but the index is left alone, the caller applies completed in one go
+# at the end (see MonitorGroup.applyFileOperation)
+#
+#   operation = FileOperation('move', images, '/photos/culled')
+#   operation.run(onProgress)   # on a background thread, operation.cancel() from any other
+#   operation.completed         # [ (image, new path or None) ]
+#   operation.failed            # [ (image, error message) ]
+class FileOperation:
+  def __init__(self, kind, images, destination=None, workers=8):
+    if kind not in kinds:
+      raise ValueError(f'unknown file operation {kind}')
+    if kind in ('move', 'copy') and destination == None:
+      raise ValueError(f'{kind} needs a destination folder')
+    self.kind = kind
+    self.images = list(images)
+    self.destination = destination
+    self.completed = []
+    self.failed = []
+    self._workers = workers
+    self._cancelled = False
+
+    # Time between progress reports
+    self._progressTime = 0.1
+
+    # destination paths picked but not written yet, so two files with the same name don't get the same one
+    self._reservedLock = threading.Lock()
+    self._reserved = set()
+
+  # Do the operation, returns once every file is done or the operation is cancelled
+  # onProgress(done, total) is called every so often from the calling thread
+  def run(self, onProgress=None):
+    done = 0
+    reportTime = time.monotonic()
+    with Stats.timed('fileOperation'), ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix='files') as pool:
+      # map keeps the files in order, and files not started when cancelled return straight away
+      for image, newPath, error in pool.map(self._doFile, self.images):
+        done += 1
+        if error != None:
+          self.failed.append((image, error))
+        elif newPath != False:
+          self.completed.append((image, newPath))
+        if onProgress != None and time.monotonic() - reportTime >= self._progressTime:
+          onProgress(done, len(self.images))
+          reportTime = time.monotonic()
+    if onProgress != None:
+      onProgress(done, len(self.images))
+    Stats.count(f'{self.kind}Files', len(self.completed))
+    print(f'{self.kind} finished: {len(self.completed)} done, {len(self.failed)} failed'
+          f'{", cancelled" if self._cancelled else ""}')
+
+  # Stop at the next file, files already done stay done
+  def cancel(self):
+    self._cancelled = True
+
+  # Whether the operation was cancelled
+  def isCancelled(self):
+    return self._cancelled
+
+  # Do one file, returns (image, new path or None, error or None)
+  # new path is False if the file was skipped because the operation was cancelled
+  def _doFile(self, image):
+    if self._cancelled:
+      return image, False, None
+    path = str(image.absolutePath)
+    try:
+      newPath = None
+      if self.kind == 'delete':
+        os.remove(path)
+      elif self.kind == 'trash':
+        _trash(path)
+      else:
+        newPath = self._reserve(os.path.basename(path))
+        try:
+          if self.kind == 'move':
+            shutil.move(path, newPath)
+          else:
+            shutil.copy2(path, newPath)
+        finally:
+          with self._reservedLock:
+            self._reserved.discard(newPath)
+      return image, newPath, None
+    except Exception:
+      type, value, traceback = sys.exc_info()
+      print(f'got exception doing {self.kind} on {path}: {value}')
+      return image, None, str(value)
+
+  # Pick a destination path for a file that isn't in use, adding ' (n)' to the name if it is
+  def _reserve(self, name):
+    base, ext = os.path.splitext(name)
+    n = 1
+    with self._reservedLock:
+      newPath = os.path.join(self.destination, name)
+      while newPath in self._reserved or os.path.lexists(newPath):
+        newPath = os.path.join(self.destination, f'{base} ({n}){ext}')
+        n += 1
+      self._reserved.add(newPath)
+    return newPath
+
+# Move a file to the trash
+def _trash(path):
+  if send2trash != None:
+    send2trash.send2trash(path)
+  elif sys.platform == 'darwin':
+    _moveToFolder(path, os.path.expanduser('~/.Trash'))
+  elif sys.platform.startswith('linux'):
+    _freedesktopTrash(path)
+  else:
+    raise OSError('moving to the trash needs send2trash to be installed')
+
+# Move a file into a folder without replacing anything there, returns the new path
+# Files are moved on several threads, so the name is claimed by creating it exclusively and the move
+# then replaces that empty file
+def _moveToFolder(path, folder):
+  base, ext = os.path.splitext(os.path.basename(path))
+  newPath = os.path.join(folder, base + ext)
+  n = 1
+  while True:
+    try:
+      os.close(os.open(newPath, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600))
+      break
+    except FileExistsError:
+      newPath = os.path.join(folder, f'{base} ({n}){ext}')
+      n += 1
+  try:
+    shutil.move(path, newPath)
+  except Exception:
+    os.remove(newPath)
+    raise
+  return newPath
+
+# Lock for picking trash names, the info file is created exclusively but this saves retries
+_trashLock = threading.Lock()
+
+# Move a file to the home trash as described by the freedesktop trash spec
+def _freedesktopTrash(path):
+  trashDir = os.path.join(os.environ.get('XDG_DATA_HOME') or os.path.expanduser('~/.local/share'), 'Trash')
+  filesDir = os.path.join(trashDir, 'files')
+  infoDir = os.path.join(trashDir, 'info')
+  os.makedirs(filesDir, exist_ok=True)
+  os.makedirs(infoDir, exist_ok=True)
+
+  # the info file is created first to claim the name
+  base, ext = os.path.splitext(os.path.basename(path))
+  name = base + ext
+  n = 1
+  with _trashLock:
+    while True:
+      infoPath = os.path.join(infoDir, name + '.trashinfo')
+      try:
+        fd = os.open(infoPath, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        break
+      except FileExistsError:
+        name = f'{base} ({n}){ext}'
+        n += 1
+  with os.fdopen(fd, 'w') as f:
+    f.write('[Trash Info]\n'
+            f'Path={urllib.parse.quote(os.path.abspath(path))}\n'
+            f'DeletionDate={time.strftime("%Y-%m-%dT%H:%M:%S")}\n')
+  try:
+    shutil.move(path, os.path.join(filesDir, name))
+  except Exception:
+    os.remove(infoPath)
+    raise
\ No newline at end of file
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+import fnmatch
+
+# Bytes read from the start of a file to work out its type
+_headerSize = 256
+
+# The image types that are indexed
+imageTypes = { 'jpeg', 'png', 'gif', 'bmp', 'webp', 'tiff', 'ico', 'svg', 'pnm' }
+
+# Work out a file's type from its first few bytes
+# Returns the type name, or '' if it isn't a type we recognise
+def sniff(path):
+  try:
+    with open(str(path), 'rb') as f:
+      header = f.read(_headerSize)
+  except OSError:
+    return ''
+  return sniffHeader(header)
+
+# Work out a file's type from its header
+def sniffHeader(header):
+  if header.startswith(b'\xff\xd8\xff'):
+    return 'jpeg'
+  if header.startswith(b'\x89PNG\r\n\x1a\n'):
+    return 'png'
+  if header.startswith(b'GIF87a') or header.startswith(b'GIF89a'):
+    return 'gif'
+  if header.startswith(b'BM') and len(header) >= 14:
+    return 'bmp'
+  if header.startswith(b'RIFF') and header[8:12] == b'WEBP':
+    return 'webp'
+  if header.startswith(b'II*\x00') or header.startswith(b'MM\x00*'):
+    return 'tiff'
+  if header.startswith(b'\x00\x00\x01\x00'):
+    return 'ico'
+  if len(header) >= 3 and header[0:1] == b'P' and header[1:2] in b'123456' and header[2:3].isspace():
+    return 'pnm'
+  if header[4:8] == b'ftyp':
+    brand = header[8:12]
+    if brand in (b'avif', b'avis'):
+      return 'avif'
+    if brand in (b'heic', b'heix', b'mif1', b'msf1'):
+      return 'heic'
+    return 'video'
+  if header.startswith(b'\x1aE\xdf\xa3') or (header.startswith(b'RIFF') and header[8:12] == b'AVI '):
+    return 'video'
+  if header.startswith(b'PK\x03\x04') or header.startswith(b'Rar!') or header.startswith(b'7z\xbc\xaf'):
+    return 'archive'
+  if header.startswith(b'%PDF'):
+    return 'pdf'
+  text = header.lstrip(b'\xef\xbb\xbf \t\r\n').lower()
+  if text.startswith(b'<svg') or (text.startswith(b'<?xml') and b'<svg' in text):
+    return 'svg'
+  return ''
+
+# Whether a file's type is one that's indexed
+def isImageType(type):
+  return type in imageTypes
+
+# Whether a path passes include and exclude rules, lists of glob patterns matched case insensitively
+# against the file name and its path from the root (with / separators)
+# With include rules a path has to match one of them, and it can't match any exclude rules
+def matchesRules(path, include, exclude):
+  path = path.replace('\\', '/').lower()
+  name = path.rsplit('/', 1)[-1]
+  if len(include) > 0 and not any(_matches(path, name, pattern) for pattern in include):
+    return False
+  return not any(_matches(path, name, pattern) for pattern in exclude)
+
+def _matches(path, name, pattern):
+  pattern = pattern.replace('\\', '/').lower()
+  return fnmatch.fnmatchcase(name, pattern) or fnmatch.fnmatchcase(path, pattern)
\ No newline at end of file
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+
+# An in-memory LRU cache with a byte budget
+# Every entry has a cost in bytes, and the least recently used entries are evicted once the total
+# goes over the budget. Pinned entries (e.g. the ones on screen) are never evicted.
+class IconCache:
+  def __init__(self, maxBytes):
+    self._maxBytes = maxBytes
+
+    # key -> (value, cost), least recently used first
+    self._entries = OrderedDict()
+    self._bytes = 0
+    self._pinned = set()
+
+    # counters
+    self._hits = 0
+    self._misses = 0
+    self._evictions = 0
+
+  # Get a value, or None if it isn't cached
+  def get(self, key):
+    entry = self._entries.get(key)
+    if entry == None:
+      self._misses += 1
+      return None
+    self._hits += 1
+    self._entries.move_to_end(key)
+    return entry[0]
+
+  # Whether a key is cached, without counting as a use
+  def contains(self, key):
+    return key in self._entries
+
+  # Add a value with a cost in bytes, evicting old values if that takes it over the budget
+  def put(self, key, value, cost):
+    self.remove(key)
+    self._entries[key] = (value, cost)
+    self._bytes += cost
+    self._evict()
+
+  # Remove a value
+  def remove(self, key):
+    entry = self._entries.pop(key, None)
+    if entry != None:
+      self._bytes -= entry[1]
+
+  # Set the keys that can't be evicted, replacing the previous set
+  def pin(self, keys):
+    self._pinned = set(keys)
+    self._evict()
+
+  # Change the byte budget
+  def setMaxBytes(self, maxBytes):
+    self._maxBytes = maxBytes
+    self._evict()
+
+  # Get the counters and sizes
+  def stats(self):
+    lookups = self._hits + self._misses
+    return { 'hits': self._hits
+           , 'misses': self._misses
+           , 'evictions': self._evictions
+           , 'hitRate': self._hits / lookups if lookups > 0 else 0.0
+           , 'entries': len(self._entries)
+           , 'bytes': self._bytes
+           , 'maxBytes': self._maxBytes }
+
+  # Evict least recently used unpinned values until we're within the budget
+  def _evict(self):
+    if self._bytes <= self._maxBytes:
+      return
+    evict = []
+    freed = 0
+    for key, (_, cost) in self._entries.items():
+      if self._bytes - freed <= self._maxBytes:
+        break
+      if key not in self._pinned:
+        evict.append(key)
+        freed += cost
+    for key in evict:
+      self.remove(key)
+    self._evictions += len(evict)
\ No newline at end of file
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+import heapq
+import itertools
+import threading
+
+# A blocking priority queue of icon loads
+# Each key is only ever queued once, queueing it again just raises its priority if the new one is
+# better (lower). Pending loads can be reprioritised or dropped, e.g. when they scroll out of view.
+class IconQueue:
+  def __init__(self):
+    self._lock = threading.Condition()
+
+    # heap of (priority, sequence, key), entries that no longer match _pending are skipped
+    self._heap = []
+    self._sequence = itertools.count()
+
+    # key -> (priority, sequence, item)
+    self._pending = {}
+
+    # set by close, get returns None from then on
+    self._closed = False
+
+  # Queue an item, or raise its priority if it's already queued
+  def put(self, key, item, priority=0):
+    with self._lock:
+      current = self._pending.get(key)
+      if current != None and current[0] <= priority:
+        return
+      self._push(key, item, priority)
+      self._lock.notify()
+
+  # Take the highest priority item, blocking until there is one
+  # Returns None once the queue has been closed
+  def get(self):
+    with self._lock:
+      while True:
+        if self._closed:
+          return None
+        while len(self._heap) > 0:
+          priority, sequence, key = heapq.heappop(self._heap)
+          current = self._pending.get(key)
+          if current != None and current[1] == sequence:
+            del self._pending[key]
+            return current[2]
+        self._lock.wait()
+
+  # Whether a key is queued
+  def isPending(self, key):
+    with self._lock:
+      return key in self._pending
+
+  # Number of queued items
+  def qsize(self):
+    with self._lock:
+      return len(self._pending)
+
+  # Set the priorities of queued items (key -> priority) and drop every other queued item
+  # Returns the keys that were dropped
+  def retain(self, priorities):
+    with self._lock:
+      dropped = [ key for key in self._pending if key not in priorities ]
+      for key in dropped:
+        del self._pending[key]
+      for key, priority in priorities.items():
+        current = self._pending.get(key)
+        if current != None and current[0] != priority:
+          self._push(key, current[2], priority)
+      self._compact()
+      return dropped
+
+  # Drop every queued item, returns the keys that were dropped
+  def clear(self):
+    with self._lock:
+      dropped = list(self._pending.keys())
+      self._pending = {}
+      self._heap = []
+      return dropped
+
+  # Drop every queued item and wake everything waiting in get, which returns None from now on
+  def close(self):
+    with self._lock:
+      self._closed = True
+      self._pending = {}
+      self._heap = []
+      self._lock.notify_all()
+
+  # Push an entry, superseding any existing entry for the key
+  def _push(self, key, item, priority):
+    sequence = next(self._sequence)
+    self._pending[key] = (priority, sequence, item)
+    heapq.heappush(self._heap, (priority, sequence, key))
+
+  # Rebuild the heap if it's mostly superseded entries
+  def _compact(self):
+    if len(self._heap) > 2 * len(self._pending) + 64:
+      self._heap = [ (priority, sequence, key) for key, (priority, sequence, _) in self._pending.items() ]
+      heapq.heapify(self._heap)
\ No newline at end of file
@@ -2,126 +2,373 @@
 
 import os
 import sys
-import time
-import queue
 import threading
 import subprocess
 
 from PyQt5 import QtCore
-from PyQt5.QtGui import QIcon
-from PyQt5.QtCore import ( pyqtSignal, QVariant )
-from PyQt5.QtWidgets import ( QListView, QMessageBox, QAction, QListWidget
-                            , QListWidgetItem, QMenu, QAbstractItemView )
+from PyQt5.QtGui import ( QIcon, QImage, QImageReader, QPixmap )
+from PyQt5.QtCore import ( pyqtSignal, QBuffer, QByteArray, QIODevice )
+from PyQt5.QtWidgets import ( QListView, QMessageBox, QAction, QMenu, QAbstractItemView, QFileDialog )
 
 import Utils
-from DirectoryMonitor import Image
+import Stats
+import FileOperations
+from ImageListModel import ImageListModel
+from ThumbnailCache import ThumbnailCache
+from IconQueue import IconQueue
+from IconCache import IconCache
 
 # The image list
-class ImageList(QListWidget):
-  # Signal triggered when the user adds an image to a category (image, category)
-  onAddImageCategory = pyqtSignal(Image, str)
+class ImageList(QListView):
+  # Signal triggered when the user adds images to a category (images, category)
+  onAddImagesCategory = pyqtSignal(list, str)
   
-  # Signal triggered when the user removes an image from a category (image, category)
-  onRemoveImageCategory = pyqtSignal(Image, str)
+  # Signal triggered when the user removes images from a category (images, category)
+  onRemoveImagesCategory = pyqtSignal(list, str)
   
-  # Signal triggerde when the user attemps to remove an image from the index completely
-  onRemoveImageIndex = pyqtSignal(Image)
+  # Signal triggered when the user attempts to remove images from the index completely (images)
+  onRemoveImagesIndex = pyqtSignal(list)
   
-  def __init__(self, getCategories, getCurrentCategory):
+  # Signal triggered when the user deletes, trashes, moves or copies images on disk
+  # (kind, images, destination folder or None), see FileOperations
+  onFileOperation = pyqtSignal(str, list, object)
+  
+  # Signal triggered by the icon threads when there are loaded icons waiting to be picked up
+  _onIconsLoaded = pyqtSignal()
+  
+  # metadata is an optional MetadataIndex used to sort and filter the images shown
+  def __init__(self, getCategories, getCurrentCategory, iconThreads=None, iconCacheBytes=512*1024*1024, metadata=None):
     super().__init__()
     
     self._getCategories = getCategories
     self._getCurrentCategory = getCurrentCategory
     
-    # all images in the list currently
-    self._images = {}
+    # sorting and filtering, the sort order and filter are MetadataIndex orders or None
+    self._metadata = metadata
+    self._sortOrder = None
+    self._sortDescending = False
+    self._filter = None
     
     # configuration
     self._iconSize = 256
     
-    # icon thread
-    self._imagesLock = threading.Lock()
-    self._iconThread = None
-    self._iconQueue = queue.Queue()
+    # icon threads, one per core by default
+    self._iconThreadCount = iconThreads if iconThreads != None else (os.cpu_count() or 4)
+    self._iconThreads = []
+    self._iconQueue = IconQueue()
+    
+    # thumbnails loaded by the icon threads waiting for the gui thread, as (image, thumbnail)
+    self._loadedLock = threading.Lock()
+    self._loadedIcons = []
     
-    # cached image icons
-    self._imageIcons = {}
+    # cached image icons, and the images whose icons are queued or loading
+    self._imageIcons = IconCache(iconCacheBytes)
+    self._pendingIcons = set()
+    self._placeholderIcon = QIcon()
     
-    # initialise QListWidget
+    # thumbnails persisted between sessions, one pack per root directory
+    self._thumbnailCachesLock = threading.Lock()
+    self._thumbnailCaches = {}
+    
+    # the model, which only asks for icons for rows that are shown
+    self._model = ImageListModel(self._getIcon, self._iconSize)
+    self.setModel(self._model)
+    
+    # initialise QListView
     self.installEventFilter(self)
-    self.itemDoubleClicked.connect(self._imageDoubleClick)
-    self.setViewMode(QListWidget.IconMode)
+    self.doubleClicked.connect(self._imageDoubleClick)
+    self.setViewMode(QListView.IconMode)
     self.setIconSize(QtCore.QSize(self._iconSize, self._iconSize))
     self.setSelectionMode(QAbstractItemView.ExtendedSelection)
     self.setResizeMode(QListView.Adjust)
+    self.setUniformItemSizes(True)
+    self.setLayoutMode(QListView.Batched)
+    self.setBatchSize(1000)
     
-    # Start icon load thread
-    self.iconThread = threading.Thread(name='iconThread', target=self._iconTask)
-    self.iconThread.daemon = True
-    self.iconThread.start()
-  
-  # Add an image to the ui
-  def addImage(self, image):
-    if image.fromRootDir not in self._images:
-      icon = None
-      if image.absolutePath in self._imageIcons:
-        icon = self._imageIcons[image.absolutePath]
-      else:
-        icon = QIcon()
-        self._iconQueue.put((image, icon))
-        self._imageIcons[image.absolutePath] = icon
-      item = QListWidgetItem(icon, image.name)
-      item.setSizeHint(QtCore.QSize(self._iconSize, self._iconSize+32))
-      item.setData(QtCore.Qt.UserRole, QVariant(image))
-      
-      self._imagesLock.acquire(True)
-      self._images[image.fromRootDir] = item
-      self.insertItem(self.count(), item)
-      self._imagesLock.release()
-
-  # Remove an image from the ui
-  def removeImage(self, image):
-    if image.fromRootDir in self._images:
-      self._imagesLock.acquire(True)
-      item = self._images.pop(image.fromRootDir)
-      self.removeItemWidget(item)
-      self._imagesLock.release()
+    # icons are loaded on the icon threads but the model has to be updated on this one
+    self._onIconsLoaded.connect(self._iconsLoaded)
+    
+    # reprioritise queued icons when the visible rows change, after things settle a little
+    self._iconPriorityTimer = QtCore.QTimer(self)
+    self._iconPriorityTimer.setSingleShot(True)
+    self._iconPriorityTimer.timeout.connect(self._updateIconPriorities)
+    self.verticalScrollBar().valueChanged.connect(self._scheduleIconPriorities)
+    self._model.modelReset.connect(self._scheduleIconPriorities)
+    self._model.rowsInserted.connect(self._scheduleIconPriorities)
+    self._model.rowsRemoved.connect(self._scheduleIconPriorities)
+    
+    # Start icon load threads
+    for i in range(self._iconThreadCount):
+      iconThread = threading.Thread(name=f'iconThread{i}', target=self._iconTask)
+      iconThread.daemon = True
+      iconThread.start()
+      self._iconThreads.append(iconThread)
+  
+  # Set the images shown, only the rows that differ from what's shown now are changed
+  def setImages(self, images):
+    images = self._filterImages(images)
+    if self._sortOrder != None:
+      images = self._metadata.sort(images, self._sortOrder, self._sortDescending)
+    self._model.setImages(images)
+  
+  # Add images to the ui, they're added at the end until the images are next set
+  def addImages(self, images):
+    self._model.addImages(self._filterImages(images))
+
+  # Set the sort order, a MetadataIndex order or None to leave images in the order they're given
+  # Takes effect the next time the images are set
+  def setSortOrder(self, order, descending=False):
+    self._sortOrder = order if self._metadata != None else None
+    self._sortDescending = descending
+
+  # Only show images whose key for a MetadataIndex order is between low and high (either can be None),
+  # or pass order None to show everything. Takes effect the next time the images are set
+  def setFilter(self, order, low=None, high=None):
+    self._filter = (order, low, high) if order != None and self._metadata != None else None
+
+  # Whether the images shown depend on their metadata
+  def isArranged(self):
+    return self._sortOrder != None or self._filter != None
+
+  # Remove images from the ui
+  def removeImages(self, images):
+    self._model.removeImages(images)
+
+  # Move the cached thumbnails of images that have been moved or renamed to their new paths
+  # moves are (old image, new image)s
+  def moveImages(self, moves):
+    byRoot = {}
+    for old, new in moves:
+      byRoot.setdefault(new.rootDir, []).append((old, new))
+    for rootMoves in byRoot.values():
+      thumbnailCache = self._getThumbnailCache(rootMoves[0][1])
+      thumbnailCache.rename([ (str(old.absolutePath), str(new.absolutePath)) for old, new in rootMoves ])
+
+  # Reload images' icons, e.g. because the files have changed on disk
+  def reloadImages(self, images):
+    for image in images:
+      self._imageIcons.remove(image.absolutePath)
+    self._model.updateImages(images)
 
   # Remove all images from the ui
   def clearImages(self):
-    self._imagesLock.acquire(True)
-    self._images = {}
-    self.clear()
-    self._imagesLock.release()
+    self._model.clearImages()
+
+  # Get the in-memory icon cache's counters
+  def getIconCacheStats(self):
+    return self._imageIcons.stats()
+
+  # Get the number of icons waiting to be loaded
+  def getIconQueueDepth(self):
+    return self._iconQueue.qsize()
+
+  # Call on exit to stop the icon threads and tidy up the thumbnail cache
+  def exiting(self):
+    # the icon threads use the thumbnail packs, so wait for any loads in progress to finish first
+    self._iconQueue.close()
+    for iconThread in self._iconThreads:
+      iconThread.join()
+    self._iconThreads = []
+    
+    with self._thumbnailCachesLock:
+      for thumbnailCache in self._thumbnailCaches.values():
+        thumbnailCache.compact()
+        thumbnailCache.close()
+      self._thumbnailCaches = {}
+
+  # Reprioritise icons when the view is resized
+  def resizeEvent(self, event):
+    super().resizeEvent(event)
+    self._scheduleIconPriorities()
 
   # Event filter for right click menu on images
   def eventFilter(self, source, event):
     if event.type() == QtCore.QEvent.ContextMenu:
-      item = source.itemAt(event.pos())
-      if item != None:
-        self._createImageMenu(event.globalPos(), item)
+      index = self.indexAt(event.pos())
+      if index.isValid():
+        self._createImageMenu(event.globalPos(), index)
       return True
     return False
   
+  # Get the icon for an image, queueing it to be loaded the first time it's shown
+  def _getIcon(self, image):
+    icon = self._imageIcons.get(image.absolutePath)
+    if icon != None:
+      return icon
+    # only asked for when the row is painted, so it's visible
+    if image.absolutePath not in self._pendingIcons:
+      self._pendingIcons.add(image.absolutePath)
+      self._iconQueue.put(image.absolutePath, image, 0)
+    return self._placeholderIcon
+  
+  # Update icon priorities soon
+  def _scheduleIconPriorities(self, *args):
+    if not self._iconPriorityTimer.isActive():
+      self._iconPriorityTimer.start(50)
+  
+  # Queue icons for the visible rows first and a page either side of them next,
+  # and drop any other queued icons as they're no longer anywhere near the view
+  # The visible rows' icons are pinned so they can't be evicted from the icon cache
+  def _updateIconPriorities(self):
+    priorities = {}
+    visible = self._visibleRows()
+    if visible != None:
+      first, last = visible
+      count = last - first + 1
+      for row in range(max(0, first - count), min(self._model.rowCount(), last + count + 1)):
+        image = self._model.image(self._model.index(row))
+        priority = 0 if first <= row <= last else 1
+        priorities[image.absolutePath] = priority
+        if not self._imageIcons.contains(image.absolutePath) and image.absolutePath not in self._pendingIcons:
+          self._pendingIcons.add(image.absolutePath)
+          self._iconQueue.put(image.absolutePath, image, priority)
+    
+    for key in self._iconQueue.retain(priorities):
+      self._pendingIcons.discard(key)
+    self._imageIcons.pin(key for key, priority in priorities.items() if priority == 0)
+  
+  # Get the (first, last) rows in the viewport, or None if there aren't any
+  def _visibleRows(self):
+    height = self.viewport().height()
+    # rows are laid out left to right then top to bottom, so their rects only ever move down
+    # and rows that haven't been laid out yet are after the viewport
+    first = self._firstRow(lambda rect: not rect.isValid() or rect.bottom() >= 0)
+    last = self._firstRow(lambda rect: not rect.isValid() or rect.top() > height) - 1
+    if last < first:
+      return None
+    return first, last
+  
+  # Binary search for the first row whose rect satisfies pred, or the row count if none do
+  def _firstRow(self, pred):
+    lo = 0
+    hi = self._model.rowCount()
+    while lo < hi:
+      mid = (lo + hi) // 2
+      if pred(self.visualRect(self._model.index(mid))):
+        hi = mid
+      else:
+        lo = mid + 1
+    return lo
+  
   # Wait for icon tasks and load the icon
   def _iconTask(self):
     while True:
-      (image, icon) = self._iconQueue.get()
-      # load file
-      icon.addFile(str(image.absolutePath))
-      # force refresh
-      self._imagesLock.acquire(True)
-      if image.fromRootDir in self._images:
-        self._images[image.fromRootDir].setIcon(icon)
-        self._images[image.fromRootDir].listWidget().update()
-      self._imagesLock.release()
-      # mark task as done
-      self._iconQueue.task_done()
-      # sleep so we don't block the main thread
-      time.sleep(0.001)
+      image = self._iconQueue.get()
+      if image == None:
+        return
+      # load thumbnail
+      with Stats.timed('loadThumbnail'):
+        thumbnail = self._loadThumbnail(image)
+      # hand it to the gui thread, only signalling when a new batch starts
+      with self._loadedLock:
+        self._loadedIcons.append((image, thumbnail))
+        first = len(self._loadedIcons) == 1
+      if first:
+        self._onIconsLoaded.emit()
+
+  # Load an image's thumbnail from the thumbnail cache, or from the file if it's not cached
+  # Runs on the icon thread so only uses QImage, not QPixmap or QIcon
+  def _loadThumbnail(self, image):
+    path = str(image.absolutePath)
+    try:
+      st = os.stat(path)
+    except OSError:
+      return QImage()
+    
+    thumbnailCache = self._getThumbnailCache(image)
+    data = thumbnailCache.get(path, st.st_size, st.st_mtime_ns)
+    if data != None:
+      # an empty thumbnail means the file couldn't be decoded last time
+      if len(data) == 0:
+        data.release()
+        return QImage()
+      thumbnail = QImage.fromData(self._wrapData(data))
+      data.release()
+      if not thumbnail.isNull():
+        Stats.count('thumbnailPackHits')
+        return thumbnail
+    Stats.count('thumbnailPackMisses')
+    
+    with Stats.timed('decode'):
+      return self._decodeThumbnail(path, st, thumbnailCache)
+
+  # Wrap a view into the thumbnail pack in a QByteArray for decoding without copying it
+  # The view has to stay alive until the decode is done
+  def _wrapData(self, data):
+    try:
+      return QByteArray.fromRawData(data)
+    except TypeError:
+      # older sip versions only take bytes for raw data
+      return bytes(data)
+
+  # Decode an image to a thumbnail and put it in the thumbnail cache
+  def _decodeThumbnail(self, path, st, thumbnailCache):
+    # decode straight to thumbnail size, for jpegs this skips most of the decoding work
+    reader = QImageReader(path)
+    reader.setAutoTransform(True)
+    size = reader.size()
+    if size.isValid() and (size.width() > self._iconSize or size.height() > self._iconSize):
+      size.scale(self._iconSize, self._iconSize, QtCore.Qt.KeepAspectRatio)
+      reader.setScaledSize(size)
+    thumbnail = reader.read()
+    if thumbnail.isNull():
+      # remember it so it isn't decoded again until the file changes
+      thumbnailCache.put(path, st.st_size, st.st_mtime_ns, b'')
+      return thumbnail
+    
+    # formats that can't decode scaled come back full size
+    if thumbnail.width() > self._iconSize or thumbnail.height() > self._iconSize:
+      thumbnail = thumbnail.scaled(self._iconSize, self._iconSize, QtCore.Qt.KeepAspectRatio,
+                                   QtCore.Qt.SmoothTransformation)
+    
+    # cache it encoded, keeping transparency if there is any
+    buffer = QBuffer()
+    buffer.open(QIODevice.WriteOnly)
+    thumbnail.save(buffer, 'PNG' if thumbnail.hasAlphaChannel() else 'JPG', 90)
+    thumbnailCache.put(path, st.st_size, st.st_mtime_ns, bytes(buffer.data()))
+    return thumbnail
+
+  # Get the thumbnail cache for an image's root directory, opening it the first time
+  def _getThumbnailCache(self, image):
+    with self._thumbnailCachesLock:
+      thumbnailCache = self._thumbnailCaches.get(image.rootDir)
+      if thumbnailCache == None:
+        thumbnailCache = ThumbnailCache(image.rootDir, self._iconSize)
+        self._thumbnailCaches[image.rootDir] = thumbnailCache
+      return thumbnailCache
+
+  # Pick up the icons the icon threads have loaded and update their rows
+  def _iconsLoaded(self):
+    with Stats.timed('iconsLoaded'):
+      self._addLoadedIcons()
+
+  # Make icons from the loaded thumbnails on the gui thread
+  def _addLoadedIcons(self):
+    with self._loadedLock:
+      loaded = self._loadedIcons
+      self._loadedIcons = []
+    
+    for image, thumbnail in loaded:
+      self._pendingIcons.discard(image.absolutePath)
+      icon = QIcon(QPixmap.fromImage(thumbnail)) if not thumbnail.isNull() else QIcon()
+      # failed loads are still cached so they aren't retried, at a nominal cost
+      cost = max(thumbnail.bytesPerLine() * thumbnail.height(), 64)
+      self._imageIcons.put(image.absolutePath, icon, cost)
+    self._model.updateImages([ image for image, _ in loaded ])
+
+  # Apply the filter to images
+  def _filterImages(self, images):
+    if self._filter == None:
+      return images
+    order, low, high = self._filter
+    return self._metadata.filter(images, order, low, high)
+
+  # Get the images for the selected rows
+  def _selectedImages(self):
+    return [ self._model.image(index) for index in self.selectedIndexes() ]
 
   # Create the 'background' menu for the category list
-  def _createImageMenu(self, pos, item):
+  def _createImageMenu(self, pos, index):
     menu = QMenu()
     
     # Main add action
@@ -130,8 +377,9 @@ class ImageList(QListWidget):
     menu.addAction(addCategoryAction)
   
     # Remove from current category
+    # virtual categories aren't in getCategories, their images can't be removed from them
     currentCategory = self._getCurrentCategory()
-    if currentCategory != 'All' and currentCategory != 'Uncategorised':
+    if currentCategory != 'All' and currentCategory != 'Uncategorised' and currentCategory in self._getCategories():
       removeCategoryAction = QAction(f'Remove from {currentCategory}')
       removeCategoryAction.triggered.connect(lambda _: self._contextRemoveImageCategory(currentCategory))
       menu.addAction(removeCategoryAction)
@@ -157,6 +405,21 @@ class ImageList(QListWidget):
     removeAction.triggered.connect(self._contextRemoveImage)
     menu.addAction(removeAction)
     
+    menu.addSeparator()
+    
+    moveAction = QAction('Move to folder...')
+    moveAction.triggered.connect(lambda _: self._contextFileOperation('move'))
+    menu.addAction(moveAction)
+    
+    copyAction = QAction('Copy to folder...')
+    copyAction.triggered.connect(lambda _: self._contextFileOperation('copy'))
+    menu.addAction(copyAction)
+    
+    if FileOperations.trashAvailable():
+      trashAction = QAction('Move to trash')
+      trashAction.triggered.connect(lambda _: self._contextFileOperation('trash'))
+      menu.addAction(trashAction)
+    
     deleteAction = QAction('Delete from disk')
     deleteAction.triggered.connect(self._contextDeleteImage)
     menu.addAction(deleteAction)
@@ -167,38 +430,31 @@ class ImageList(QListWidget):
   
   # Add the selected images to the given category
   def _contextAddImageCategory(self, category):
-    print(f'context adding image to category {category}')
-    selected = self.selectedItems()
-    for item in selected:
-      image = item.data(QtCore.Qt.UserRole)
-      if category == '':
-        category = Utils.promptCategoryName(self)
-        if category == None:
-          return
-      
-      self.onAddImageCategory.emit(image, category)
+    print(f'context adding images to category {category}')
+    images = self._selectedImages()
+    if len(images) == 0:
+      return
+    if category == '':
+      category = Utils.promptCategoryName(self)
+      if category == None:
+        return
+    self.onAddImagesCategory.emit(images, category)
   
   # Remove the selected images from the given category
   def _contextRemoveImageCategory(self, category):
-    selected = self.selectedItems()
-    for item in selected:
-      image = item.data(QtCore.Qt.UserRole)
-      self.onRemoveImageCategory.emit(image, category)
+    images = self._selectedImages()
+    if len(images) > 0:
+      self.onRemoveImagesCategory.emit(images, category)
 
-  # Remove an image from the index
+  # Remove the selected images from the index
   def _contextRemoveImage(self):
-    selected = self.selectedItems()
-    for item in selected:
-      image = item.data(QtCore.Qt.UserRole)
-      self.onRemoveImageIndex.emit(image)
+    images = self._selectedImages()
+    if len(images) > 0:
+      self.onRemoveImagesIndex.emit(images)
 
   # Actually delete an image
   def _contextDeleteImage(self):
-    selected = self.selectedItems()
-    toRemove = []
-    for item in selected:
-      image = item.data(QtCore.Qt.UserRole)
-      toRemove.append(image)
+    toRemove = self._selectedImages()
     
     msg = QMessageBox()
     msg.setIcon(QMessageBox.Warning)
@@ -207,16 +463,20 @@ class ImageList(QListWidget):
     msg.setWindowTitle('Warning')
 
     if msg.exec_() == QMessageBox.Ok:
-      print('actually deleting images')
-      for image in toRemove:
-        print(f'actually deleting image {image.name}')
-        try:
-          os.remove(str(image.absolutePath))
-        except Exception:
-          type, value, traceback = sys.exc_info()
-          print(f'got exception deleting image {image.name}: {value}')
-          pass
-        self.onRemoveImageIndex.emit(image)
+      print(f'deleting {len(toRemove)} images')
+      self.onFileOperation.emit('delete', toRemove, None)
+
+  # Trash, move or copy the selected images, prompting for the folder to move or copy them to
+  def _contextFileOperation(self, kind):
+    images = self._selectedImages()
+    if len(images) == 0:
+      return
+    destination = None
+    if kind in ('move', 'copy'):
+      destination = QFileDialog.getExistingDirectory(self, f'{kind.capitalize()} {len(images)} images to')
+      if destination == '':
+        return
+    self.onFileOperation.emit(kind, images, destination)
 
   # Open an image in the system default image viewer
   def _openImage(self, image):
@@ -226,6 +486,6 @@ class ImageList(QListWidget):
     subprocess.run([imageViewerFromCommandLine, str(image.absolutePath)])
 
   # Event handler for double click on image list
-  def _imageDoubleClick(self, item):
-    image = item.data(QtCore.Qt.UserRole)
+  def _imageDoubleClick(self, index):
+    image = self._model.image(index)
     self._openImage(image)
\ No newline at end of file
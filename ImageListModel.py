@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+from PyQt5 import QtCore
+from PyQt5.QtCore import ( QAbstractListModel, QModelIndex, QVariant )
+
+# The model behind the image list
+# Holds the images currently shown and only tells the view about the rows that change,
+# the view only asks for data (and so icons) for the rows it's actually showing
+class ImageListModel(QAbstractListModel):
+  def __init__(self, getIcon, iconSize):
+    super().__init__()
+
+    # getIcon(image) returns the icon to show for an image
+    self._getIcon = getIcon
+    self._sizeHint = QtCore.QSize(iconSize, iconSize+32)
+
+    # the images in the list in row order, and image -> row
+    # images are keyed by identity as images in different roots can have the same fromRootDir
+    self._images = []
+    self._rows = {}
+
+  # Number of rows
+  def rowCount(self, parent=QModelIndex()):
+    if parent.isValid():
+      return 0
+    return len(self._images)
+
+  # Data for a row
+  def data(self, index, role=QtCore.Qt.DisplayRole):
+    if not index.isValid() or index.row() >= len(self._images):
+      return QVariant()
+    image = self._images[index.row()]
+    if role == QtCore.Qt.DisplayRole:
+      return image.name
+    elif role == QtCore.Qt.DecorationRole:
+      return self._getIcon(image)
+    elif role == QtCore.Qt.SizeHintRole:
+      return self._sizeHint
+    elif role == QtCore.Qt.UserRole:
+      return image
+    return QVariant()
+
+  # Get the image for an index
+  def image(self, index):
+    return self._images[index.row()]
+
+  # Get the row of an image, or None if it isn't in the list
+  def row(self, image):
+    return self._rows.get(image)
+
+  # Set the images in the list, only removing and inserting the rows that differ
+  # New images are inserted where they are in images, one contiguous run at a time
+  # The list is reset if the images it keeps are in a different order to the ones given
+  def setImages(self, images):
+    images = list(dict.fromkeys(images))
+    keys = set(images)
+    kept = [ image for image in images if image in self._rows ]
+    keptKeys = set(kept)
+    inOrder = kept == [ image for image in self._images if image in keptKeys ]
+
+    # nothing in common, cheaper to just reset
+    if len(kept) == 0 or not inOrder:
+      self.beginResetModel()
+      self._images = list(images)
+      self._updateRows(0)
+      self.endResetModel()
+      return
+
+    self.removeImages([ image for image in self._images if image not in keys ])
+
+    # the rows left are images' kept ones in order, so each run of new images goes at its index in images
+    first = None
+    start = 0
+    while start < len(images):
+      if images[start] in keptKeys:
+        start += 1
+        continue
+      end = start
+      while end < len(images) and images[end] not in keptKeys:
+        end += 1
+      self.beginInsertRows(QModelIndex(), start, end - 1)
+      self._images[start:start] = images[start:end]
+      self.endInsertRows()
+      if first == None:
+        first = start
+      start = end
+    if first != None:
+      self._updateRows(first)
+
+  # Append images that aren't already in the list
+  def addImages(self, images):
+    new = []
+    newKeys = set()
+    for image in images:
+      if image not in self._rows and image not in newKeys:
+        new.append(image)
+        newKeys.add(image)
+    if len(new) == 0:
+      return
+    first = len(self._images)
+    self.beginInsertRows(QModelIndex(), first, first + len(new) - 1)
+    self._images.extend(new)
+    self._updateRows(first)
+    self.endInsertRows()
+
+  # Remove images from the list, one contiguous range at a time
+  def removeImages(self, images):
+    rows = sorted(set(self._rows[image] for image in images if image in self._rows))
+    if len(rows) == 0:
+      return
+
+    # group into ranges and remove from the end so earlier rows don't move
+    ranges = []
+    start = end = rows[0]
+    for row in rows[1:]:
+      if row == end + 1:
+        end = row
+      else:
+        ranges.append((start, end))
+        start = end = row
+    ranges.append((start, end))
+
+    for start, end in reversed(ranges):
+      self.beginRemoveRows(QModelIndex(), start, end)
+      for image in self._images[start:end+1]:
+        del self._rows[image]
+      del self._images[start:end+1]
+      self.endRemoveRows()
+    self._updateRows(rows[0])
+
+  # Tell the view that images' data (e.g. icons) has changed
+  def updateImages(self, images):
+    for image in images:
+      row = self._rows.get(image)
+      if row != None:
+        index = self.index(row)
+        self.dataChanged.emit(index, index)
+
+  # Remove all images
+  def clearImages(self):
+    self.beginResetModel()
+    self._images = []
+    self._rows = {}
+    self.endResetModel()
+
+  # Rebuild the row lookup from a given row onwards
+  def _updateRows(self, first):
+    if first == 0:
+      self._rows = {}
+    for row in range(first, len(self._images)):
+      self._rows[self._images[row]] = row
\ No newline at end of file
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import struct
+import bisect
+import threading
+
+import CachedValues
+import FileTypes
+import Stats
+
+# Image metadata read from file headers without decoding anything
+# A record is (width, height, format, date, orientation, size), with 0 or '' for anything unknown.
+# date is the exif capture date as a timestamp, or the file's mtime if there isn't one
+
+# The attribute cache kind records are stored under
+_metadataKind = 'metadata'
+
+# Number of files read per task sent to a reading thread
+_chunkSize = 64
+
+# Record fields
+WIDTH, HEIGHT, FORMAT, DATE, ORIENTATION, SIZE = range(6)
+
+# Read an image's metadata record, returns None if the file can't be read
+def readMetadata(path):
+  try:
+    st = os.stat(path)
+    with open(path, 'rb') as f:
+      header = f.read(256)
+      format = FileTypes.sniffHeader(header)
+      width, height, date, orientation = _readers.get(format, _readNothing)(f, header)
+  except (OSError, ValueError, IndexError, struct.error):
+    return None
+  if date == None:
+    date = st.st_mtime
+  return (width, height, format, int(date), orientation or 1, st.st_size)
+
+# Metadata for every image, with arrays of the images presorted by each sort order so sorting
+# or range filtering a category never needs to touch the files
+class MetadataIndex:
+  # Sort orders and the key each one sorts by
+  sortOrders = [ 'name', 'date', 'size', 'resolution' ]
+  _sortKeys = {
+    'name': lambda image, record: image.name.lower(),
+    'date': lambda image, record: record[DATE],
+    'size': lambda image, record: record[SIZE],
+    'resolution': lambda image, record: record[WIDTH] * record[HEIGHT],
+  }
+
+  def __init__(self, workers=8):
+    self._workers = workers
+    self._lock = threading.Lock()
+
+    # image -> record
+    self._records = {}
+
+    # sort order -> (images in order, their sort keys, image -> position), built when first needed
+    self._presorted = {}
+
+  # Get an image's record, or None if it hasn't been read
+  def get(self, image):
+    with self._lock:
+      return self._records.get(image)
+
+  # Forget images' records
+  def remove(self, images):
+    with self._lock:
+      for image in images:
+        self._records.pop(image, None)
+      self._presorted = {}
+
+  # Take records for images from their roots' attribute caches without checking they're still valid,
+  # so the index can be used straight away without touching the files
+  # getCache(image) returns the AttributeCache for an image's root
+  def loadCached(self, images, getCache):
+    records = {}
+    for cache, cacheImages in _byCache(images, getCache):
+      values = cache.getAll(_metadataKind)
+      for image in cacheImages:
+        value = values.get(image.fromRootDir)
+        if value != None:
+          records[image] = tuple(json.loads(value))
+    self._setRecords(records)
+    return len(records)
+
+  # Make sure images' records are up to date, reading the headers of any that aren't cached or
+  # whose size or mtime have changed on a pool of threads
+  # Returns the number of files read
+  def update(self, images, getCache):
+    with Stats.timed('readMetadata'):
+      values, read = CachedValues.getValues(images, getCache, _metadataKind, _readFiles, processes=False,
+                                            chunkSize=_chunkSize, workers=self._workers)
+    self._setRecords({ image: tuple(json.loads(value)) for image, value in values.items() })
+    Stats.count('metadataRead', read)
+    return read
+
+  # Sort images, images without records go at the end
+  def sort(self, images, order, reverse=False):
+    with self._lock:
+      sortedImages, keys, positions = self._getPresorted(order)
+    # a big share of the sorted images is quicker to pick out of the presorted array
+    if len(images) * 8 > len(sortedImages):
+      wanted = set(images)
+      result = [ image for image in sortedImages if image in wanted ]
+    else:
+      result = sorted((image for image in images if image in positions), key=positions.__getitem__)
+    if reverse:
+      result.reverse()
+    result.extend(image for image in images if image not in positions)
+    return result
+
+  # Keep the images whose sort key for an order is between low and high (either can be None)
+  def filter(self, images, order, low, high):
+    with self._lock:
+      sortedImages, keys, positions = self._getPresorted(order)
+    first = 0 if low == None else bisect.bisect_left(keys, low)
+    last = len(keys) if high == None else bisect.bisect_right(keys, high)
+    inRange = set(sortedImages[first:last])
+    return [ image for image in images if image in inRange ]
+
+  # Add records and throw away the presorted arrays
+  def _setRecords(self, records):
+    if len(records) > 0:
+      with self._lock:
+        self._records.update(records)
+        self._presorted = {}
+
+  # Get the presorted arrays for an order, call with the lock held
+  def _getPresorted(self, order):
+    presorted = self._presorted.get(order)
+    if presorted == None:
+      sortKey = self._sortKeys[order]
+      items = sorted(((sortKey(image, record), image) for image, record in self._records.items()), key=lambda item: item[0])
+      sortedImages = [ image for _, image in items ]
+      presorted = (sortedImages, [ key for key, _ in items ], { image: i for i, image in enumerate(sortedImages) })
+      self._presorted[order] = presorted
+    return presorted
+
+# Group images by their root's attribute cache
+def _byCache(images, getCache):
+  groups = {}
+  for image in images:
+    groups.setdefault(getCache(image), []).append(image)
+  return groups.items()
+
+# Read the metadata records of a list of files as they're stored, None for files that can't be read
+def _readFiles(paths):
+  records = [ readMetadata(path) for path in paths ]
+  return [ json.dumps(record) if record != None else None for record in records ]
+
+# Header readers, each takes the open file and its first 256 bytes and returns
+# (width, height, exif date or None, orientation or None)
+def _readNothing(f, header):
+  return 0, 0, None, None
+
+def _readJpeg(f, header):
+  width = height = 0
+  date = orientation = None
+  f.seek(2)
+  while True:
+    marker = f.read(2)
+    if len(marker) < 2 or marker[0] != 0xff:
+      break
+    code = marker[1]
+    # markers without a length
+    if code == 0xff:
+      f.seek(-1, os.SEEK_CUR)
+      continue
+    if code == 0x01 or 0xd0 <= code <= 0xd8:
+      continue
+    length = struct.unpack('>H', f.read(2))[0]
+    if length < 2:
+      break
+    if code == 0xe1 and date == None and orientation == None:
+      data = f.read(length - 2)
+      if data.startswith(b'Exif\x00\x00'):
+        _, _, date, orientation = _readExif(data[6:])
+    elif 0xc0 <= code <= 0xcf and code not in (0xc4, 0xc8, 0xcc):
+      # start of frame, has the dimensions and comes after the exif
+      height, width = struct.unpack('>xHH', f.read(5))
+      break
+    elif code == 0xda:
+      break
+    else:
+      f.seek(length - 2, os.SEEK_CUR)
+  return width, height, date, orientation
+
+def _readPng(f, header):
+  width, height = struct.unpack_from('>II', header, 16)
+  return width, height, None, None
+
+def _readGif(f, header):
+  width, height = struct.unpack_from('<HH', header, 6)
+  return width, height, None, None
+
+def _readBmp(f, header):
+  width, height = struct.unpack_from('<ii', header, 18)
+  return abs(width), abs(height), None, None
+
+def _readWebp(f, header):
+  chunk = header[12:16]
+  if chunk == b'VP8 ':
+    width, height = struct.unpack_from('<HH', header, 26)
+    return width & 0x3fff, height & 0x3fff, None, None
+  if chunk == b'VP8L':
+    bits = struct.unpack_from('<I', header, 21)[0]
+    return (bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1, None, None
+  if chunk == b'VP8X':
+    return 1 + int.from_bytes(header[24:27], 'little'), 1 + int.from_bytes(header[27:30], 'little'), None, None
+  return 0, 0, None, None
+
+def _readTiff(f, header):
+  f.seek(0)
+  return _readExif(f.read(256*1024))
+
+def _readIco(f, header):
+  return header[6] or 256, header[7] or 256, None, None
+
+def _readPnm(f, header):
+  # magic, width and height separated by whitespace, possibly with # comments between
+  tokens = []
+  for line in header.split(b'\n'):
+    tokens.extend(line.split(b'#', 1)[0].split())
+    if len(tokens) >= 3:
+      return int(tokens[1]), int(tokens[2]), None, None
+  return 0, 0, None, None
+
+_readers = {
+  'jpeg': _readJpeg, 'png': _readPng, 'gif': _readGif, 'bmp': _readBmp, 'webp': _readWebp,
+  'tiff': _readTiff, 'ico': _readIco, 'pnm': _readPnm,
+}
+
+# Read the dimensions, capture date and orientation from exif (or tiff) data
+def _readExif(data):
+  if data[:2] == b'II':
+    endian = '<'
+  elif data[:2] == b'MM':
+    endian = '>'
+  else:
+    return 0, 0, None, None
+  ifd0 = _readIfd(data, struct.unpack_from(endian + 'I', data, 4)[0], endian)
+  date = ifd0.get(0x132)
+  if 0x8769 in ifd0:
+    exif = _readIfd(data, ifd0[0x8769], endian)
+    date = exif.get(0x9003) or exif.get(0x9004) or date
+  return ifd0.get(0x100, 0), ifd0.get(0x101, 0), _parseDate(date), ifd0.get(0x112)
+
+# Read the short, long and ascii values from an ifd as tag -> value
+def _readIfd(data, offset, endian):
+  values = {}
+  count = struct.unpack_from(endian + 'H', data, offset)[0]
+  for i in range(count):
+    entry = offset + 2 + i * 12
+    if entry + 12 > len(data):
+      break
+    tag, type, valueCount = struct.unpack_from(endian + 'HHI', data, entry)
+    if type == 3:
+      values[tag] = struct.unpack_from(endian + 'H', data, entry + 8)[0]
+    elif type == 4:
+      values[tag] = struct.unpack_from(endian + 'I', data, entry + 8)[0]
+    elif type == 2:
+      start = entry + 8 if valueCount <= 4 else struct.unpack_from(endian + 'I', data, entry + 8)[0]
+      values[tag] = data[start:start+valueCount].rstrip(b'\x00').decode('ascii', 'replace')
+  return values
+
+# Parse an exif date, 'YYYY:MM:DD HH:MM:SS' in local time
+def _parseDate(value):
+  if not value:
+    return None
+  try:
+    return time.mktime(time.strptime(value[:19], '%Y:%m:%d %H:%M:%S'))
+  except (ValueError, OverflowError):
+    return None
\ No newline at end of file
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import threading
+
+# Stores the index as a json snapshot in the monitored folder plus an append-only journal
+# Every change is appended to config.journal as the changed image's new state, and saves only
+# rewrite config.json (keeping the previous one as config-2.json) once the journal gets big.
+# Journal records are whole image states rather than operations so replaying them over a
+# snapshot that already includes some of them is harmless, the last record for an image wins.
+class JsonStore:
+  def __init__(self, rootDir):
+    self._rootDir = rootDir
+
+    # configuration
+    self._syncTime = 0.5 # Seconds between journal fsyncs
+    self._minCompactBytes = 4*1024*1024 # Journal size before it's folded into the snapshot
+
+    self._journalLock = threading.Lock()
+    self._journal = None
+    self._syncTimer = None
+
+  # Whether there's an index to load
+  def exists(self):
+    return os.path.isfile(str(self.configFile()))
+
+  # Load the index, yields (fromRootDir, categories) for each image
+  # The snapshot is loaded then any journals are replayed over it
+  def load(self):
+    configPath = self.configFile().resolve()
+    images = {}
+    if os.path.isfile(str(configPath)):
+      with open(str(configPath), 'r') as f:
+        images = json.load(f)['images']
+    else:
+      print(f'no config file found at {str(configPath)}, starting from scratch')
+
+    # a rotated journal is left behind if we crashed while compacting
+    for journalPath in [ self.journalFile('-1'), self.journalFile() ]:
+      if os.path.isfile(str(journalPath)):
+        self._replay(journalPath, images)
+
+    for path, categories in images.items():
+      yield path, categories
+
+  # Append the new states of changed images to the journal, as (fromRootDir, categories)
+  # with categories None for removed images
+  def journal(self, states):
+    with self._journalLock:
+      if self._journal == None:
+        self._journal = open(str(self.journalFile()), 'a')
+      for path, categories in states:
+        if categories == None:
+          record = { 'p': str(path), 'r': 1 }
+        else:
+          record = { 'p': str(path), 'c': categories }
+        self._journal.write(json.dumps(record) + '\n')
+      self._setSyncTimer()
+
+  # Start a save, called with the index locked so nothing is journaled while it runs
+  # Returns whether the journal is big enough to be worth folding into a new snapshot, in which case
+  # it's rotated here and save needs the images as they are now, so the snapshot has everything the
+  # rotated journal does and anything journaled after this goes in the new one
+  def beginSave(self):
+    configPath = self.configFile().resolve()
+    journalPath = self.journalFile()
+    with self._journalLock:
+      if self._journal != None:
+        self._journal.flush()
+    journalSize = os.path.getsize(str(journalPath)) if os.path.isfile(str(journalPath)) else 0
+    snapshotSize = os.path.getsize(str(configPath)) if os.path.isfile(str(configPath)) else 0
+    if os.path.isfile(str(configPath)) and journalSize < max(self._minCompactBytes, snapshotSize // 4):
+      return False
+
+    # start a new journal, anything journaled from here on is replayed over the new snapshot
+    rotatedPath = self.journalFile('-1')
+    with self._journalLock:
+      if self._journal != None:
+        self._journal.close()
+        self._journal = None
+      if os.path.isfile(str(journalPath)):
+        if os.path.isfile(str(rotatedPath)):
+          with open(str(journalPath), 'r') as src, open(str(rotatedPath), 'a') as dst:
+            dst.write(src.read())
+          os.remove(str(journalPath))
+        else:
+          os.replace(str(journalPath), str(rotatedPath))
+    return True
+
+  # Save the index, the journal already has the changes so this only syncs it unless beginSave
+  # rotated it, then images (taken when it did) are written as the new snapshot
+  def save(self, images, changes):
+    self._sync()
+    if images == None:
+      return
+
+    # the rotated journal is all there is of some changes until the snapshot's written
+    configPath = self.configFile().resolve()
+    rotatedPath = self.journalFile('-1')
+    if os.path.isfile(str(rotatedPath)):
+      with open(str(rotatedPath), 'a') as f:
+        os.fsync(f.fileno())
+
+    # save backup as -2 first
+    if os.path.isfile(str(configPath)):
+      backupPath = self.configFile('-2').resolve()
+      print(f'saving old config file as {str(backupPath)}')
+      os.replace(str(configPath), str(backupPath))
+
+    print(f'saving config file to {str(configPath)}')
+    cfg = { 'images': {} }
+    for image in images:
+      cfg['images'][str(image.fromRootDir)] = image.categories
+    with open(str(configPath), 'w') as f:
+      json.dump(cfg, f)
+      f.flush()
+      os.fsync(f.fileno())
+
+    # the snapshot has everything the rotated journal did
+    if os.path.isfile(str(rotatedPath)):
+      os.remove(str(rotatedPath))
+
+  # Close the store
+  def close(self):
+    self._sync()
+    with self._journalLock:
+      if self._journal != None:
+        self._journal.close()
+        self._journal = None
+
+  # The config file path
+  def configFile(self, suffix=''):
+    return self._rootDir / f"config{suffix}.json"
+
+  # The journal file path
+  def journalFile(self, suffix=''):
+    return self._rootDir / f"config.journal{suffix}"
+
+  # Replay a journal over a dict of fromRootDir -> categories
+  def _replay(self, journalPath, images):
+    count = 0
+    with open(str(journalPath), 'r') as f:
+      for line in f:
+        try:
+          record = json.loads(line)
+        except ValueError:
+          # torn write at the end of the journal
+          type, value, traceback = sys.exc_info()
+          print(f'skipping bad journal record in {str(journalPath)}: {value}')
+          continue
+        if 'r' in record:
+          images.pop(record['p'], None)
+        else:
+          images[record['p']] = record['c']
+        count += 1
+    print(f'replayed {count} journal records from {str(journalPath)}')
+
+  # Set a timer to fsync the journal if there isn't one already, so bursts of changes share one fsync
+  def _setSyncTimer(self):
+    if self._syncTimer == None:
+      self._syncTimer = threading.Timer(self._syncTime, self._sync)
+      self._syncTimer.daemon = True
+      self._syncTimer.start()
+
+  # Flush and fsync the journal
+  def _sync(self):
+    with self._journalLock:
+      if self._syncTimer != None:
+        self._syncTimer.cancel()
+        self._syncTimer = None
+      if self._journal != None:
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
\ No newline at end of file
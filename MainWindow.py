@@ -1,20 +1,92 @@
 # -*- coding: utf-8 -*-
 
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5 import QtCore
+from PyQt5.QtCore import ( QSettings, QTimer, pyqtSignal )
 from PyQt5.QtWidgets import ( QMainWindow, QWidget, QDesktopWidget, QAction
-                            , QHBoxLayout )
+                            , QHBoxLayout, QVBoxLayout, QInputDialog, QLabel, QLineEdit, QProgressBar, QProgressDialog )
 
 from ImageList import ImageList
 from CategoryList import CategoryList
-from DirectoryMonitor import DirectoryMonitor
-
-# Todo: instead of having refreshUI just have the directory monitor tell us when there's new files and stuff
+from MonitorGroup import MonitorGroup
+from DirectoryWatcher import DirectoryWatcher
+from StatsDock import StatsDock
+from SortFilterBar import SortFilterBar
+from ImageMetadata import MetadataIndex
+from FileOperations import FileOperation
+import CategoryQuery
+import DuplicateFinder
+import Suggestions
+import Utils
+import Stats
 
 # The main window
 class MainWindow(QMainWindow):
-  def __init__(self, testDirectory):
+  # Signal triggered from a scan thread when a root has been refreshed (monitor, added, removed)
+  _onRootRefreshed = pyqtSignal(object, list, list)
+  
+  # Signal triggered from a scan thread with a batch of images loaded or found while refreshing
+  # (monitor, added, removed, directories scanned or None while loading)
+  _onRootProgress = pyqtSignal(object, list, list, object)
+  
+  # Signal triggered from the duplicate finder thread with the groups of duplicates it found
+  _onDuplicatesFound = pyqtSignal(list)
+  
+  # Signal triggered from the suggestion thread with the suggested categories (category -> images)
+  _onSuggestionsFound = pyqtSignal(dict)
+  
+  # Signal triggered from the metadata thread when images' metadata has been read
+  _onMetadataUpdated = pyqtSignal()
+  
+  # Signals triggered from the file operation thread with its progress (done, total),
+  # and when it's finished and applied to the index (operation, removed, added)
+  _onFileOperationProgress = pyqtSignal(int, int)
+  _onFileOperationDone = pyqtSignal(object, list, list)
+  
+  # Signal triggered from a scan thread with the images it found had been moved or renamed
+  # as (old image, new image)s, the new images already have the old ones' categories
+  _onImagesMoved = pyqtSignal(list)
+  
+  def __init__(self, directories, storage=None, include=None, exclude=None, matchContents=False):
     super().__init__()
     
-    self._fileWatcher = DirectoryMonitor(testDirectory)
+    # indexes are loaded on the scan threads so the window can show straight away
+    self._fileWatcher = MonitorGroup(directories, storage, False, include, exclude, matchContents)
+    
+    # refresh progress for each root being refreshed, monitor -> [images loaded, folders scanned, images found]
+    self._refreshProgress = {}
+    
+    # a directory watcher for each root, started once the root's first scan is done
+    self._directoryWatchers = {}
+    
+    # Virtual categories, name -> function returning the category's images
+    # They're shown in the category list but aren't stored in the index
+    self._virtualCategories = {}
+    self._findingDuplicates = False
+    self._suggesting = False
+    
+    # Header metadata for sorting and filtering, read one job at a time on its own thread
+    # (each job reads files on the index's own pool)
+    self._metadata = MetadataIndex()
+    self._metadataPool = ThreadPoolExecutor(max_workers=1)
+    
+    # The file operation running and its progress dialog, only one runs at a time
+    self._fileOperation = None
+    self._fileOperationDialog = None
+    
+    # ui refreshes requested during one event loop iteration are done once at the end of it
+    self._refreshTimer = QTimer(self)
+    self._refreshTimer.setSingleShot(True)
+    self._refreshTimer.timeout.connect(self.refreshUI)
+    
+    # Saved category queries, virtual category name -> query text
+    self._settings = QSettings('ImageCategoriser', 'ImageCategoriser')
+    self._queries = {}
+    for text in self._settings.value('queries', [], type=list):
+      self._addQuery(text)
     
     # create the qt gui
     self._initUI()
@@ -29,6 +101,26 @@ class MainWindow(QMainWindow):
     refreshAction.triggered.connect(self._fullRefresh)
     fileMenu.addAction(refreshAction)
     
+    viewMenu = menubar.addMenu('View')
+    
+    toolsMenu = menubar.addMenu('Tools')
+    
+    findDuplicatesAction = QAction('Find duplicates', self)
+    findDuplicatesAction.triggered.connect(self._findDuplicates)
+    toolsMenu.addAction(findDuplicatesAction)
+    
+    suggestAction = QAction('Suggest categories', self)
+    suggestAction.triggered.connect(self._suggestCategories)
+    toolsMenu.addAction(suggestAction)
+    
+    acceptSuggestionsAction = QAction('Accept suggestions', self)
+    acceptSuggestionsAction.triggered.connect(self._acceptSuggestions)
+    toolsMenu.addAction(acceptSuggestionsAction)
+    
+    newQueryAction = QAction('New query...', self)
+    newQueryAction.triggered.connect(self._newQuery)
+    toolsMenu.addAction(newQueryAction)
+    
     # Main widget
     wid = QWidget(self)
     self.setCentralWidget(wid)
@@ -47,11 +139,33 @@ class MainWindow(QMainWindow):
     # Images
     getCategories = lambda: self._fileWatcher.getCategories()
     getCurrentCategory = lambda: self._categoryList._currentCategory
-    self._imageList = ImageList(getCategories, getCurrentCategory)
-    self._imageList.onAddImageCategory.connect(self._addImageCategory)
-    self._imageList.onRemoveImageCategory.connect(self._removeImageCategory)
-    self._imageList.onRemoveImageIndex.connect(self._removeImageIndex)
-    layout.addWidget(self._imageList)
+    imagesLayout = QVBoxLayout()
+    layout.addLayout(imagesLayout)
+    
+    # Search, narrows down the current category to the images whose paths contain the text
+    self._searchBox = QLineEdit()
+    self._searchBox.setPlaceholderText('Search file names')
+    self._searchBox.setClearButtonEnabled(True)
+    self._searchBox.textChanged.connect(self._scheduleRefreshUI)
+    imagesLayout.addWidget(self._searchBox)
+    
+    self._sortFilterBar = SortFilterBar()
+    self._sortFilterBar.onSortChanged.connect(self._sortChanged)
+    self._sortFilterBar.onFilterChanged.connect(self._filterChanged)
+    imagesLayout.addWidget(self._sortFilterBar)
+    
+    self._imageList = ImageList(getCategories, getCurrentCategory, metadata=self._metadata)
+    self._imageList.onAddImagesCategory.connect(self._addImagesCategory)
+    self._imageList.onRemoveImagesCategory.connect(self._removeImagesCategory)
+    self._imageList.onRemoveImagesIndex.connect(self._removeImagesIndex)
+    self._imageList.onFileOperation.connect(self._startFileOperation)
+    imagesLayout.addWidget(self._imageList)
+    
+    # Stats, hidden until it's asked for
+    self._statsDock = StatsDock(self._getStatsGauges)
+    self.addDockWidget(QtCore.Qt.RightDockWidgetArea, self._statsDock)
+    self._statsDock.hide()
+    viewMenu.addAction(self._statsDock.toggleViewAction())
     
     # Window position and size
     self.resize(800, 600)
@@ -59,29 +173,72 @@ class MainWindow(QMainWindow):
     self.setWindowTitle('Img')
     self.show()
     
-    # Refresh
-    self._fileWatcher.refresh()
+    # Refresh progress
+    self._progressLabel = QLabel()
+    self._progressBar = QProgressBar()
+    self._progressBar.setRange(0, 0)
+    self._progressBar.setMaximumWidth(120)
+    self.statusBar().addPermanentWidget(self._progressLabel)
+    self.statusBar().addPermanentWidget(self._progressBar)
+    self._progressLabel.hide()
+    self._progressBar.hide()
+    
+    # Show the window straight away, then load and scan every root at once in the background,
+    # showing the saved index as it loads and new images as they're found
     self.refreshUI()
+    self._onRootRefreshed.connect(self._rootRefreshed)
+    self._onRootProgress.connect(self._rootProgress)
+    self._onDuplicatesFound.connect(self._duplicatesFound)
+    self._onSuggestionsFound.connect(self._suggestionsFound)
+    self._onMetadataUpdated.connect(self._metadataUpdated)
+    self._onFileOperationProgress.connect(self._fileOperationProgress)
+    self._onFileOperationDone.connect(self._fileOperationDone)
+    self._onImagesMoved.connect(self._imagesMoved)
+    self._fileWatcher.addMoveListener(self._onImagesMoved.emit)
+    self._refreshAsync()
   
   # Call on exit so we can clean up and save settings
   def exiting(self):
+    for directoryWatcher in self._directoryWatchers.values():
+      directoryWatcher.stop()
+    self._imageList.exiting()
+    self._metadataPool.shutdown(wait=False)
     self._fileWatcher.save()
+    self._fileWatcher.close()
 
   # Refresh the ui categories and files based on fileWatcher and the current category
   def refreshUI(self):
+    with Stats.timed('refreshUI'):
+      self._refreshUI()
+
+  # Refresh the ui now
+  def _refreshUI(self):
+    self._refreshTimer.stop()
+    
     # Category list
     categories = self._fileWatcher.getCategories()
     
-    # Add categories if not added already
+    # Add categories if not added already, and remove any that have gone
     for category in categories:
       self._categoryList.addCategory(category)
+    for category in self._virtualCategories:
+      self._categoryList.addCategory(category, virtual=True)
+    self._categoryList.retainCategories(categories + list(self._virtualCategories))
   
-    # Clear the existing images from the view
-    self._imageList.clearImages()
-    
-    # Get the current category's images and add them to the ui
-    for image in self._fileWatcher.getCategory(self._categoryList._currentCategory):
-      self._imageList.addImage(image)
+    # Show the current category's images, only the rows that have changed are updated
+    self._imageList.setImages(self._getShownImages())
+
+  # Extra values for the stats dock
+  def _getStatsGauges(self):
+    iconCacheStats = self._imageList.getIconCacheStats()
+    return {
+      'images': self._fileWatcher.getCategoryCount('All'),
+      'icon queue depth': self._imageList.getIconQueueDepth(),
+      'icon cache hit rate': f'{iconCacheStats["hitRate"]*100:.1f}%',
+      'icon cache entries': iconCacheStats['entries'],
+      'icon cache MB': f'{iconCacheStats["bytes"]/(1024*1024):.1f}',
+      'icon cache evictions': iconCacheStats['evictions'],
+    }
 
   # Center the window on the screen
   def _centerWindow(self):
@@ -90,36 +247,338 @@ class MainWindow(QMainWindow):
     qr.moveCenter(cp)
     self.move(qr.topLeft())
 
-  # Refresh the files, then the ui
+  # Get the images in a stored or virtual category
+  def _getCategoryImages(self, category):
+    getImages = self._virtualCategories.get(category)
+    if getImages == None:
+      return self._fileWatcher.getCategory(category)
+    return getImages()
+
+  # Get the images in the current category that match the search
+  def _getShownImages(self):
+    category = self._categoryList._currentCategory
+    text = self._searchBox.text().strip()
+    if text == '':
+      return self._getCategoryImages(category)
+    
+    # the search results are usually the smaller side, so filter them rather than the category
+    found = self._fileWatcher.search(text)
+    if category == 'All':
+      return found
+    if category == 'Uncategorised':
+      return [ image for image in found if not image.isCategorised() ]
+    if category not in self._virtualCategories:
+      return [ image for image in found if image.hasCategory(category) ]
+    found = set(found)
+    return [ image for image in self._getCategoryImages(category) if image in found ]
+
+  # Add or replace a virtual category
+  def _setVirtualCategory(self, name, getImages):
+    self._virtualCategories[name] = getImages
+    self._scheduleRefreshUI()
+
+  # Refresh the ui once control gets back to the event loop, however many times this is called before then
+  def _scheduleRefreshUI(self):
+    if not self._refreshTimer.isActive():
+      self._refreshTimer.start(0)
+
+  # Refresh the files in the background, the ui is updated as each root finishes
   def _fullRefresh(self):
-    self._fileWatcher.refresh()
-    self.refreshUI()
+    self._refreshAsync(True)
+
+  # Refresh every root in the background showing progress
+  def _refreshAsync(self, full=False):
+    for monitor in self._fileWatcher.getMonitors():
+      self._refreshProgress[monitor] = [ 0, 0, 0 ]
+    self._updateProgress()
+    self._fileWatcher.refreshAsync(self._onRootRefreshed.emit, full, self._onRootProgress.emit)
+
+  # Show a batch of images loaded from a root's index or found by its scan
+  def _rootProgress(self, monitor, added, removed, dirsScanned):
+    progress = self._refreshProgress.get(monitor)
+    if dirsScanned == None:
+      # loaded images can be in any category, and can bring new categories with them
+      if progress != None:
+        progress[0] += len(added)
+      self._scheduleRefreshUI()
+    else:
+      if progress != None:
+        progress[1] = dirsScanned
+        progress[2] += len(added)
+      self._imagesRemoved(removed)
+      self._imagesAdded(added)
+    self._updateProgress()
+
+  # Show the refresh progress in the status bar, or hide it if nothing's being refreshed
+  def _updateProgress(self):
+    if len(self._refreshProgress) == 0:
+      self._progressLabel.hide()
+      self._progressBar.hide()
+      return
+    loaded = sum(progress[0] for progress in self._refreshProgress.values())
+    dirsScanned = sum(progress[1] for progress in self._refreshProgress.values())
+    found = sum(progress[2] for progress in self._refreshProgress.values())
+    self._progressLabel.setText(f'Refreshing {len(self._refreshProgress)} folders: {loaded} images loaded, '
+                                f'{dirsScanned} folders scanned, {found} new images')
+    self._progressLabel.show()
+    self._progressBar.show()
+
+  # Apply a root's refresh to the ui and start watching it for changes if we aren't already
+  def _rootRefreshed(self, monitor, added, removed):
+    self._refreshProgress.pop(monitor, None)
+    self._updateProgress()
+    # the index has finished loading, and batches streamed so far may have missed categories
+    self._scheduleRefreshUI()
+    self._imagesRemoved(removed)
+    self._imagesAdded(added)
+    self._updateMetadata(monitor.getCategory('All'), True)
+    
+    if monitor not in self._directoryWatchers:
+      directoryWatcher = DirectoryWatcher(self._fileWatcher, monitor)
+      directoryWatcher.onImagesAdded.connect(self._imagesAdded)
+      directoryWatcher.onImagesAdded.connect(self._updateMetadata)
+      directoryWatcher.onImagesRemoved.connect(self._imagesRemoved)
+      directoryWatcher.onImagesChanged.connect(self._imagesChanged)
+      self._directoryWatchers[monitor] = directoryWatcher
+
+  # Read images' metadata in the background, taking what's cached first if loadCached is set
+  def _updateMetadata(self, images, loadCached=False):
+    self._metadataPool.submit(self._updateMetadataTask, images, loadCached)
+  
+  # Metadata thread
+  def _updateMetadataTask(self, images, loadCached):
+    try:
+      if loadCached:
+        # cached records are shown straight away, then checked against the files
+        self._metadata.loadCached(images, self._fileWatcher.getAttributeCache)
+        self._onMetadataUpdated.emit()
+      self._metadata.update(images, self._fileWatcher.getAttributeCache)
+    except Exception:
+      type, value, traceback = sys.exc_info()
+      print(f'got exception reading metadata: {value}')
+    self._onMetadataUpdated.emit()
+  
+  # Re-sort and filter the images shown when there's new metadata
+  def _metadataUpdated(self):
+    if self._imageList.isArranged():
+      self._scheduleRefreshUI()
+  
+  # Sort the images shown
+  def _sortChanged(self, order, descending):
+    self._imageList.setSortOrder(order, descending)
+    self._scheduleRefreshUI()
+  
+  # Filter the images shown
+  def _filterChanged(self, order, low, high):
+    self._imageList.setFilter(order, low, high)
+    self._scheduleRefreshUI()
 
   # Refresh the ui when the category changes
   def _showCategory(self, cat):
-    self.refreshUI()
+    self._scheduleRefreshUI()
   
   # Rename a category
   def _renameCategory(self, old, new):
-    self._fileWatcher.renameCategory(old, new)
-    self.refreshUI()
+    if not self._fileWatcher.renameCategory(old, new):
+      Utils.warningBox(f'There\'s already a category called {new}')
+      return
+    self._scheduleRefreshUI()
   
   # Delete a category
   def _removeCategory(self, category):
-    self._fileWatcher.removeCategory(category)
-    self.refreshUI()
+    if category in self._virtualCategories:
+      del self._virtualCategories[category]
+      if category in self._queries:
+        del self._queries[category]
+        self._settings.setValue('queries', list(self._queries.values()))
+    else:
+      self._fileWatcher.removeCategory(category)
+    self._scheduleRefreshUI()
   
-  # Add an image to a category
-  def _addImageCategory(self, image, category):
-    self._fileWatcher.addImageCategory(image, category)
-    self.refreshUI()
+  # Find duplicate images across every root in the background
+  def _findDuplicates(self):
+    if not DuplicateFinder.available():
+      Utils.warningBox('Finding duplicates needs numpy to be installed')
+      return
+    if self._findingDuplicates:
+      return
+    self._findingDuplicates = True
+    self.statusBar().showMessage('Finding duplicates...')
+    images = self._fileWatcher.getCategory('All')
+    threading.Thread(target=self._findDuplicatesTask, args=(images,), daemon=True).start()
   
-  # Remove an image from a category
-  def _removeImageCategory(self, image, category):
-    self._fileWatcher.removeImageCategory(image, category)
-    self.refreshUI()
+  # Duplicate finder thread
+  def _findDuplicatesTask(self, images):
+    try:
+      groups = DuplicateFinder.findDuplicates(images, self._fileWatcher.getAttributeCache)
+    except Exception:
+      type, value, traceback = sys.exc_info()
+      print(f'got exception finding duplicates: {value}')
+      groups = []
+    self._onDuplicatesFound.emit(groups)
+  
+  # Show the duplicates found as a virtual category, each group's images next to each other
+  def _duplicatesFound(self, groups):
+    self._findingDuplicates = False
+    self.statusBar().showMessage(f'Found {len(groups)} groups of duplicates', 5000)
+    duplicates = [ image for group in groups for image in group ]
+    # images can be removed after they're found
+    self._setVirtualCategory('Duplicates', lambda: [ image for image in duplicates if self._fileWatcher.hasImage(image) ])
+  
+  # Suggest categories for uncategorised images in the background
+  def _suggestCategories(self):
+    if not Suggestions.available():
+      Utils.warningBox('Suggesting categories needs numpy to be installed')
+      return
+    if self._suggesting:
+      return
+    self._suggesting = True
+    self.statusBar().showMessage('Suggesting categories...')
+    images = self._fileWatcher.getCategory('All')
+    threading.Thread(target=self._suggestCategoriesTask, args=(images,), daemon=True).start()
+  
+  # Suggestion thread
+  def _suggestCategoriesTask(self, images):
+    try:
+      suggestions = Suggestions.suggestCategories(images, self._fileWatcher.getAttributeCache)
+    except Exception:
+      type, value, traceback = sys.exc_info()
+      print(f'got exception suggesting categories: {value}')
+      suggestions = {}
+    self._onSuggestionsFound.emit(suggestions)
+  
+  # Show each suggested category as a virtual category, replacing the last suggestions
+  def _suggestionsFound(self, suggestions):
+    self._suggesting = False
+    self.statusBar().showMessage(f'Suggested categories for {sum(len(images) for images in suggestions.values())} images', 5000)
+    for name in [ name for name in self._virtualCategories if name.startswith('Suggested: ') ]:
+      del self._virtualCategories[name]
+    for category, images in suggestions.items():
+      self._setVirtualCategory(f'Suggested: {category}', self._suggestedImages(images))
+    self._scheduleRefreshUI()
+  
+  # Get the images from a suggestion that are still uncategorised, as a function for a virtual category
+  def _suggestedImages(self, images):
+    return lambda: [ image for image in images if not image.isCategorised() and self._fileWatcher.hasImage(image) ]
+  
+  # Add every image in the suggested category being shown to the category that was suggested
+  # To accept some of them, select them and add them to the category instead
+  def _acceptSuggestions(self):
+    name = self._categoryList._currentCategory
+    if name == None or not name.startswith('Suggested: ') or name not in self._virtualCategories:
+      Utils.warningBox('Show one of the suggested categories to accept its suggestions')
+      return
+    self._addImagesCategory(self._getCategoryImages(name), name[len('Suggested: '):])
+  
+  # Prompt for a category query and save it as a virtual category
+  def _newQuery(self):
+    text, ok = QInputDialog.getText(self, 'New query', 'Categories to show, e.g. cats and (dogs or birds) and not "blurry photos"')
+    if not ok or text.strip() == '':
+      return
+    try:
+      CategoryQuery.parse(text)
+    except ValueError:
+      type, value, traceback = sys.exc_info()
+      Utils.warningBox(f'Invalid query: {value}')
+      return
+    self._addQuery(text.strip())
+    self._settings.setValue('queries', list(self._queries.values()))
+  
+  # Show a query as a virtual category
+  def _addQuery(self, text):
+    name = f'Query: {text}'
+    self._queries[name] = text
+    self._setVirtualCategory(name, lambda: self._fileWatcher.query(text))
+  
+  # Add images to a category
+  def _addImagesCategory(self, images, category):
+    self._fileWatcher.addImagesCategory(images, category)
+    self._scheduleRefreshUI()
+  
+  # Remove images from a category
+  def _removeImagesCategory(self, images, category):
+    self._fileWatcher.removeImagesCategory(images, category)
+    self._scheduleRefreshUI()
+  
+  # Remove images from the index
+  def _removeImagesIndex(self, images):
+    self._fileWatcher.removeImages(images)
+    self._scheduleRefreshUI()
+  
+  # Delete, trash, move or copy images in the background, see FileOperations
+  def _startFileOperation(self, kind, images, destination):
+    if self._fileOperation != None:
+      Utils.warningBox('Wait for the current file operation to finish first')
+      return
+    self._fileOperation = FileOperation(kind, images, destination)
+    
+    self._fileOperationDialog = QProgressDialog(f'{kind.capitalize()} {len(images)} images...', 'Cancel', 0, len(images), self)
+    self._fileOperationDialog.setWindowTitle('Files')
+    self._fileOperationDialog.setMinimumDuration(500)
+    self._fileOperationDialog.setAutoClose(False)
+    self._fileOperationDialog.setAutoReset(False)
+    self._fileOperationDialog.canceled.connect(self._fileOperation.cancel)
+    
+    threading.Thread(target=self._fileOperationTask, args=(self._fileOperation,), daemon=True).start()
+  
+  # File operation thread, the index is only changed once every file is done
+  def _fileOperationTask(self, operation):
+    removed = []
+    added = []
+    try:
+      operation.run(self._onFileOperationProgress.emit)
+      removed, added = self._fileWatcher.applyFileOperation(operation)
+    except Exception:
+      type, value, traceback = sys.exc_info()
+      print(f'got exception doing {operation.kind}: {value}')
+    self._onFileOperationDone.emit(operation, removed, added)
+  
+  # Show a file operation's progress
+  def _fileOperationProgress(self, done, total):
+    if self._fileOperationDialog != None and not self._fileOperationDialog.wasCanceled():
+      self._fileOperationDialog.setValue(done)
+  
+  # Show the result of a file operation
+  def _fileOperationDone(self, operation, removed, added):
+    self._fileOperationDialog.close()
+    self._fileOperationDialog = None
+    self._fileOperation = None
+    
+    self._metadata.remove(removed)
+    self._updateMetadata(added)
+    self._scheduleRefreshUI()
+    
+    self.statusBar().showMessage(f'{operation.kind.capitalize()}: {len(operation.completed)} of {len(operation.images)} images done'
+                                 f'{", cancelled" if operation.isCancelled() else ""}', 5000)
+    if len(operation.failed) > 0:
+      failures = '<br>'.join(f'{image.name}: {error}' for image, error in operation.failed[:10])
+      more = f'<br>and {len(operation.failed) - 10} more' if len(operation.failed) > 10 else ''
+      Utils.warningBox(f'{len(operation.failed)} images couldn\'t be done:<br>{failures}{more}')
+  
+  # Add images the directory watcher found if they're in the current category
+  def _imagesAdded(self, images):
+    # new images are uncategorised unless they've been moved from somewhere else in the root
+    category = self._categoryList._currentCategory
+    if self._searchBox.text().strip() != '' or category in self._virtualCategories:
+      # the next refresh picks up any that should be shown
+      self._scheduleRefreshUI()
+    elif category == 'All':
+      self._imageList.addImages(images)
+    elif category == 'Uncategorised':
+      self._imageList.addImages([ image for image in images if not image.isCategorised() ])
+    else:
+      self._imageList.addImages([ image for image in images if image.hasCategory(category) ])
+  
+  # Keep the thumbnails of images that have been moved or renamed
+  def _imagesMoved(self, moves):
+    self._imageList.moveImages(moves)
+  
+  # Remove images the directory watcher found were deleted
+  def _imagesRemoved(self, images):
+    self._imageList.removeImages(images)
+    self._metadata.remove(images)
   
-  # Remove an image from the index
-  def _removeImageIndex(self, image):
-    self._fileWatcher.removeImage(image)
-    self.refreshUI()
\ No newline at end of file
+  # Reload images the directory watcher found were changed
+  def _imagesChanged(self, images):
+    self._imageList.reloadImages(images)
+    self._updateMetadata(images)
\ No newline at end of file
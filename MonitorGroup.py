@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+
+import sys
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from DirectoryMonitor import DirectoryMonitor
+import CategoryQuery
+
+# A set of monitored folders presented as one
+# Each root has its own DirectoryMonitor (and so its own index and config), categories are merged
+# by name and changes to images are passed on to the monitor for the image's root
+class MonitorGroup:
+  # Pass load=False to load each root's index on its scan thread the first time it's refreshed
+  # include and exclude are glob patterns for files to index or skip in every root
+  # matchContents also detects moved files by their contents, see DirectoryMonitor
+  def __init__(self, dirs, storage=None, load=True, include=None, exclude=None, matchContents=False):
+    self._monitors = [ DirectoryMonitor(dir, storage, load, include, exclude, matchContents) for dir in dirs ]
+    self._monitorsByRoot = { monitor.getRootDir(): monitor for monitor in self._monitors }
+
+    # a scan thread of its own for each root, so queued refreshes and rescans of a slow root wait
+    # behind that root's scan rather than taking the threads the other roots need
+    self._scanPools = { monitor: ThreadPoolExecutor(max_workers=1, thread_name_prefix='scan') for monitor in self._monitors }
+
+  # Get the monitors
+  def getMonitors(self):
+    return list(self._monitors)
+
+  # Save every root
+  def save(self):
+    for monitor in self._monitors:
+      monitor.save()
+
+  # Close every root
+  def close(self):
+    for scanPool in self._scanPools.values():
+      scanPool.shutdown(wait=False)
+    for monitor in self._monitors:
+      monitor.close()
+
+  # Refresh every root at once, waiting for them all
+  # Returns the combined delta as (added, removed) lists of images
+  def refresh(self, full=False):
+    added = []
+    removed = []
+    for future in [ self._scanPools[monitor].submit(monitor.refresh, full) for monitor in self._monitors ]:
+      rootAdded, rootRemoved = future.result()
+      added.extend(rootAdded)
+      removed.extend(rootRemoved)
+    return added, removed
+
+  # Refresh every root at once in the background, loading their indexes first if they haven't been
+  # onRefreshed(monitor, added, removed) is called on the scan thread as each root finishes with its whole delta
+  # onProgress(monitor, added, removed, dirsScanned) is called on the scan thread with batches of images
+  # as they're loaded (with dirsScanned None) and then as they're found by the scan
+  def refreshAsync(self, onRefreshed, full=False, onProgress=None):
+    for monitor in self._monitors:
+      self._scanPools[monitor].submit(self._refreshRoot, monitor, onRefreshed, full, onProgress)
+
+  # Rescan some directories of one root in the background, see DirectoryMonitor.refreshDirs, or refresh
+  # it incrementally if relDirs is None
+  # onRefreshed(added, removed, changed) is called on the scan thread with the delta
+  def refreshDirsAsync(self, monitor, relDirs, onRefreshed):
+    self._scanPools[monitor].submit(self._refreshDirs, monitor, relDirs, onRefreshed)
+
+  # Call listener(moves) on the scanning thread with the (old image, new image)s moved or renamed
+  # within any root, see DirectoryMonitor.addMoveListener
+  def addMoveListener(self, listener):
+    for monitor in self._monitors:
+      monitor.addMoveListener(listener)
+
+  # Get the merged list of categories
+  def getCategories(self):
+    categories = set()
+    for monitor in self._monitors:
+      categories.update(monitor.getCategories())
+    categories.discard('Uncategorised')
+    categories.discard('All')
+    return [ 'Uncategorised', 'All' ] + sorted(categories)
+
+  # Get all the images in a category across every root
+  def getCategory(self, category):
+    images = []
+    for monitor in self._monitors:
+      images.extend(monitor.getCategory(category))
+    return images
+
+  # Get the images matching a category query across every root, see CategoryQuery
+  # Raises ValueError if the query is malformed
+  def query(self, text):
+    query = CategoryQuery.parse(text)
+    images = []
+    for monitor in self._monitors:
+      images.extend(monitor.query(query))
+    return images
+
+  # Get the images whose path from their root contains text across every root, ignoring case
+  def search(self, text):
+    images = []
+    for monitor in self._monitors:
+      images.extend(monitor.search(text))
+    return images
+
+  # Get the number of images in a category across every root
+  def getCategoryCount(self, category):
+    return sum(monitor.getCategoryCount(category) for monitor in self._monitors)
+
+  # Get the attribute cache for an image's root
+  def getAttributeCache(self, image):
+    return self._monitorsByRoot[image.rootDir].getAttributeCache()
+
+  # Whether an image is still in the index
+  def hasImage(self, image):
+    monitor = self._monitorsByRoot.get(image.rootDir)
+    return monitor != None and monitor.hasImage(image)
+
+  # Remove images from the index
+  def removeImages(self, images):
+    for monitor, rootImages in self._byMonitor(images):
+      monitor.removeImages(rootImages)
+
+  # Add images to a category
+  def addImagesCategory(self, images, category):
+    for monitor, rootImages in self._byMonitor(images):
+      monitor.addImagesCategory(rootImages, category)
+
+  # Remove images from a category
+  def removeImagesCategory(self, images, category):
+    for monitor, rootImages in self._byMonitor(images):
+      monitor.removeImagesCategory(rootImages, category)
+
+  # Remove a category from every root
+  def removeCategory(self, category):
+    for monitor in self._monitors:
+      monitor.removeCategory(category)
+
+  # Apply a finished FileOperation to the index in one batch per root
+  # Deleted, trashed and moved images are removed, and images moved or copied into a root are indexed
+  # there with moved images keeping their categories
+  # Does disk io, call from a background thread. Returns (removed, added) lists of images
+  def applyFileOperation(self, operation):
+    removed = []
+    added = []
+    
+    # moves within a root are picked up by rescanning the folders on both sides, which keeps their
+    # categories and cached values, moves to another root only keep their categories
+    rescan = {}
+    withinRoot = set()
+    toOtherRoot = {}
+    for image, newPath in operation.completed:
+      if newPath == None:
+        continue
+      monitor, fromRootDir = self._findRoot(newPath)
+      if monitor == None:
+        continue
+      rescan.setdefault(monitor, set()).add(Path(fromRootDir).parent)
+      if operation.kind == 'move':
+        if monitor.getRootDir() == image.rootDir:
+          withinRoot.add(image)
+          rescan[monitor].add(Path(image.fromRootDir).parent)
+        else:
+          toOtherRoot.setdefault(monitor, []).append((image, fromRootDir))
+    
+    if operation.kind != 'copy':
+      removed = [ image for image, _ in operation.completed if image not in withinRoot and self.hasImage(image) ]
+      self.removeImages(removed)
+    
+    for monitor, relDirs in rescan.items():
+      rootAdded, rootRemoved, _ = monitor.refreshDirs(relDirs)
+      added.extend(rootAdded)
+      removed.extend(rootRemoved)
+    
+    for monitor, moved in toOtherRoot.items():
+      # category -> new images, so each category is added in one go
+      categories = {}
+      for image, fromRootDir in moved:
+        newImage = monitor.getImage(fromRootDir)
+        if newImage != None:
+          for category in image.categories:
+            categories.setdefault(category, []).append(newImage)
+      for category, newImages in categories.items():
+        monitor.addImagesCategory(newImages, category)
+    return removed, added
+
+  # Rename a category in every root, returns whether it was renamed
+  # Roots won't rename a category to one they already have, so it's refused everywhere if any root has
+  # newName rather than leaving both names in the merged list
+  def renameCategory(self, category, newName):
+    if newName in self.getCategories():
+      print(f'not renaming category {category}, {newName} already exists')
+      return False
+    for monitor in self._monitors:
+      monitor.renameCategory(category, newName)
+    return True
+
+  # Refresh one root for refreshAsync
+  def _refreshRoot(self, monitor, onRefreshed, full, onProgress):
+    try:
+      onLoaded = None
+      onBatch = None
+      if onProgress != None:
+        onLoaded = lambda images: onProgress(monitor, images, [], None)
+        onBatch = lambda added, removed, dirsScanned: onProgress(monitor, added, removed, dirsScanned)
+      monitor.load(onLoaded)
+      added, removed = monitor.refresh(full, onBatch)
+    except Exception:
+      type, value, traceback = sys.exc_info()
+      print(f'got exception refreshing {str(monitor.getRootDir())}: {value}')
+      added, removed = [], []
+    onRefreshed(monitor, added, removed)
+    # build the search index now rather than on the first search
+    monitor.buildNameIndex()
+
+  # Rescan directories of one root for refreshDirsAsync
+  def _refreshDirs(self, monitor, relDirs, onRefreshed):
+    try:
+      if relDirs == None:
+        added, removed = monitor.refresh()
+        changed = []
+      else:
+        added, removed, changed = monitor.refreshDirs(relDirs)
+    except Exception:
+      type, value, traceback = sys.exc_info()
+      print(f'got exception rescanning {str(monitor.getRootDir())}: {value}')
+      added, removed, changed = [], [], []
+    onRefreshed(added, removed, changed)
+
+  # Find the root a path is in, returns (monitor, fromRootDir) or (None, None)
+  def _findRoot(self, path):
+    path = Path(path).resolve()
+    for monitor in self._monitors:
+      try:
+        return monitor, str(path.relative_to(monitor.getRootDir().resolve()))
+      except ValueError:
+        pass
+    return None, None
+
+  # Group images by the monitor for their root
+  def _byMonitor(self, images):
+    groups = {}
+    for image in images:
+      monitor = self._monitorsByRoot.get(image.rootDir)
+      if monitor != None:
+        groups.setdefault(monitor, []).append(image)
+    return groups.items()
\ No newline at end of file
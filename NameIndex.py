@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+import os
+from array import array
+
+# Marks the start and end of a name so names and queries shorter than a trigram still have trigrams
+_boundary = '\0'
+
+# Case insensitive substring search over image keys (fromRootDir paths) using trigram posting lists
+# File names are indexed by their trigrams, with a posting list of slots per trigram, and directories
+# (far fewer than files) by theirs, with the keys in each directory. A query is matched against the
+# name, the directory, or a directory suffix and name prefix when it contains a path separator,
+# so only the keys in the shortest posting list involved are ever checked.
+# Slots of removed keys are left in the posting lists and skipped until there are enough to compact.
+class NameIndex:
+  def __init__(self):
+    # key -> slot, slot -> (key, lowercase directory, lowercase name) or None once removed
+    self._slots = {}
+    self._entries = []
+    self._removed = 0
+
+    # name trigram -> array of slots
+    self._namePostings = {}
+
+    # lowercase directory -> set of slots, and directory trigram -> set of directories
+    self._dirs = {}
+    self._dirPostings = {}
+
+  # The number of keys indexed
+  def __len__(self):
+    return len(self._slots)
+
+  # Add a key
+  def add(self, key):
+    if key in self._slots:
+      return
+    dir, name = os.path.split(key.lower())
+    slot = len(self._entries)
+    self._slots[key] = slot
+    self._entries.append((key, dir, name))
+    namePostings = self._namePostings
+    for trigram in _trigrams(name):
+      try:
+        namePostings[trigram].append(slot)
+      except KeyError:
+        namePostings[trigram] = array('I', (slot,))
+    dirSlots = self._dirs.get(dir)
+    if dirSlots == None:
+      dirSlots = self._dirs[dir] = set()
+      for trigram in _trigrams(dir):
+        self._dirPostings.setdefault(trigram, set()).add(dir)
+    dirSlots.add(slot)
+
+  # Remove a key
+  def remove(self, key):
+    slot = self._slots.pop(key, None)
+    if slot == None:
+      return
+    _, dir, _ = self._entries[slot]
+    self._entries[slot] = None
+    self._removed += 1
+    dirSlots = self._dirs[dir]
+    dirSlots.discard(slot)
+    if len(dirSlots) == 0:
+      del self._dirs[dir]
+      for trigram in _trigrams(dir):
+        dirs = self._dirPostings[trigram]
+        dirs.discard(dir)
+        if len(dirs) == 0:
+          del self._dirPostings[trigram]
+    # once most of the posting lists are removed slots, build them again from what's left
+    if self._removed > 1024 and self._removed > len(self._slots):
+      self._compact()
+
+  # Get the keys whose path from the root contains text, ignoring case
+  # / and \ both match the os path separator
+  def search(self, text):
+    text = text.lower().replace('/', os.sep).replace('\\', os.sep)
+    if text == '':
+      return [ key for key in self._slots ]
+    slots = set()
+
+    # in the directory, every key in the matching directories
+    for dir in self._matchingDirs(text, False):
+      slots.update(self._dirs[dir])
+
+    if os.sep not in text:
+      # in the name
+      for slot in self._nameCandidates(text):
+        entry = self._entries[slot]
+        if entry != None and text in entry[2]:
+          slots.add(slot)
+    else:
+      # the end of the directory and the start of the name, split at the last separator
+      # checking whichever of the names in those directories or the names starting that way there are fewer of
+      dirPart, namePart = text.rsplit(os.sep, 1)
+      dirs = self._matchingDirs(dirPart, True)
+      inDirs = sum(len(self._dirs[dir]) for dir in dirs)
+      candidates = self._nameCandidates(_boundary + namePart) if namePart != '' else None
+      if candidates != None and len(candidates) < inDirs:
+        dirs = set(dirs)
+        for slot in candidates:
+          entry = self._entries[slot]
+          if entry != None and entry[1] in dirs and entry[2].startswith(namePart):
+            slots.add(slot)
+      else:
+        for dir in dirs:
+          for slot in self._dirs[dir]:
+            if self._entries[slot][2].startswith(namePart):
+              slots.add(slot)
+    return [ self._entries[slot][0] for slot in sorted(slots) ]
+
+  # Slots whose names might contain text, from the shortest posting list of its trigrams
+  # text can start with the boundary marker to only match the start of names
+  def _nameCandidates(self, text):
+    if len(text) >= 3:
+      postings = [ self._namePostings.get(trigram) for trigram in _trigrams(text, False) ]
+      if any(posting == None for posting in postings):
+        return []
+      return min(postings, key=len)
+    # shorter than a trigram, every trigram containing it
+    slots = set()
+    for trigram, posting in self._namePostings.items():
+      if text in trigram:
+        slots.update(posting)
+    return slots
+
+  # Directories containing text, or ending with it if suffix is set ('' matches every directory but the root then)
+  def _matchingDirs(self, text, suffix):
+    if suffix:
+      if text == '':
+        return [ dir for dir in self._dirs if dir != '' ]
+      text += _boundary
+    candidates = self._dirs.keys()
+    if len(text) >= 3:
+      for trigram in _trigrams(text, False):
+        dirs = self._dirPostings.get(trigram)
+        if dirs == None:
+          return []
+        if len(dirs) < len(candidates):
+          candidates = dirs
+    return [ dir for dir in candidates if text in dir + _boundary ]
+
+  # Rebuild the posting lists without the removed slots
+  def _compact(self):
+    keys = list(self._slots)
+    self.__init__()
+    for key in keys:
+      self.add(key)
+
+# The trigrams of a string, with boundary markers at each end if pad is set
+def _trigrams(text, pad=True):
+  if pad:
+    text = _boundary + text + _boundary
+  return { text[i:i+3] for i in range(len(text) - 2) }
\ No newline at end of file
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from PyQt5.QtCore import pyqtSignal
+from PyQt5.QtWidgets import ( QWidget, QHBoxLayout, QLabel, QComboBox, QCheckBox, QLineEdit )
+
+# Controls for sorting and range filtering the image list by metadata
+class SortFilterBar(QWidget):
+  # Signal triggered when the sort order changes (order or None, descending)
+  onSortChanged = pyqtSignal(object, bool)
+
+  # Signal triggered when the filter changes (order or None, low or None, high or None)
+  onFilterChanged = pyqtSignal(object, object, object)
+
+  # Sort orders as (label, MetadataIndex order)
+  _sortOrders = [ ('Unsorted', None), ('Name', 'name'), ('Date', 'date'), ('Size', 'size'), ('Resolution', 'resolution') ]
+
+  # Filters as (label, MetadataIndex order, placeholder, function parsing a bound and whether it's the upper one)
+  _filters = [
+    ('No filter', None, '', None),
+    ('Date', 'date', 'YYYY-MM-DD', lambda text, upper: time.mktime(time.strptime(text, '%Y-%m-%d')) + (86399 if upper else 0)),
+    ('Size', 'size', 'MB', lambda text, upper: float(text) * 1024 * 1024),
+    ('Resolution', 'resolution', 'megapixels', lambda text, upper: float(text) * 1000000),
+  ]
+
+  def __init__(self):
+    super().__init__()
+
+    layout = QHBoxLayout()
+    layout.setContentsMargins(0, 0, 0, 0)
+    self.setLayout(layout)
+
+    layout.addWidget(QLabel('Sort'))
+    self._sortOrder = QComboBox()
+    self._sortOrder.addItems([ label for label, _ in self._sortOrders ])
+    self._sortOrder.currentIndexChanged.connect(self._sortChanged)
+    layout.addWidget(self._sortOrder)
+
+    self._descending = QCheckBox('Descending')
+    self._descending.toggled.connect(self._sortChanged)
+    layout.addWidget(self._descending)
+
+    layout.addSpacing(16)
+    layout.addWidget(QLabel('Filter'))
+    self._filter = QComboBox()
+    self._filter.addItems([ label for label, _, _, _ in self._filters ])
+    self._filter.currentIndexChanged.connect(self._filterChanged)
+    layout.addWidget(self._filter)
+
+    self._low = QLineEdit()
+    self._low.editingFinished.connect(self._filterChanged)
+    layout.addWidget(self._low)
+    layout.addWidget(QLabel('to'))
+    self._high = QLineEdit()
+    self._high.editingFinished.connect(self._filterChanged)
+    layout.addWidget(self._high)
+    layout.addStretch()
+
+    self._setFilterEnabled(False)
+
+  # Called when the sort order or direction changes
+  def _sortChanged(self, *args):
+    _, order = self._sortOrders[self._sortOrder.currentIndex()]
+    self._descending.setEnabled(order != None)
+    self.onSortChanged.emit(order, self._descending.isChecked())
+
+  # Called when the filter or its range changes
+  def _filterChanged(self, *args):
+    _, order, placeholder, parse = self._filters[self._filter.currentIndex()]
+    self._setFilterEnabled(order != None)
+    self._low.setPlaceholderText(placeholder)
+    self._high.setPlaceholderText(placeholder)
+    if order == None:
+      self.onFilterChanged.emit(None, None, None)
+      return
+    self.onFilterChanged.emit(order, self._parseBound(self._low, parse, False), self._parseBound(self._high, parse, True))
+
+  # Parse a range bound, empty or invalid bounds are open
+  def _parseBound(self, edit, parse, upper):
+    text = edit.text().strip()
+    if text == '':
+      return None
+    try:
+      return parse(text, upper)
+    except (ValueError, OverflowError):
+      return None
+
+  # Enable or disable the range boxes
+  def _setFilterEnabled(self, enabled):
+    self._low.setEnabled(enabled)
+    self._high.setEnabled(enabled)
\ No newline at end of file
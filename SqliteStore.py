@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import sqlite3
+import threading
+
+from JsonStore import JsonStore
+
+_schema = '''
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS images (id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL);
+CREATE TABLE IF NOT EXISTS categories (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL);
+CREATE TABLE IF NOT EXISTS image_categories (
+  image_id INTEGER NOT NULL REFERENCES images(id) ON DELETE CASCADE,
+  category_id INTEGER NOT NULL REFERENCES categories(id) ON DELETE CASCADE,
+  PRIMARY KEY (image_id, category_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS image_categories_category ON image_categories(category_id);
+'''
+
+# Stores the index in an sqlite database in the monitored folder
+# Saves only write the changes since the last save, in one transaction
+class SqliteStore:
+  def __init__(self, rootDir):
+    self._rootDir = rootDir
+    self._lock = threading.Lock()
+
+    # saves happen on the save timer's thread
+    self._db = sqlite3.connect(str(self.databaseFile()), check_same_thread=False)
+    self._db.execute('PRAGMA journal_mode=WAL')
+    self._db.execute('PRAGMA synchronous=NORMAL')
+    self._db.execute('PRAGMA foreign_keys=ON')
+    self._db.executescript(_schema)
+
+    self._migrate()
+
+  # Whether there's an index to load
+  def exists(self):
+    return self.databaseFile().is_file()
+
+  # Load the index, yields (fromRootDir, categories) for each image
+  # Streams rows straight from one query rather than reading and parsing everything up front
+  def load(self):
+    with self._lock:
+      rows = self._db.execute('''
+        SELECT images.path, categories.name FROM images
+        LEFT JOIN image_categories ON image_categories.image_id = images.id
+        LEFT JOIN categories ON categories.id = image_categories.category_id
+        ORDER BY images.id''')
+
+      path = None
+      categories = []
+      for rowPath, category in rows:
+        if rowPath != path:
+          if path != None:
+            yield path, categories
+          path = rowPath
+          categories = []
+        if category != None:
+          categories.append(category)
+      if path != None:
+        yield path, categories
+
+  # The database has its own write-ahead log so changes aren't journaled separately
+  def journal(self, states):
+    pass
+
+  # Start a save, the changes are all it needs so it never wants the images
+  def beginSave(self):
+    return False
+
+  # Save the changes since the last save
+  def save(self, images, changes):
+    if len(changes) == 0:
+      return
+    print(f'saving {len(changes)} changes to {str(self.databaseFile())}')
+    with self._lock:
+      with self._db:
+        self._apply(changes)
+
+  # Close the store
+  def close(self):
+    with self._lock:
+      self._db.close()
+
+  # The database path
+  def databaseFile(self):
+    return self._rootDir / 'config.db'
+
+  # Apply a list of changes as recorded by DirectoryMonitor
+  def _apply(self, changes):
+    db = self._db
+    for change in changes:
+      op = change[0]
+      if op == 'addImage':
+        db.execute('INSERT OR IGNORE INTO images (path) VALUES (?)', (str(change[1]),))
+      elif op == 'removeImage':
+        db.execute('DELETE FROM images WHERE path = ?', (str(change[1]),))
+      elif op == 'addImageCategory':
+        path, category = str(change[1]), change[2]
+        db.execute('INSERT OR IGNORE INTO images (path) VALUES (?)', (path,))
+        db.execute('INSERT OR IGNORE INTO categories (name) VALUES (?)', (category,))
+        db.execute('''
+          INSERT OR IGNORE INTO image_categories (image_id, category_id)
+          SELECT images.id, categories.id FROM images, categories
+          WHERE images.path = ? AND categories.name = ?''', (path, category))
+      elif op == 'removeImageCategory':
+        db.execute('''
+          DELETE FROM image_categories
+          WHERE image_id = (SELECT id FROM images WHERE path = ?)
+            AND category_id = (SELECT id FROM categories WHERE name = ?)''', (str(change[1]), change[2]))
+      elif op == 'renameCategory':
+        # the new name might already exist as an empty category, so merge rather than rename
+        old, new = change[1], change[2]
+        db.execute('INSERT OR IGNORE INTO categories (name) VALUES (?)', (new,))
+        db.execute('''
+          INSERT OR IGNORE INTO image_categories (image_id, category_id)
+          SELECT image_id, (SELECT id FROM categories WHERE name = ?) FROM image_categories
+          WHERE category_id = (SELECT id FROM categories WHERE name = ?)''', (new, old))
+        db.execute('DELETE FROM categories WHERE name = ?', (old,))
+      elif op == 'removeCategory':
+        db.execute('DELETE FROM categories WHERE name = ?', (change[1],))
+
+  # Import config.json the first time the database is opened
+  def _migrate(self):
+    with self._db:
+      if self._db.execute("SELECT value FROM meta WHERE key = 'migrated'").fetchone() != None:
+        return
+      self._db.execute("INSERT INTO meta (key, value) VALUES ('migrated', '1')")
+
+      jsonStore = JsonStore(self._rootDir)
+      if not jsonStore.exists():
+        return
+      print(f'migrating {str(jsonStore.configFile())} to {str(self.databaseFile())}')
+      try:
+        for path, categories in jsonStore.load():
+          self._db.execute('INSERT OR IGNORE INTO images (path) VALUES (?)', (path,))
+          for category in categories:
+            self._apply([ ('addImageCategory', path, category) ])
+      except Exception:
+        type, value, traceback = sys.exc_info()
+        print(f'got exception migrating config file: {value}')
+        raise
\ No newline at end of file
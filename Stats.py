@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import threading
+import contextlib
+
+# Timings and counters for the hot paths (refresh, refreshUI, save, icon loading)
+# Off by default so timing a section is only a flag check, it's turned on by the stats dock or
+# by setting IMAGECATEGORISER_TRACE, which also logs every timed section to the file it names
+# (or stderr if it's set to '-')
+#
+#   with Stats.timed('refresh'):
+#     ...
+#   Stats.count('thumbnailPackHit')
+
+_lock = threading.Lock()
+_enabled = False
+
+# name -> [count, total seconds, max seconds, last seconds]
+_timings = {}
+
+# name -> count
+_counters = {}
+
+# trace log file, or None
+_trace = None
+
+# Whether to profile the next timed section, and whether one is being profiled
+_profileNext = False
+_profiling = False
+
+# Turn stats collection on or off
+def enable(on=True):
+  global _enabled
+  _enabled = on
+
+# Whether stats are being collected
+def enabled():
+  return _enabled
+
+# Time a section of code, use as a context manager
+def timed(name):
+  if not _enabled:
+    return _notTimed
+  return _Timed(name)
+
+# Add to a counter
+def count(name, n=1):
+  if _enabled:
+    with _lock:
+      _counters[name] = _counters.get(name, 0) + n
+
+# Get a copy of the stats as { 'timings': { name: {...} }, 'counters': { name: count } }
+def snapshot():
+  with _lock:
+    timings = { name: { 'count': count, 'total': total, 'mean': total / count, 'max': max, 'last': last }
+                for name, (count, total, max, last) in _timings.items() }
+    return { 'timings': timings, 'counters': dict(_counters) }
+
+# Clear the stats
+def reset():
+  with _lock:
+    _timings.clear()
+    _counters.clear()
+
+# Profile the next timed section with cProfile, whichever thread it runs on
+# The profile is saved to the temp directory and the top functions are printed
+# The profiling modules are only imported when they're needed, they're slow to import for the command line
+def profileNext():
+  global _profileNext
+  enable()
+  _profileNext = True
+
+# Times a section, and profiles it if profileNext was called
+class _Timed:
+  __slots__ = ('_name', '_start', '_profile')
+
+  def __init__(self, name):
+    self._name = name
+    self._profile = None
+
+  def __enter__(self):
+    global _profileNext, _profiling
+    if _profileNext:
+      with _lock:
+        if _profileNext and not _profiling:
+          _profileNext = False
+          _profiling = True
+          import cProfile
+          self._profile = cProfile.Profile()
+      if self._profile != None:
+        self._profile.enable()
+    self._start = time.perf_counter()
+    return self
+
+  def __exit__(self, *exc):
+    elapsed = time.perf_counter() - self._start
+    if self._profile != None:
+      self._profile.disable()
+      _saveProfile(self._name, self._profile)
+    _record(self._name, elapsed)
+    return False
+
+_notTimed = contextlib.nullcontext()
+
+# Record a timing and trace it
+def _record(name, elapsed):
+  with _lock:
+    timing = _timings.get(name)
+    if timing == None:
+      _timings[name] = [ 1, elapsed, elapsed, elapsed ]
+    else:
+      timing[0] += 1
+      timing[1] += elapsed
+      timing[2] = max(timing[2], elapsed)
+      timing[3] = elapsed
+    if _trace != None:
+      _trace.write(f'{time.time():.3f} {threading.current_thread().name} {name} {elapsed*1000:.2f}ms\n')
+      _trace.flush()
+
+# Save a finished profile and print its top functions
+def _saveProfile(name, profile):
+  global _profiling
+  import io
+  import pstats
+  import tempfile
+  path = os.path.join(tempfile.gettempdir(), f'ImageCategoriser-{name}-{time.strftime("%Y%m%d-%H%M%S")}.prof')
+  profile.dump_stats(path)
+  out = io.StringIO()
+  pstats.Stats(profile, stream=out).sort_stats('cumulative').print_stats(20)
+  print(f'profile of {name} saved to {path}')
+  print(out.getvalue())
+  with _lock:
+    _profiling = False
+
+# Start tracing if asked to by the environment
+def _initTrace():
+  global _trace
+  path = os.environ.get('IMAGECATEGORISER_TRACE')
+  if path:
+    _trace = sys.stderr if path == '-' else open(path, 'a')
+    enable()
+
+_initTrace()
\ No newline at end of file
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+from PyQt5 import QtCore
+from PyQt5.QtGui import QFontDatabase
+from PyQt5.QtWidgets import ( QDockWidget, QWidget, QVBoxLayout, QHBoxLayout, QPlainTextEdit
+                            , QPushButton )
+
+import Stats
+
+# A dock showing the timings and counters collected by Stats, updated every second while it's shown
+# Stats are only collected while the dock is open (or tracing is on)
+class StatsDock(QDockWidget):
+  # getGauges() returns a dict of extra values to show, e.g. queue depths
+  def __init__(self, getGauges):
+    super().__init__('Stats')
+    self._getGauges = getGauges
+
+    wid = QWidget(self)
+    layout = QVBoxLayout()
+    wid.setLayout(layout)
+    self.setWidget(wid)
+
+    self._text = QPlainTextEdit()
+    self._text.setReadOnly(True)
+    self._text.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+    layout.addWidget(self._text)
+
+    buttons = QHBoxLayout()
+    layout.addLayout(buttons)
+
+    resetButton = QPushButton('Reset')
+    resetButton.clicked.connect(self._reset)
+    buttons.addWidget(resetButton)
+
+    # the next refresh, save, icon load etc is profiled and the profile printed
+    profileButton = QPushButton('Profile next action')
+    profileButton.clicked.connect(Stats.profileNext)
+    buttons.addWidget(profileButton)
+
+    self._updateTimer = QtCore.QTimer(self)
+    self._updateTimer.timeout.connect(self._update)
+    self.visibilityChanged.connect(self._visibilityChanged)
+
+  # Collect stats while the dock is shown
+  def _visibilityChanged(self, visible):
+    if visible:
+      Stats.enable()
+      self._update()
+      self._updateTimer.start(1000)
+    else:
+      self._updateTimer.stop()
+
+  # Clear the stats
+  def _reset(self):
+    Stats.reset()
+    self._update()
+
+  # Show the current stats
+  def _update(self):
+    stats = Stats.snapshot()
+    lines = [ f'{"timing":<16}{"count":>8}{"mean ms":>10}{"max ms":>10}{"last ms":>10}{"total s":>10}' ]
+    for name, timing in sorted(stats['timings'].items()):
+      lines.append(f'{name:<16}{timing["count"]:>8}{timing["mean"]*1000:>10.2f}{timing["max"]*1000:>10.2f}'
+                   f'{timing["last"]*1000:>10.2f}{timing["total"]:>10.2f}')
+    lines.append('')
+    for name, value in sorted(stats['counters'].items()):
+      lines.append(f'{name:<32}{value:>12}')
+    lines.append('')
+    for name, value in self._getGauges().items():
+      lines.append(f'{name:<32}{value:>12}')
+    self._text.setPlainText('\n'.join(lines))
\ No newline at end of file
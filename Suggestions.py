@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+import CachedValues
+
+# numpy is optional, suggestions are only available if it's installed
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+# The attribute cache kind feature vectors are stored under
+_featureKind = 'features'
+
+# Number of files decoded per task sent to a worker process
+_chunkSize = 256
+
+# Images are decoded at this size for their features
+_sampleSize = 32
+
+# Feature vector layout: a 4x4x4 rgb colour histogram and an 8x8 grayscale signature
+_histogramBins = 4
+_signatureSize = 8
+_featureSize = _histogramBins ** 3 + _signatureSize ** 2
+
+# Similarity entries computed per block of the nearest neighbour search, bounds its memory
+_blockEntries = 16 * 1024 * 1024
+
+# Whether suggestions are available
+def available():
+  return np != None
+
+# Suggest categories for uncategorised images from the categories of the tagged images most like them
+# Every image gets a feature vector (cached in getCache(image), the AttributeCache for its root), each
+# uncategorised image's k nearest tagged images vote for their categories weighted by similarity, and
+# the winning category is suggested if it got at least minShare of the votes
+# Returns category -> [ images ], most confident first
+def suggestCategories(images, getCache, k=10, minShare=0.6):
+  tagged = [ image for image in images if image.isCategorised() ]
+  untagged = [ image for image in images if not image.isCategorised() ]
+  if len(tagged) == 0 or len(untagged) == 0:
+    return {}
+
+  features = _getFeatures(images, getCache)
+  tagged = [ image for image in tagged if image in features ]
+  untagged = [ image for image in untagged if image in features ]
+  if len(tagged) == 0 or len(untagged) == 0:
+    return {}
+
+  # one column per category, a tagged image votes for each of its categories
+  categories = sorted({ category for image in tagged for category in image.categories })
+  columns = { category: i for i, category in enumerate(categories) }
+  labels = np.zeros((len(tagged), len(categories)), dtype=np.float32)
+  for row, image in enumerate(tagged):
+    for category in image.categories:
+      labels[row, columns[category]] = 1
+
+  references = np.stack([ features[image] for image in tagged ])
+  queries = np.stack([ features[image] for image in untagged ])
+  similarities, neighbours = _nearest(queries, references, min(k, len(tagged)))
+
+  # votes weighted by similarity, clipped so unlike images don't vote against, a block of queries
+  # at a time as each neighbour's categories are looked up
+  weights = np.clip(similarities, 0, None)
+  totals = weights.sum(axis=1)
+  best = np.zeros(len(untagged), dtype=np.int64)
+  shares = np.zeros(len(untagged), dtype=np.float32)
+  rows = max(1, _blockEntries // (neighbours.shape[1] * len(categories)))
+  for first in range(0, len(untagged), rows):
+    block = slice(first, first + rows)
+    votes = np.einsum('qk,qkc->qc', weights[block], labels[neighbours[block]])
+    best[block] = votes.argmax(axis=1)
+    shares[block] = votes.max(axis=1) / np.maximum(totals[block], 1e-6)
+
+  suggestions = {}
+  for i in np.argsort(-shares, kind='stable').tolist():
+    if shares[i] >= minShare:
+      suggestions.setdefault(categories[best[i]], []).append(untagged[i])
+  print(f'suggested categories for {sum(len(group) for group in suggestions.values())} of {len(untagged)} uncategorised images')
+  return suggestions
+
+# Find the k most similar references for each query by cosine similarity (the vectors are unit length)
+# The similarity matrix is computed a block at a time, keeping the best k seen so far for each query
+# Returns (similarities, reference indices), both queries x k with the most similar first
+def _nearest(queries, references, k):
+  rows = max(1, min(len(queries), _blockEntries // max(len(references), 1)))
+  columns = max(k, min(len(references), _blockEntries // rows))
+  bestSimilarities = np.empty((len(queries), k), dtype=np.float32)
+  bestIndices = np.empty((len(queries), k), dtype=np.int64)
+  for first in range(0, len(queries), rows):
+    block = queries[first:first+rows]
+    blockSimilarities = np.full((len(block), k), -np.inf, dtype=np.float32)
+    blockIndices = np.zeros((len(block), k), dtype=np.int64)
+    for start in range(0, len(references), columns):
+      similarities = block @ references[start:start+columns].T
+      # the best k of these references, merged with the best so far
+      count = similarities.shape[1]
+      best = min(k, count)
+      top = np.argpartition(similarities, count - best, axis=1)[:, count-best:]
+      candidates = np.concatenate((blockSimilarities, np.take_along_axis(similarities, top, axis=1)), axis=1)
+      indices = np.concatenate((blockIndices, top + start), axis=1)
+      top = np.argpartition(candidates, best, axis=1)[:, best:]
+      blockSimilarities = np.take_along_axis(candidates, top, axis=1)
+      blockIndices = np.take_along_axis(indices, top, axis=1)
+    order = np.argsort(-blockSimilarities, axis=1)
+    bestSimilarities[first:first+len(block)] = np.take_along_axis(blockSimilarities, order, axis=1)
+    bestIndices[first:first+len(block)] = np.take_along_axis(blockIndices, order, axis=1)
+  return bestSimilarities, bestIndices
+
+# Get the feature vector of every image, from the cache where it's valid and computed otherwise
+# Returns image -> vector for the images that could be read
+def _getFeatures(images, getCache):
+  isValid = lambda value: len(value) == _featureSize * 2
+  features, _ = CachedValues.getValues(images, getCache, _featureKind, _featureFiles, chunkSize=_chunkSize, isValid=isValid)
+  return { image: np.frombuffer(value, dtype=np.float16).astype(np.float32) for image, value in features.items() }
+
+# Compute the feature vectors of a list of files, runs in a worker process
+# Each file is decoded straight to a small rgb image and the features are computed for the whole chunk at once
+# Returns each vector as float16 bytes, or None if the file couldn't be read
+def _featureFiles(paths):
+  from PyQt5.QtCore import QSize
+  from PyQt5.QtGui import ( QImage, QImageReader )
+
+  size = _sampleSize
+  pixels = np.zeros((len(paths), size, size, 3), dtype=np.uint8)
+  valid = np.zeros(len(paths), dtype=bool)
+  for i, path in enumerate(paths):
+    reader = QImageReader(path)
+    reader.setScaledSize(QSize(size, size))
+    image = reader.read()
+    if image.isNull():
+      continue
+    image = image.convertToFormat(QImage.Format_RGB888)
+    if image.width() != size or image.height() != size:
+      image = image.scaled(size, size)
+    bits = image.constBits()
+    bits.setsize(image.bytesPerLine() * size)
+    pixels[i] = np.frombuffer(bits, dtype=np.uint8).reshape(size, image.bytesPerLine())[:, :size*3].reshape(size, size, 3)
+    valid[i] = True
+
+  features = _features(pixels)
+  return [ features[i].tobytes() if ok else None for i, ok in enumerate(valid.tolist()) ]
+
+# Compute feature vectors from images x size x size x rgb pixels, returns them as float16 rows
+def _features(pixels):
+  count, size = pixels.shape[0], pixels.shape[1]
+
+  # colour histogram, square rooted so cosine similarity compares them like the hellinger distance
+  bins = _histogramBins
+  quantised = (pixels // (256 // bins)).astype(np.int64)
+  binIndex = (quantised[..., 0] * bins + quantised[..., 1]) * bins + quantised[..., 2]
+  binIndex = binIndex.reshape(count, -1) + np.arange(count)[:, None] * bins ** 3
+  histograms = np.bincount(binIndex.ravel(), minlength=count * bins ** 3).reshape(count, bins ** 3)
+  histograms = np.sqrt(histograms / float(size * size))
+
+  # grayscale signature, block averages with the mean brightness taken out so it's about layout
+  gray = pixels.astype(np.float32) @ np.array([ 0.299, 0.587, 0.114 ], dtype=np.float32)
+  step = size // _signatureSize
+  signatures = gray.reshape(count, _signatureSize, step, _signatureSize, step).mean(axis=(2, 4)).reshape(count, -1)
+  signatures -= signatures.mean(axis=1, keepdims=True)
+
+  # both halves unit length, then the whole vector
+  features = np.concatenate((_normalise(histograms), _normalise(signatures)), axis=1)
+  return _normalise(features).astype(np.float16)
+
+# Scale the rows of a matrix to unit length, leaving zero rows alone
+def _normalise(rows):
+  norms = np.linalg.norm(rows, axis=1, keepdims=True)
+  return rows / np.maximum(norms, 1e-6)
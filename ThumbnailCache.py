@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import mmap
+import struct
+import hashlib
+import threading
+from pathlib import Path
+
+# Record header: magic, data length, source file size, source file mtime (ns), thumbnail size, path length
+# followed by the utf-8 path and then the encoded thumbnail
+# Move records have the new path as their path and the old path as their data
+_header = struct.Struct('<4sIqqIH')
+_magic = b'THMB'
+_moveMagic = b'MOVE'
+
+# A persistent thumbnail store
+# Thumbnails are appended to a single pack file which is memory mapped for reading. Each entry is
+# keyed by the image's absolute path and is only valid while the file's size and mtime and the
+# thumbnail size match. Replaced entries are left behind as garbage until the pack is compacted.
+class ThumbnailCache:
+  def __init__(self, rootDir, thumbSize, maxBytes=1024*1024*1024):
+    self._thumbSize = thumbSize
+    self._maxBytes = maxBytes
+    self._lock = threading.Lock()
+
+    # path -> (data offset, data length, file size, file mtime)
+    self._entries = {}
+    self._liveBytes = 0
+
+    # one pack per monitored folder and thumbnail size
+    rootHash = hashlib.sha1(str(Path(rootDir).resolve()).encode('utf-8')).hexdigest()[:16]
+    self._packPath = ThumbnailCache.cacheDir() / f'{rootHash}-{thumbSize}.pack'
+    self._packPath.parent.mkdir(parents=True, exist_ok=True)
+
+    self._file = None
+    self._map = None
+    self._mapSize = 0
+    self._open()
+
+    # clean up after the last session if it left a lot of garbage behind
+    self.compact()
+
+  # The directory thumbnail packs are stored in
+  @staticmethod
+  def cacheDir():
+    if sys.platform == 'win32' and 'LOCALAPPDATA' in os.environ:
+      return Path(os.environ['LOCALAPPDATA']) / 'ImageCategoriser' / 'cache'
+    if 'XDG_CACHE_HOME' in os.environ:
+      return Path(os.environ['XDG_CACHE_HOME']) / 'ImageCategoriser'
+    return Path.home() / '.cache' / 'ImageCategoriser'
+
+  # Get the encoded thumbnail for a file as a memoryview into the pack, or None if it isn't
+  # cached or the file's size or mtime have changed since it was
+  def get(self, path, size, mtime):
+    with self._lock:
+      entry = self._entries.get(str(path))
+      if entry == None:
+        return None
+      offset, length, entrySize, entryMtime = entry
+      if entrySize != size or entryMtime != mtime:
+        return None
+      if offset + length > self._mapSize:
+        self._remap()
+      return memoryview(self._map)[offset:offset+length]
+
+  # Store the encoded thumbnail for a file
+  # Compacts the pack straight away if this takes it over the size cap, so it can't grow without
+  # limit in a long session
+  def put(self, path, size, mtime, data):
+    pathBytes = str(path).encode('utf-8')
+    with self._lock:
+      self._file.seek(0, os.SEEK_END)
+      offset = self._file.tell() + _header.size + len(pathBytes)
+      self._file.write(_header.pack(_magic, len(data), size, mtime, self._thumbSize, len(pathBytes)))
+      self._file.write(pathBytes)
+      self._file.write(data)
+      self._file.flush()
+      self._setEntry(str(path), (offset, len(data), size, mtime))
+      overCap = self._liveBytes > self._maxBytes
+    if overCap:
+      self.compact()
+
+  # Move thumbnails to the new paths of files that have been moved or renamed, pairs are (old path, new path)
+  def rename(self, pairs):
+    with self._lock:
+      self._file.seek(0, os.SEEK_END)
+      for old, new in pairs:
+        entry = self._entries.get(str(old))
+        if entry == None:
+          continue
+        oldBytes = str(old).encode('utf-8')
+        newBytes = str(new).encode('utf-8')
+        self._file.write(_header.pack(_moveMagic, len(oldBytes), entry[2], entry[3], self._thumbSize, len(newBytes)))
+        self._file.write(newBytes)
+        self._file.write(oldBytes)
+        self._setEntry(str(old), None)
+        self._setEntry(str(new), entry)
+      self._file.flush()
+
+  # Forget the thumbnail for a file
+  def remove(self, path):
+    with self._lock:
+      self._setEntry(str(path), None)
+
+  # Rewrite the pack with only live entries if it's mostly garbage or over the size cap,
+  # dropping the oldest entries until it's back under the cap
+  def compact(self, force=False):
+    with self._lock:
+      fileSize = self._packPath.stat().st_size
+      garbage = fileSize - self._liveBytes
+      overCap = self._liveBytes > self._maxBytes
+      if not force and not overCap and (garbage < 16*1024*1024 or garbage < fileSize // 2):
+        return
+
+      # oldest entries first, keep the newest that fit in 80% of the cap
+      entries = sorted(self._entries.items(), key=lambda e: e[1][0])
+      budget = self._maxBytes * 8 // 10 if overCap else self._maxBytes
+      kept = 0
+      first = len(entries)
+      while first > 0 and kept + entries[first-1][1][1] <= budget:
+        first -= 1
+        kept += entries[first][1][1]
+      entries = entries[first:]
+
+      print(f'compacting thumbnail cache {str(self._packPath)}, keeping {len(entries)} thumbnails')
+      if self._mapSize < fileSize:
+        self._remap()
+      tmpPath = self._packPath.with_suffix('.tmp')
+      newEntries = {}
+      with open(str(tmpPath), 'wb') as f:
+        for path, (offset, length, size, mtime) in entries:
+          pathBytes = path.encode('utf-8')
+          f.write(_header.pack(_magic, length, size, mtime, self._thumbSize, len(pathBytes)))
+          f.write(pathBytes)
+          newEntries[path] = (f.tell(), length, size, mtime)
+          f.write(self._map[offset:offset+length])
+
+      self._close()
+      os.replace(str(tmpPath), str(self._packPath))
+      self._entries = newEntries
+      self._liveBytes = kept
+      self._file = open(str(self._packPath), 'r+b')
+      self._remap()
+
+  # Close the pack
+  def close(self):
+    with self._lock:
+      self._close()
+
+  # Open the pack and read the index from the record headers
+  def _open(self):
+    if not self._packPath.exists():
+      self._packPath.touch()
+    self._file = open(str(self._packPath), 'r+b')
+    self._remap()
+
+    offset = 0
+    while offset + _header.size <= self._mapSize:
+      magic, length, size, mtime, thumbSize, pathLength = _header.unpack_from(self._map, offset)
+      dataOffset = offset + _header.size + pathLength
+      if (magic != _magic and magic != _moveMagic) or dataOffset + length > self._mapSize:
+        break
+      if thumbSize == self._thumbSize:
+        path = bytes(self._map[offset+_header.size:dataOffset]).decode('utf-8')
+        if magic == _magic:
+          self._setEntry(path, (dataOffset, length, size, mtime))
+        else:
+          oldPath = bytes(self._map[dataOffset:dataOffset+length]).decode('utf-8')
+          entry = self._entries.get(oldPath)
+          if entry != None:
+            self._setEntry(oldPath, None)
+            self._setEntry(path, entry)
+      offset = dataOffset + length
+
+    # drop a partially written record at the end, e.g. from a crash
+    if offset < self._mapSize:
+      print(f'truncating thumbnail cache {str(self._packPath)} at {offset} bytes')
+      self._close()
+      with open(str(self._packPath), 'r+b') as f:
+        f.truncate(offset)
+      self._file = open(str(self._packPath), 'r+b')
+      self._remap()
+
+  # Map the whole pack, views handed out by get keep the old map alive until they're released
+  def _remap(self):
+    self._mapSize = os.fstat(self._file.fileno()).st_size
+    self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self._mapSize > 0 else b''
+
+  # Close the map and file
+  def _close(self):
+    if isinstance(self._map, mmap.mmap):
+      try:
+        self._map.close()
+      except BufferError:
+        # still referenced by a view, it'll be closed when that's released
+        pass
+    self._map = b''
+    self._mapSize = 0
+    if self._file != None:
+      self._file.close()
+      self._file = None
+
+  # Set or clear an entry, keeping the live byte count up to date
+  def _setEntry(self, path, entry):
+    old = self._entries.pop(path, None)
+    if old != None:
+      self._liveBytes -= old[1]
+    if entry != None:
+      self._entries[path] = entry
+      self._liveBytes += entry[1]
\ No newline at end of file
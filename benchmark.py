@@ -0,0 +1,276 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Benchmarks for the index, scanning and thumbnail hot paths
+# Generates synthetic folders (stub jpegs with random categories, seeded so every run gets the
+# same trees) and times DirectoryMonitor operations on them with each storage backend, then
+# times thumbnail loading through ImageList's icon pipeline with offscreen Qt.
+# Results are written as json so runs can be compared, e.g.
+#
+#   python benchmark.py --sizes 10000 100000 --output before.json
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import argparse
+import tempfile
+import contextlib
+import statistics
+from pathlib import Path
+
+from DirectoryMonitor import DirectoryMonitor
+import CategoryQuery
+
+# Seed for generated trees
+_seed = 1234
+
+# Shape of the generated trees
+_filesPerDir = 500
+_dirsPerDir = 100
+_categoryCount = 50
+
+def main(argv):
+  parser = argparse.ArgumentParser(description='Benchmark ImageCategoriser')
+  parser.add_argument('--sizes', type=int, nargs='+', default=[ 10000, 100000, 1000000 ], help='number of files in each generated tree')
+  parser.add_argument('--storage', nargs='+', choices=[ 'json', 'sqlite' ], default=[ 'json', 'sqlite' ])
+  parser.add_argument('--repeat', type=int, default=3, help='times to repeat each measurement')
+  parser.add_argument('--thumbnails', type=int, default=200, help='number of images for the thumbnail benchmark, 0 to skip it')
+  parser.add_argument('--dir', default=os.path.join(tempfile.gettempdir(), 'ImageCategoriserBenchmark'), help='where to generate trees, they\'re reused between runs')
+  parser.add_argument('--output', default='benchmark.json')
+  args = parser.parse_args(argv)
+
+  benchDir = Path(args.dir)
+  results = []
+  for size in args.sizes:
+    root = _generateTree(benchDir / f'tree-{size}', size)
+    for storage in args.storage:
+      print(f'benchmarking {size} files with {storage} storage')
+      results.extend(_benchmarkIndex(root, size, storage, args.repeat))
+
+  thumbnails = None
+  if args.thumbnails > 0:
+    thumbnails = _benchmarkThumbnails(benchDir / 'thumbnails', args.thumbnails, args.repeat)
+
+  output = {
+    'meta': {
+      'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+      'python': platform.python_version(),
+      'platform': platform.platform(),
+      'cpus': os.cpu_count(),
+      'seed': _seed,
+      'repeat': args.repeat,
+    },
+    'index': results,
+    'thumbnails': thumbnails,
+  }
+  with open(args.output, 'w') as f:
+    json.dump(output, f, indent=1)
+  print(f'wrote results to {args.output}')
+  return 0
+
+# Time the index operations on a tree with a storage backend
+def _benchmarkIndex(root, size, storage, repeat):
+  results = []
+  def record(name, runs, **extra):
+    results.append(dict({ 'name': name, 'files': size, 'storage': storage }, **_summarise(runs), **extra))
+    label = ' '.join([ name ] + [ str(value) for value in extra.values() ])
+    print(f'  {label}: {statistics.median(runs)*1000:.1f}ms')
+
+  _resetIndex(root, size, storage)
+
+  runs = []
+  for _ in range(repeat):
+    with _quiet():
+      start = time.perf_counter()
+      monitor = DirectoryMonitor(root, storage)
+      runs.append(time.perf_counter() - start)
+      monitor.close()
+  record('load', runs)
+
+  # a cold refresh sniffs and identifies every file and stores what it found in the attribute cache,
+  # so each one starts from a fresh index without one
+  coldRuns = []
+  incrementalRuns = []
+  for _ in range(repeat):
+    _resetIndex(root, size, storage)
+    with _quiet():
+      monitor = DirectoryMonitor(root, storage)
+      coldRuns.append(_time(monitor.refresh))
+      incrementalRuns.append(_time(monitor.refresh))
+      monitor.close()
+  record('refresh', coldRuns, scan='cold')
+  record('refresh', incrementalRuns, scan='incremental')
+
+  with _quiet():
+    monitor = DirectoryMonitor(root, storage)
+  for category in [ 'All', 'Uncategorised', 'c0' ]:
+    record('getCategory', [ _time(monitor.getCategory, category) for _ in range(repeat) ], category=category)
+  record('getCategoryCount', [ _time(monitor.getCategoryCount, 'c0') for _ in range(repeat) ], category='c0')
+
+  query = CategoryQuery.parse('c0 and c1 and not c2')
+  record('query', [ _time(monitor.query, query) for _ in range(repeat) ], query='c0 and c1 and not c2')
+
+  runs = []
+  with _quiet():
+    for i in range(repeat):
+      runs.append(_time(monitor.renameCategory, 'c3', 'renamed'))
+      monitor.renameCategory('renamed', 'c3')
+  record('renameCategory', runs)
+
+  saveRuns = []
+  runs = []
+  with _quiet():
+    for i in range(repeat):
+      runs.append(_time(monitor.removeCategory, f'c{4+i}'))
+      saveRuns.append(_time(monitor.save))
+  record('removeCategory', runs)
+  record('save', saveRuns)
+
+  with _quiet():
+    monitor.close()
+  return results
+
+# Time thumbnail loading through the icon pipeline, cold (decoding) and warm (from the thumbnail pack)
+def _benchmarkThumbnails(dir, count, repeat):
+  os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+  try:
+    from PyQt5.QtWidgets import QApplication
+  except ImportError:
+    print('PyQt5 isn\'t installed, skipping thumbnail benchmark')
+    return None
+
+  # keep the benchmark's thumbnail packs out of the real cache
+  cacheDir = dir.parent / 'cache'
+  os.environ['XDG_CACHE_HOME'] = str(cacheDir)
+  os.environ['LOCALAPPDATA'] = str(cacheDir)
+
+  app = QApplication.instance() or QApplication([ sys.argv[0] ])
+  from ImageList import ImageList
+
+  _generateImages(dir, count)
+  with _quiet():
+    monitor = DirectoryMonitor(dir)
+    monitor.refresh()
+  images = monitor.getCategory('All')
+
+  print(f'benchmarking thumbnails for {len(images)} images')
+  coldRuns = []
+  warmRuns = []
+  for _ in range(repeat):
+    shutil.rmtree(str(cacheDir), ignore_errors=True)
+    coldRuns.append(_loadIcons(app, ImageList, images))
+    warmRuns.append(_loadIcons(app, ImageList, images))
+  monitor.close()
+
+  results = []
+  for name, runs in [ ('cold', coldRuns), ('warm', warmRuns) ]:
+    summary = _summarise(runs)
+    summary['imagesPerSecond'] = len(images) / summary['median']
+    results.append(dict({ 'name': name, 'images': len(images) }, **summary))
+    print(f'  {name}: {summary["imagesPerSecond"]:.0f} images/s')
+  return results
+
+# Ask a new ImageList for every image's icon and wait until they've all been loaded
+def _loadIcons(app, ImageList, images):
+  with _quiet():
+    imageList = ImageList(lambda: [], lambda: 'All')
+    start = time.perf_counter()
+    for image in images:
+      imageList._getIcon(image)
+    while len(imageList._pendingIcons) > 0:
+      app.processEvents()
+      time.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    imageList.exiting()
+  return elapsed
+
+# Generate a tree of image files (just a jpeg header, which is all scanning looks at), reusing it if it's already there
+def _generateTree(root, size):
+  marker = root / 'benchmark.json'
+  if marker.is_file() and json.loads(marker.read_text()) == { 'files': size, 'seed': _seed, 'header': True }:
+    return root
+  print(f'generating {size} files in {str(root)}')
+  shutil.rmtree(str(root), ignore_errors=True)
+  for i in range(size):
+    path = root / _relativePath(i)
+    if i % _filesPerDir == 0:
+      path.parent.mkdir(parents=True, exist_ok=True)
+    with open(str(path), 'wb') as f:
+      f.write(b'\xff\xd8\xff')
+  marker.write_text(json.dumps({ 'files': size, 'seed': _seed, 'header': True }))
+  return root
+
+# Where the ith generated file goes
+def _relativePath(i):
+  dir = i // _filesPerDir
+  return Path(f'd{dir // _dirsPerDir}', f'd{dir}', f'img{i}.jpg')
+
+# Generated json indexes, number of files -> json text
+_indexes = {}
+
+# Write a fresh json index with random categories, removing any other index files (the store, its
+# journal and the attribute cache) and migrating it for a sqlite store
+def _resetIndex(root, size, storage):
+  for path in root.iterdir():
+    if path.is_file() and path.name.startswith('config'):
+      path.unlink()
+  text = _indexes.get(size)
+  if text == None:
+    rng = random.Random(_seed)
+    images = {}
+    for i in range(size):
+      # about a third are uncategorised
+      count = rng.choice([ 0, 0, 1, 1, 2, 3 ])
+      images[str(_relativePath(i))] = rng.sample([ f'c{c}' for c in range(_categoryCount) ], count)
+    text = _indexes[size] = json.dumps({ 'images': images })
+  with open(str(root / 'config.json'), 'w') as f:
+    f.write(text)
+  # the first open of a sqlite store migrates the json index, that isn't what's being measured
+  if storage == 'sqlite':
+    with _quiet():
+      DirectoryMonitor(root, storage).close()
+
+# Generate some real images to make thumbnails of
+def _generateImages(dir, count):
+  from PyQt5.QtGui import ( QColor, QImage, QPainter )
+
+  marker = dir / 'benchmark.json'
+  if marker.is_file() and json.loads(marker.read_text()) == { 'images': count, 'seed': _seed }:
+    return
+  print(f'generating {count} images in {str(dir)}')
+  shutil.rmtree(str(dir), ignore_errors=True)
+  dir.mkdir(parents=True)
+  rng = random.Random(_seed)
+  for i in range(count):
+    image = QImage(2400, 1600, QImage.Format_RGB32)
+    image.fill(QColor(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    painter = QPainter(image)
+    for _ in range(200):
+      painter.fillRect(rng.randrange(2400), rng.randrange(1600), rng.randrange(400), rng.randrange(400),
+                       QColor(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    painter.end()
+    image.save(str(dir / f'img{i}.jpg'), 'JPG', 90)
+  marker.write_text(json.dumps({ 'images': count, 'seed': _seed }))
+
+# Time a call
+def _time(function, *args):
+  start = time.perf_counter()
+  function(*args)
+  return time.perf_counter() - start
+
+# Summarise timings in seconds
+def _summarise(runs):
+  return { 'min': min(runs), 'median': statistics.median(runs), 'max': max(runs), 'runs': runs }
+
+# Hide the index's logging while timing
+@contextlib.contextmanager
+def _quiet():
+  with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+    yield
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
\ No newline at end of file
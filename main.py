@@ -2,16 +2,33 @@
 # -*- coding: utf-8 -*-
 
 import sys
-from PyQt5.QtWidgets import ( QApplication )
-from MainWindow import MainWindow
 
-# The test directory
-testDirectory = 'C:\\Users\\nano\\Pictures\\art'
+# The directories to monitor
+directories = [ 'C:\\Users\\nano\\Pictures\\art' ]
 
-# Entry, create the main window and then exit when it exits
+# How to store the index, 'json', 'sqlite' or None to use sqlite only if it's already been used
+storage = None
+
+# Glob patterns for files to index or skip, matched against file names and their paths from the folder
+# Only files that look like images from their first few bytes are indexed either way
+include = []
+exclude = []
+
+# Also match files that have been moved or renamed by their contents, e.g. when they're copied
+# to another drive and deleted rather than moved. Each file is read in full once to hash it
+matchContents = False
+
+# Entry, with arguments run the command line interface, otherwise create the main window and
+# then exit when it exits. Qt is only imported for the gui so the command line starts quickly
 if __name__ == '__main__':
+  if len(sys.argv) > 1:
+    import CommandLine
+    sys.exit(CommandLine.main(sys.argv[1:]))
+
+  from PyQt5.QtWidgets import ( QApplication )
+  from MainWindow import MainWindow
   app = QApplication(sys.argv)
-  img = MainWindow(testDirectory)  
+  img = MainWindow(directories, storage, include, exclude, matchContents)
   res = app.exec_()
   img.exiting()
-  sys.exit(res)
\ No newline at end of file
+  sys.exit(res)